@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""Generate the Cloudflare Tunnel Capacity Planning Grafana dashboard JSON.
+
+Usage:
+  python3 gen-cloudflared-capacity.py            # Local deploy (hardcoded datasource UID)
+  python3 gen-cloudflared-capacity.py --export   # Portable export for grafana.com / sharing
+  python3 gen-cloudflared-capacity.py --passes=instant,shared-queries   # Query optimizer passes (see query_ir.py)
+
+Every build also writes cloudflared-capacity-rules.yml. The dashboard reads
+only the series those rules record: 5-minute rollups of the raw cloudflared
+metrics, and hourly peaks of the rollups. Months of them are a few thousand
+points per series, so the 90-day trends and the predict_linear projections
+of when each "When to scale" threshold on the tunnel dashboard will be
+crossed load in about the time the live dashboard takes for 6 hours.
+"""
+import os, sys
+
+import query_ir, row_cache
+
+EXPORT = "--export" in sys.argv
+
+if EXPORT:
+    DS = {"type": "prometheus", "uid": "${DS_PROMETHEUS}"}
+else:
+    DS = {"type": "prometheus", "uid": "prometheus"}
+
+OPEN_ROWS = {"Outlook", "Demand"}  # Rows to keep expanded; all others collapse
+
+# Optimizer passes over the query IR; none run by default
+PASSES, PASS_CTX = query_ir.passes_from_argv(sys.argv)
+
+def q(expr, panel="timeseries", **ctx):
+    """Parse expr into the query IR and run the enabled passes over it."""
+    return query_ir.optimize(query_ir.parse(expr, "promql"), PASSES, {**PASS_CTX, "panel": panel, **ctx})
+
+def row(id, title, y, desc=""):
+    r = {"collapsed": False, "gridPos": {"h": 1, "w": 24, "x": 0, "y": y}, "id": id, "panels": [], "title": title, "type": "row"}
+    if desc: r["description"] = desc
+    return r
+
+def collapse_rows(panels):
+    """Nest child panels inside collapsed rows.
+
+    Grafana only defers queries for panels inside a collapsed row's 'panels'
+    array. Panels that are siblings of a non-collapsed row execute immediately.
+    """
+    result = []
+    current_row = None
+    children = []
+    for p in panels:
+        if p.get("type") == "row":
+            # Flush previous row
+            if current_row is not None:
+                if current_row["title"] not in OPEN_ROWS:
+                    current_row["collapsed"] = True
+                    current_row["panels"] = children
+                    result.append(current_row)
+                else:
+                    result.append(current_row)
+                    result.extend(children)
+            else:
+                result.extend(children)
+            current_row = p
+            children = []
+        else:
+            children.append(p)
+    # Flush last row
+    if current_row is not None:
+        if current_row["title"] not in OPEN_ROWS:
+            current_row["collapsed"] = True
+            current_row["panels"] = children
+            result.append(current_row)
+        else:
+            result.append(current_row)
+            result.extend(children)
+    else:
+        result.extend(children)
+    return result
+
+def stat_panel(id, title, expr, legend, x, y, w=4, unit="short", thresholds=None, decimals=None, desc="", no_value=None):
+    th = thresholds or [{"color": "green", "value": None}]
+    p = {
+        "datasource": DS,
+        "fieldConfig": {"defaults": {"color": {"mode": "thresholds"}, "mappings": [], "thresholds": {"mode": "absolute", "steps": th}, "unit": unit}, "overrides": []},
+        "gridPos": {"h": 4, "w": w, "x": x, "y": y},
+        "id": id,
+        "options": {"colorMode": "value", "graphMode": "none", "justifyMode": "auto", "orientation": "auto", "reduceOptions": {"calcs": ["lastNotNull"], "fields": "", "values": False}, "textMode": "auto"},
+        "title": title,
+        "type": "stat",
+        "targets": [{"datasource": DS, "expr": q(expr, "stat").render(), "legendFormat": legend, "refId": "A"}]
+    }
+    if desc:
+        p["description"] = desc
+    if decimals is not None:
+        p["fieldConfig"]["defaults"]["decimals"] = decimals
+    if no_value is not None:
+        p["fieldConfig"]["defaults"]["noValue"] = no_value
+    return p
+
+def ts_panel(id, title, targets, x, y, w=12, h=8, unit="short", stack=False, overrides=None, fill=10, desc="", legend_calcs=None, threshold=None):
+    calcs = legend_calcs if legend_calcs is not None else ["mean", "max"]
+    steps = [{"color": "green", "value": None}] + ([{"color": "red", "value": threshold}] if threshold is not None else [])
+    return {
+        "datasource": DS,
+        "fieldConfig": {
+            "defaults": {
+                "color": {"mode": "palette-classic"},
+                "custom": {
+                    "axisBorderShow": False, "axisCenteredZero": False, "axisLabel": "", "axisPlacement": "auto",
+                    "barAlignment": 0, "drawStyle": "line", "fillOpacity": fill, "gradientMode": "none",
+                    "hideFrom": {"legend": False, "tooltip": False, "viz": False},
+                    "lineInterpolation": "linear", "lineWidth": 1, "pointSize": 5,
+                    "scaleDistribution": {"type": "linear"}, "showPoints": "never", "spanNulls": False,
+                    "stacking": {"group": "A", "mode": "normal" if stack else "none"},
+                    "thresholdsStyle": {"mode": "off" if threshold is None else "dashed"}
+                },
+                "mappings": [], "thresholds": {"mode": "absolute", "steps": steps},
+                "unit": unit
+            },
+            "overrides": overrides or []
+        },
+        "gridPos": {"h": h, "w": w, "x": x, "y": y},
+        "id": id,
+        **({"description": desc} if desc else {}),
+        "options": {"legend": {"calcs": calcs, "displayMode": "table", "placement": "bottom"}, "tooltip": {"mode": "multi", "sort": "desc"}},
+        "title": title,
+        "type": "timeseries",
+        "targets": targets
+    }
+
+def t(expr, legend, ref="A"):
+    return {"datasource": DS, "expr": q(expr).render(), "legendFormat": legend, "refId": ref}
+
+def color_override(name, color):
+    return {"matcher": {"id": "byName", "options": name}, "properties": [{"id": "color", "value": {"fixedColor": color, "mode": "fixed"}}]}
+
+def dashed(pattern):
+    return {"matcher": {"id": "byRegexp", "options": pattern}, "properties": [{"id": "custom.lineStyle", "value": {"dash": [10, 10], "fill": "dash"}}, {"id": "custom.fillOpacity", "value": 0}]}
+
+PROJECTED = "(?i).*projected.*"  # legends of predict_linear series, whatever $horizon shows
+
+# ---- Recording rules -------------------------------------------------------------
+
+# Only processes that export cloudflared metrics, for the process_* and go_* families every exporter has
+CLOUDFLARED = "and on (job, instance) cloudflared_tunnel_ha_connections"
+
+# 5-minute rollups of the raw metrics, per replica unless the level says job
+RULES_5M = {
+    "instance:cloudflared_tunnel_total_requests:rate5m": "rate(cloudflared_tunnel_total_requests[5m])",
+    "instance:cloudflared_tcp_total_sessions:rate5m": "rate(cloudflared_tcp_total_sessions[5m])",
+    "instance:cloudflared_udp_total_sessions:rate5m": "rate(cloudflared_udp_total_sessions[5m])",
+    "job:cloudflared_tunnel_concurrent_requests:max5m": "max_over_time(sum by (job) (cloudflared_tunnel_concurrent_requests_per_tunnel)[5m:1m])",
+    "instance:process_cpu_seconds:rate5m": f"rate(process_cpu_seconds_total[5m]) {CLOUDFLARED}",
+    "instance:process_resident_memory_bytes:max5m": f"max_over_time(process_resident_memory_bytes[5m]) {CLOUDFLARED}",
+}
+
+# Hourly peaks of the rollups: what the dashboard reads
+RULES_1H = {
+    "job:cloudflared_tunnel_concurrent_requests:max1h": "max_over_time(job:cloudflared_tunnel_concurrent_requests:max5m[1h])",
+    "job:cloudflared_tunnel_total_requests:max1h_rate5m": "max_over_time(sum by (job) (instance:cloudflared_tunnel_total_requests:rate5m)[1h:5m])",
+    "job:cloudflared_tunnel_total_requests:rate1h": "sum by (job) (rate(cloudflared_tunnel_total_requests[1h]))",
+    "job:cloudflared_tcp_total_sessions:max1h_rate5m": "max_over_time(sum by (job) (instance:cloudflared_tcp_total_sessions:rate5m)[1h:5m])",
+    "job:cloudflared_udp_total_sessions:max1h_rate5m": "max_over_time(sum by (job) (instance:cloudflared_udp_total_sessions:rate5m)[1h:5m])",
+    "job:cloudflared_proxy_connect_latency:p95_rate1h": "histogram_quantile(0.95, sum by (job, le) (rate(cloudflared_proxy_connect_latency_bucket[1h])))",
+    "instance:process_cpu_seconds:max1h_rate5m": "max_over_time(instance:process_cpu_seconds:rate5m[1h])",
+    "instance:process_resident_memory_bytes:max1h": "max_over_time(instance:process_resident_memory_bytes:max5m[1h])",
+    "job:process_cpu_seconds:max1h_rate5m": "max by (job) (max_over_time(instance:process_cpu_seconds:rate5m[1h]))",
+    "job:process_resident_memory_bytes:max1h": "max by (job) (max_over_time(instance:process_resident_memory_bytes:max5m[1h]))",
+}
+
+RULE_GROUPS = [("cloudflared-capacity-5m", "1m", RULES_5M), ("cloudflared-capacity-1h", "5m", RULES_1H)]
+
+# ---- Projections -----------------------------------------------------------------
+
+JOB = '{job=~"$job"}'
+
+# Thresholds of the "When to scale" table on the tunnel dashboard's Capacity row
+CONCURRENCY_LIMIT = 50  # concurrent requests across the job
+PORT_LIMIT = 60         # % of $available_ports, the Capacity row's TCP/UDP model
+RESOURCE_LIMIT = 0.8    # share of $cpu_limit / $memory_limit on the busiest replica
+
+def rec(name, scale=""):
+    """A recorded series on the chosen job, optionally scaled (e.g. ' / $available_ports * 100')."""
+    return f"{name}{JOB}{scale}"
+
+def projected(name, scale=""):
+    """Value predict_linear expects $horizon from now, fitted over the last $fit of the hourly series."""
+    return f"predict_linear({name}{JOB}[$fit], $horizon){scale}"
+
+def days_until(name, limit, scale=""):
+    """Days until the linear fit over $fit reaches limit; 0 when already over it, nothing when it is not rising."""
+    fit = f"predict_linear({name}{JOB}[$fit], 0){scale}"
+    slope = f"deriv({name}{JOB}[$fit]){scale}"
+    return f"clamp_min(({limit} - {fit}) / ({slope} > 0), 0) / 86400 or ({fit} > {limit}) * 0"
+
+TCP_PCT = " / $available_ports * 100"
+UDP_PCT = " * $dns_timeout / $available_ports * 100"
+GIB = " / 1073741824"
+DAYS = [{"color": "red", "value": None}, {"color": "yellow", "value": 30}, {"color": "green", "value": 90}]
+
+ROWS = row_cache.RowCache(__file__)
+
+# ============================================================
+# ROW: Outlook
+# ============================================================
+@ROWS.row
+def row_outlook(pid, y):
+    panels = []
+    panels.append(row(pid, "Outlook", y,
+        desc="Days until each \"When to scale\" threshold is crossed if the linear trend over $fit continues. Green beyond 90 days, red within 30.")); pid += 1; y += 1
+
+    for x, title, expr, desc in [
+        (0, f"Concurrency > {CONCURRENCY_LIMIT}", days_until("job:cloudflared_tunnel_concurrent_requests:max1h", CONCURRENCY_LIMIT),
+         f"Days until the hourly peak of concurrent requests across the job passes {CONCURRENCY_LIMIT}, the tunnel dashboard's cue to add a replica."),
+        (4, f"TCP Ports > {PORT_LIMIT}%", days_until("job:cloudflared_tcp_total_sessions:max1h_rate5m", PORT_LIMIT, TCP_PCT),
+         f"Days until the hourly peak of new TCP sessions/s uses {PORT_LIMIT}% of $available_ports (the Capacity row's model). Only WARP/private network tunnels use host ports."),
+        (8, f"UDP Ports > {PORT_LIMIT}%", days_until("job:cloudflared_udp_total_sessions:max1h_rate5m", PORT_LIMIT, UDP_PCT),
+         f"Days until the hourly peak of new UDP sessions/s, each holding a port for $dns_timeout seconds, uses {PORT_LIMIT}% of $available_ports."),
+        (12, f"Replica CPU > {RESOURCE_LIMIT:.0%}", days_until("job:process_cpu_seconds:max1h_rate5m", f"{RESOURCE_LIMIT} * $cpu_limit"),
+         f"Days until the busiest replica's hourly peak CPU reaches {RESOURCE_LIMIT:.0%} of $cpu_limit cores."),
+        (16, f"Replica RSS > {RESOURCE_LIMIT:.0%}", days_until("job:process_resident_memory_bytes:max1h", f"{RESOURCE_LIMIT} * $memory_limit", GIB),
+         f"Days until the busiest replica's hourly peak RSS reaches {RESOURCE_LIMIT:.0%} of $memory_limit GiB."),
+    ]:
+        panels.append(stat_panel(pid, title, expr, "days", x, y, unit="d", decimals=0, thresholds=DAYS,
+            no_value="Not rising", desc=desc + " Empty when the trend is flat or falling.")); pid += 1
+
+    panels.append(stat_panel(pid, "Connect Latency p95 Trend",
+        "deriv(job:cloudflared_proxy_connect_latency:p95_rate1h" + JOB + "[$fit]) * 604800", "per week", 20, y, unit="ms", decimals=1,
+        thresholds=[{"color": "green", "value": None}, {"color": "yellow", "value": 1}, {"color": "red", "value": 10}],
+        desc="Change per week of the hourly proxy connect latency p95, from the linear fit over $fit. The \"When to scale\" table has no threshold for it: rising means check origin health, then add a replica.")); pid += 1
+    y += 4
+    return panels, pid, y
+
+# ============================================================
+# ROW: Demand
+# ============================================================
+@ROWS.row
+def row_demand(pid, y):
+    panels = []
+    panels.append(row(pid, "Demand", y,
+        desc="Hourly peaks of the job's load, with where the linear fit over $fit puts them $horizon from each point. Dashed red lines are the \"When to scale\" thresholds.")); pid += 1; y += 1
+
+    panels.append(ts_panel(pid, "Peak Concurrent Requests", [
+        t(rec("job:cloudflared_tunnel_concurrent_requests:max1h"), "Hourly peak"),
+        t(projected("job:cloudflared_tunnel_concurrent_requests:max1h"), "Projected +${horizon:text}", "B"),
+    ], 0, y, threshold=CONCURRENCY_LIMIT,
+        overrides=[color_override("Hourly peak", "yellow"), dashed(PROJECTED)],
+        desc="Most concurrent requests across the job in each hour, at 1-minute resolution. The projection is the value the trend over $fit reaches $horizon after each point.")); pid += 1
+
+    panels.append(ts_panel(pid, "Requests / sec", [
+        t(rec("job:cloudflared_tunnel_total_requests:max1h_rate5m"), "Hourly peak (5m rate)"),
+        t(rec("job:cloudflared_tunnel_total_requests:rate1h"), "Hourly mean", "B"),
+        t(projected("job:cloudflared_tunnel_total_requests:max1h_rate5m"), "Projected +${horizon:text}", "C"),
+    ], 12, y, unit="reqps",
+        overrides=[color_override("Hourly peak (5m rate)", "green"), color_override("Hourly mean", "blue"), dashed(PROJECTED)],
+        desc="Busiest 5 minutes and average request rate of each hour. A widening gap between them means burstier traffic, sized by the peak.")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "TCP/UDP Port Capacity %", [
+        t(rec("job:cloudflared_tcp_total_sessions:max1h_rate5m", TCP_PCT), "TCP Port %"),
+        t(rec("job:cloudflared_udp_total_sessions:max1h_rate5m", UDP_PCT), "UDP Port %", "B"),
+        t(projected("job:cloudflared_tcp_total_sessions:max1h_rate5m", TCP_PCT), "TCP projected +${horizon:text}", "C"),
+        t(projected("job:cloudflared_udp_total_sessions:max1h_rate5m", UDP_PCT), "UDP projected +${horizon:text}", "D"),
+    ], 0, y, unit="percent", threshold=PORT_LIMIT,
+        overrides=[color_override("TCP Port %", "blue"), color_override("UDP Port %", "purple"), dashed(PROJECTED)],
+        desc="Hourly peak port use under the Capacity row's model: new TCP sessions/s, and new UDP sessions/s × $dns_timeout, as a share of $available_ports. Only WARP/private network tunnels use host ports.")); pid += 1
+
+    panels.append(ts_panel(pid, "Proxy Connect Latency p95", [
+        t(rec("job:cloudflared_proxy_connect_latency:p95_rate1h"), "p95 (1h)"),
+        t(projected("job:cloudflared_proxy_connect_latency:p95_rate1h"), "Projected +${horizon:text}", "B"),
+    ], 12, y, unit="ms",
+        overrides=[color_override("p95 (1h)", "yellow"), dashed(PROJECTED)],
+        desc="95th percentile time to connect to the origin over each hour. A steady rise with flat traffic points at the origin; with rising traffic, at replica saturation.")); pid += 1
+    y += 8
+    return panels, pid, y
+
+# ============================================================
+# ROW: Replicas
+# ============================================================
+@ROWS.row
+def row_replicas(pid, y):
+    panels = []
+    panels.append(row(pid, "Replicas", y,
+        desc="Per-replica hourly peaks of CPU and memory, against the limits in $cpu_limit and $memory_limit.")); pid += 1; y += 1
+
+    panels.append(ts_panel(pid, "CPU per Replica", [
+        t(rec("instance:process_cpu_seconds:max1h_rate5m"), "{{instance}}"),
+        t(projected("job:process_cpu_seconds:max1h_rate5m"), "Busiest projected +${horizon:text}", "B"),
+        t(f"{RESOURCE_LIMIT} * $cpu_limit", "Limit", "C"),
+    ], 0, y, unit="short", legend_calcs=["max"],
+        overrides=[dashed(PROJECTED), color_override("Limit", "red")],
+        desc=f"Busiest 5 minutes of each hour per replica, in cores. Limit is {RESOURCE_LIMIT:.0%} of $cpu_limit.")); pid += 1
+
+    panels.append(ts_panel(pid, "Memory (RSS) per Replica", [
+        t(rec("instance:process_resident_memory_bytes:max1h"), "{{instance}}"),
+        t(projected("job:process_resident_memory_bytes:max1h"), "Busiest projected +${horizon:text}", "B"),
+        t(f"{RESOURCE_LIMIT} * $memory_limit * 1073741824", "Limit", "C"),
+    ], 12, y, unit="bytes", legend_calcs=["max"],
+        overrides=[dashed(PROJECTED), color_override("Limit", "red")],
+        desc=f"Largest RSS of each hour per replica. Limit is {RESOURCE_LIMIT:.0%} of $memory_limit GiB; RSS is what a Kubernetes memory limit is enforced against.")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "Replicas and Load per Replica", [
+        t(f"count(instance:process_resident_memory_bytes:max1h{JOB})", "Replicas"),
+        t(f"sum(job:cloudflared_tunnel_concurrent_requests:max1h{JOB}) / count(instance:process_resident_memory_bytes:max1h{JOB})", "Peak concurrent per replica", "B"),
+    ], 0, y, w=24,
+        overrides=[color_override("Replicas", "blue")],
+        desc="Replicas reporting in each hour, and the job's peak concurrency divided among them. Replicas are for availability, not load balancing: Cloudflare does not spread requests evenly, so the busiest replica can carry far more than this.")); pid += 1
+    y += 8
+    return panels, pid, y
+
+panels = ROWS.build(pid=1, y=0)
+
+
+# Build the dashboard JSON
+dashboard = {}
+
+if EXPORT:
+    dashboard["__inputs"] = [
+        {"name": "DS_PROMETHEUS", "label": "Prometheus", "description": "Prometheus datasource with the cloudflared-capacity recording rules loaded", "type": "datasource", "pluginId": "prometheus", "pluginName": "Prometheus"}
+    ]
+    dashboard["__elements"] = {}
+    dashboard["__requires"] = [
+        {"type": "grafana", "id": "grafana", "name": "Grafana", "version": "11.0.0"},
+        {"type": "datasource", "id": "prometheus", "name": "Prometheus", "version": "1.0.0"},
+        {"type": "panel", "id": "stat", "name": "Stat", "version": ""},
+        {"type": "panel", "id": "timeseries", "name": "Time series", "version": ""},
+    ]
+
+def custom_var(name, label, desc, options, current=None):
+    """Custom variable from [(text, value)], the first (or current) selected."""
+    current = current or options[0]
+    return {
+        "current": {"selected": False, "text": current[0], "value": current[1]},
+        "description": desc,
+        "hide": 0,
+        "label": label,
+        "name": name,
+        "options": [{"selected": o == current, "text": o[0], "value": o[1]} for o in options],
+        "query": ",".join(f"{text} : {value}" if text != value else value for text, value in options),
+        "skipUrlSync": False,
+        "type": "custom",
+    }
+
+dashboard.update({
+    "annotations": {"list": [{"builtIn": 1, "datasource": {"type": "grafana", "uid": "-- Grafana --"}, "enable": True, "hide": True, "iconColor": "rgba(0, 211, 255, 1)", "name": "Annotations & Alerts", "type": "dashboard"}]},
+    "description": "Cloudflare Tunnel (cloudflared) capacity planning — 90-day trends of peak concurrency, request rate, port capacity and per-replica CPU/RSS from recording rules, with projections of when scaling thresholds are crossed",
+    "editable": True if EXPORT else False,
+    "fiscalYearStartMonth": 0,
+    "graphTooltip": 1,
+    "id": None,
+    "links": [],
+    "liveNow": False,
+    "panels": collapse_rows(query_ir.optimize_panels(panels, PASSES, PASS_CTX)),
+    "schemaVersion": 39,
+    "tags": ["cloudflare", "tunnel", "cloudflared", "capacity"],
+    "templating": {"list": [
+        {
+            "current": {"selected": False, "text": "cloudflared-metrics", "value": "cloudflared-metrics"},
+            "description": "Prometheus job name for cloudflared",
+            "hide": 0,
+            "includeAll": False,
+            "label": "Job",
+            "multi": False,
+            "name": "job",
+            "options": [],
+            "query": {"query": "label_values(job:cloudflared_tunnel_concurrent_requests:max1h, job)", "refId": "A"},
+            "refresh": 2,
+            "regex": "",
+            "skipUrlSync": False,
+            "type": "query",
+            "datasource": DS,
+        },
+        custom_var("fit", "Fit Window", "How much history the linear trends and projections are fitted to",
+                   [("30d", "30d"), ("14d", "14d"), ("60d", "60d"), ("90d", "90d")]),
+        custom_var("horizon", "Projection", "How far ahead the projected series look",
+                   [("30d", "2592000"), ("7d", "604800"), ("60d", "5184000"), ("90d", "7776000")]),
+        custom_var("available_ports", "Available Ports", "Number of ephemeral ports available to cloudflared (default: 50000 per Cloudflare recommendation, set via net.ipv4.ip_local_port_range)",
+                   [("50000", "50000"), ("30000", "30000"), ("16384", "16384")]),
+        custom_var("dns_timeout", "DNS Timeout (s)", "DNS UDP session timeout in seconds (default: 5s per Cloudflare docs). Each DNS query holds an ephemeral port for this duration.",
+                   [("5", "5"), ("10", "10"), ("30", "30")]),
+        custom_var("cpu_limit", "CPU Limit (cores)", "CPU cores available to each replica (Cloudflare recommends at least 4 per host)",
+                   [("4", "4"), ("1", "1"), ("2", "2"), ("8", "8")]),
+        custom_var("memory_limit", "Memory Limit (GiB)", "Memory available to each replica (Cloudflare recommends at least 4 GB per host)",
+                   [("4", "4"), ("1", "1"), ("2", "2"), ("8", "8")]),
+    ]},
+    "time": {"from": "now-90d", "to": "now"},
+    "timepicker": {},
+    "timezone": "",
+    "title": "Cloudflare Tunnel Capacity Planning",
+    "uid": "cloudflared-capacity",
+    "version": 1,
+    "weekStart": ""
+})
+# Variables whose filters were elided by --elide-vars are dropped from the picker too
+dashboard["templating"]["list"] = [v for v in dashboard["templating"]["list"] if v["name"] not in PASS_CTX.get("elide_vars", ())]
+
+# Output as standalone JSON (skipped when loaded as a skeleton by gen-tenants.py)
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    outpath = os.path.join(here, "cloudflared-capacity-export.json" if EXPORT else "cloudflared-capacity.json")
+    changed = row_cache.write_if_changed(outpath, ROWS.dumps(dashboard) + "\n")
+    for note in PASS_CTX["notes"]:
+        print(note)
+    print(f"{'Wrote' if changed else 'Unchanged:'} {len(panels)} panels to {outpath} ({ROWS.summary()})")
+    rpath = os.path.join(here, "cloudflared-capacity-rules.yml")
+    changed = row_cache.write_if_changed(rpath, query_ir.rule_groups(RULE_GROUPS))
+    print(f"{'Wrote' if changed else 'Unchanged:'} {sum(len(r) for _, _, r in RULE_GROUPS)} recording rules to {rpath}")
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""Generate the Logpush Pipeline Health Grafana dashboard JSON.
+
+Usage:
+  python3 gen-logpush-pipeline.py            # Local deploy (hardcoded datasource UID)
+  python3 gen-logpush-pipeline.py --export   # Portable export for grafana.com / sharing
+  python3 gen-logpush-pipeline.py --passes=instant,shared-queries   # Query optimizer passes (see query_ir.py)
+
+The dashboard reads the Logpush receiver's own Prometheus metrics (GET
+/metrics on receiver/logpush_receiver.py): what arrives from Cloudflare, where
+the receiver spends its time, and how the Loki sink keeps up. It answers the
+question the Logpush dashboard cannot: when panels look wrong, which hop is
+behind.
+"""
+import os, sys
+
+import query_ir, row_cache
+
+EXPORT = "--export" in sys.argv
+
+if EXPORT:
+    DS = {"type": "prometheus", "uid": "${DS_PROMETHEUS}"}
+else:
+    DS = {"type": "prometheus", "uid": "prometheus"}
+
+OPEN_ROWS = {"Pipeline Overview"}  # Rows to keep expanded; all others collapse
+
+# Optimizer passes over the query IR; none run by default
+PASSES, PASS_CTX = query_ir.passes_from_argv(sys.argv)
+
+def q(expr, panel="timeseries", **ctx):
+    """Parse expr into the query IR and run the enabled passes over it."""
+    return query_ir.optimize(query_ir.parse(expr, "promql"), PASSES, {**PASS_CTX, "panel": panel, **ctx})
+
+def row(id, title, y, desc=""):
+    r = {"collapsed": False, "gridPos": {"h": 1, "w": 24, "x": 0, "y": y}, "id": id, "panels": [], "title": title, "type": "row"}
+    if desc: r["description"] = desc
+    return r
+
+def collapse_rows(panels):
+    """Nest child panels inside collapsed rows.
+
+    Grafana only defers queries for panels inside a collapsed row's 'panels'
+    array. Panels that are siblings of a non-collapsed row execute immediately.
+    """
+    result = []
+    current_row = None
+    children = []
+    for p in panels:
+        if p.get("type") == "row":
+            # Flush previous row
+            if current_row is not None:
+                if current_row["title"] not in OPEN_ROWS:
+                    current_row["collapsed"] = True
+                    current_row["panels"] = children
+                    result.append(current_row)
+                else:
+                    result.append(current_row)
+                    result.extend(children)
+            else:
+                result.extend(children)
+            current_row = p
+            children = []
+        else:
+            children.append(p)
+    # Flush last row
+    if current_row is not None:
+        if current_row["title"] not in OPEN_ROWS:
+            current_row["collapsed"] = True
+            current_row["panels"] = children
+            result.append(current_row)
+        else:
+            result.append(current_row)
+            result.extend(children)
+    else:
+        result.extend(children)
+    return result
+
+def stat_panel(id, title, expr, legend, x, y, w=4, unit="short", thresholds=None, decimals=None, desc=""):
+    th = thresholds or [{"color": "green", "value": None}]
+    p = {
+        "datasource": DS,
+        "fieldConfig": {"defaults": {"color": {"mode": "thresholds"}, "mappings": [], "thresholds": {"mode": "absolute", "steps": th}, "unit": unit}, "overrides": []},
+        "gridPos": {"h": 4, "w": w, "x": x, "y": y},
+        "id": id,
+        "options": {"colorMode": "value", "graphMode": "area", "justifyMode": "auto", "orientation": "auto", "reduceOptions": {"calcs": ["lastNotNull"], "fields": "", "values": False}, "textMode": "auto"},
+        "title": title,
+        "type": "stat",
+        "targets": [{"datasource": DS, "expr": q(expr, "stat").render(), "legendFormat": legend, "refId": "A"}]
+    }
+    if desc:
+        p["description"] = desc
+    if decimals is not None:
+        p["fieldConfig"]["defaults"]["decimals"] = decimals
+    return p
+
+def ts_panel(id, title, targets, x, y, w=12, h=8, unit="short", stack=False, overrides=None, fill=10, desc="", legend_calcs=None):
+    calcs = legend_calcs if legend_calcs is not None else ["mean", "max"]
+    return {
+        "datasource": DS,
+        "fieldConfig": {
+            "defaults": {
+                "color": {"mode": "palette-classic"},
+                "custom": {
+                    "axisBorderShow": False, "axisCenteredZero": False, "axisLabel": "", "axisPlacement": "auto",
+                    "barAlignment": 0, "drawStyle": "line", "fillOpacity": fill, "gradientMode": "none",
+                    "hideFrom": {"legend": False, "tooltip": False, "viz": False},
+                    "lineInterpolation": "linear", "lineWidth": 1, "pointSize": 5,
+                    "scaleDistribution": {"type": "linear"}, "showPoints": "auto", "spanNulls": False,
+                    "stacking": {"group": "A", "mode": "normal" if stack else "none"},
+                    "thresholdsStyle": {"mode": "off"}
+                },
+                "mappings": [], "thresholds": {"mode": "absolute", "steps": [{"color": "green", "value": None}]},
+                "unit": unit
+            },
+            "overrides": overrides or []
+        },
+        "gridPos": {"h": h, "w": w, "x": x, "y": y},
+        "id": id,
+        **({"description": desc} if desc else {}),
+        "options": {"legend": {"calcs": calcs, "displayMode": "table", "placement": "bottom"}, "tooltip": {"mode": "multi", "sort": "desc"}},
+        "title": title,
+        "type": "timeseries",
+        "targets": targets
+    }
+
+def text_panel(id, content, x, y, w=24, h=4, title="", desc=""):
+    p = {
+        "datasource": DS,
+        "gridPos": {"h": h, "w": w, "x": x, "y": y},
+        "id": id,
+        "options": {"code": {"language": "plaintext", "showLineNumbers": False, "showMiniMap": False}, "content": content, "mode": "markdown"},
+        "title": title,
+        "type": "text",
+    }
+    if desc:
+        p["description"] = desc
+    return p
+
+def t(expr, legend, ref="A"):
+    return {"datasource": DS, "expr": q(expr).render(), "legendFormat": legend, "refId": ref}
+
+def color_override(name, color):
+    return {"matcher": {"id": "byName", "options": name}, "properties": [{"id": "color", "value": {"fixedColor": color, "mode": "fixed"}}]}
+
+# ---- Receiver metric helpers ---------------------------------------------------
+
+SCOPE = ('job=~"$job"', 'instance=~"$instance"')
+
+def pm(name, *matchers):
+    """Selector for the receiver metric cloudflare_logpush_<name> on the chosen job and instances."""
+    return f"cloudflare_logpush_{name}{{{', '.join(SCOPE + matchers)}}}"
+
+def rate(name, by="", *matchers):
+    """sum [by (...)] of the per-second rate of a counter (or a histogram's _sum/_count)."""
+    agg = f"sum by ({by})" if by else "sum"
+    return f"{agg} (rate({pm(name, *matchers)}[$__rate_interval]))"
+
+def quantile(qn, name, by="", *matchers):
+    """histogram_quantile over a receiver histogram, optionally per label."""
+    return f"histogram_quantile({qn}, sum by (le{', ' + by if by else ''}) (rate({pm(name + '_bucket', *matchers)}[$__rate_interval])))"
+
+def mean(name, by=""):
+    """Average observation of a receiver histogram: rate of _sum over rate of _count."""
+    return f"{rate(name + '_sum', by)} / {rate(name + '_count', by)}"
+
+def zero(expr):
+    """expr, or 0 when the family is absent (the stage or sink is not configured)."""
+    return f"({expr} or vector(0))"
+
+ROWS = row_cache.RowCache(__file__)
+
+# ============================================================
+# ROW: Pipeline Overview
+# ============================================================
+@ROWS.row
+def row_pipeline_overview(pid, y):
+    panels = []
+    panels.append(row(pid, "Pipeline Overview", y)); pid += 1; y += 1
+
+    panels.append(stat_panel(pid, "Records/s Received", rate("receiver_records_total"), "", 0, y, unit="short", decimals=0,
+        desc="Valid records read from Logpush request bodies per second, across every worker and instance.")); pid += 1
+    panels.append(stat_panel(pid, "Lines/s into Loki", rate("loki_sent_lines_total"), "", 4, y, unit="short", decimals=0,
+        desc="Lines in pushes Loki accepted per second. Below Records/s Received means records are dropped by stages, waiting in a queue or spool, or lost.")); pid += 1
+    panels.append(stat_panel(pid, "Lines/s Lost",
+        f'{zero(rate("receiver_invalid_records_total"))} + {zero(rate("loki_dropped_lines_total"))}', "", 8, y, unit="short", decimals=1,
+        thresholds=[{"color": "green", "value": None}, {"color": "red", "value": 0.001}],
+        desc="Invalid records (no _dataset prefix or an unlisted dataset) plus lines the Loki sink dropped after a non-retryable error or running out of retries. Should be 0.")); pid += 1
+    panels.append(stat_panel(pid, "Delivery Delay p95", quantile(0.95, "receiver_delivery_delay_seconds"), "", 12, y, unit="s",
+        thresholds=[{"color": "green", "value": None}, {"color": "yellow", "value": 120}, {"color": "red", "value": 600}],
+        desc="95th percentile of receipt time minus event time (first record of each batch). Logpush normally delivers within a minute or two; a rising delay with an idle receiver means Cloudflare is behind.")); pid += 1
+    panels.append(stat_panel(pid, "Busiest Worker CPU", f'max(rate({pm("receiver_cpu_seconds_total")}[$__rate_interval]))', "", 16, y, unit="percentunit",
+        thresholds=[{"color": "green", "value": None}, {"color": "yellow", "value": 0.7}, {"color": "red", "value": 0.9}],
+        desc="CPU time per second of the busiest receiver worker. Each worker is one Python process; near 100% it is the bottleneck. Add --workers, or spread a busy zone with --shard-by client.")); pid += 1
+    panels.append(stat_panel(pid, "Loki Queue Fill", f'sum({pm("loki_queue_batches")}) / sum({pm("loki_queue_capacity_batches")})', "", 20, y, unit="percentunit",
+        thresholds=[{"color": "green", "value": None}, {"color": "yellow", "value": 0.5}, {"color": "red", "value": 0.9}],
+        desc="Encoded batches waiting for a push connection, as a share of --loki-queue. A full queue makes the receiver stop reading, which pushes back on Logpush (or fills the spool).")); pid += 1
+    y += 4
+
+    panels.append(ts_panel(pid, "Pipeline Throughput", [
+        t(rate("receiver_records_total"), "Received"),
+        t(rate("receiver_processed_records_total"), "Through stages", "B"),
+        t(rate("loki_sent_lines_total"), "Accepted by Loki", "C"),
+        t(rate("loki_spooled_lines_total"), "Spooled", "D"),
+        t(f'{zero(rate("receiver_invalid_records_total"))} + {zero(rate("loki_dropped_lines_total"))}', "Lost", "E"),
+    ], 0, y, unit="short",
+        overrides=[color_override("Received", "blue"), color_override("Accepted by Loki", "green"), color_override("Spooled", "orange"), color_override("Lost", "red")],
+        desc="Records per second at each hop. Received and Through stages match unless workers are handing batches to each other; Accepted by Loki follows with the batch wait (--loki-batch-wait) and falls behind when Loki is slow.")); pid += 1
+
+    panels.append(ts_panel(pid, "Where the Time Goes", [
+        t(rate("receiver_inflate_seconds_sum"), "Decompress"),
+        t(rate("receiver_parse_seconds_sum"), "Split & check", "B"),
+        t(rate("receiver_stage_seconds_sum", "stage"), "Stage {{stage}}", "C"),
+        t(rate("receiver_sink_write_seconds_sum"), "Waiting on sink", "D"),
+    ], 12, y, unit="s", stack=True, fill=30,
+        desc="Seconds spent per second in each step, summed over workers: 1.0 is one worker fully busy. Decompress, split and stages are CPU work in the receiver; Waiting on sink is time batches waited for the Loki queue, which means Loki (or the network to it) is the bottleneck.")); pid += 1
+    y += 8
+
+    panels.append(text_panel(pid, "\n".join([
+        "| Symptom | Bottleneck | Next step |",
+        "|---|---|---|",
+        "| Delivery delay rising; worker CPU low; Loki queue empty | Cloudflare Logpush is delivering late | Check the Logpush job's health and `last_error` in the Cloudflare API |",
+        "| Failed requests; requests/s dropping | The network or proxy between Cloudflare and the receiver is cutting connections off | Check load balancer and proxy timeouts and body size limits |",
+        "| Busiest worker CPU near 100%; queue empty | The receiver | Add `--workers`, drop costly stages, or `--shard-by client` for one busy zone |",
+        "| Waiting on sink high; Loki queue full; push latency up | Loki ingestion | Look for 429s and retries below; raise ingester limits or `--loki-connections` |",
+        "| Rejected pushes; lines lost | Loki refuses the data | Usually out-of-order or too-old entries, or per-stream rate limits |",
+    ]), 0, y, h=6, title="Which Hop Is Behind?",
+        desc="How to read this dashboard. The receiver replaces the reverse proxy and Alloy in front of Loki, so its metrics cover every hop from Cloudflare to Loki.")); pid += 1
+    y += 6
+    return panels, pid, y
+
+# ============================================================
+# ROW: Ingest (Cloudflare → receiver)
+# ============================================================
+@ROWS.row
+def row_ingest(pid, y):
+    panels = []
+    panels.append(row(pid, "Ingest (Cloudflare → Receiver)", y)); pid += 1; y += 1
+
+    panels.append(ts_panel(pid, "Requests/s by Worker", [
+        t(rate("receiver_requests_total", "instance, worker"), "OK {{instance}}/{{worker}}"),
+        t(rate("receiver_failed_requests_total", "instance, worker"), "Failed {{instance}}/{{worker}}", "B"),
+    ], 0, y, w=8,
+        desc="Logpush POSTs accepted and rejected or cut off, per receiver worker. SO_REUSEPORT spreads connections over workers; a worker with none may have exited. Failed requests make Logpush retry the whole batch.")); pid += 1
+
+    panels.append(ts_panel(pid, "Records/s by Dataset", [
+        t(rate("receiver_batch_records_sum", "dataset"), "{{dataset}}"),
+    ], 8, y, w=8, stack=True, fill=30,
+        desc="Records per second handed to the stages, per Logpush dataset.")); pid += 1
+
+    panels.append(ts_panel(pid, "Batches/s by Dataset", [
+        t(rate("receiver_batch_records_count", "dataset"), "{{dataset}}"),
+    ], 16, y, w=8, stack=True, fill=30,
+        desc="Batches per second run through the stages and sink. A batch holds up to --batch records of one dataset from one request.")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "Records per Request", [
+        t(quantile(0.5, "receiver_request_records"), "p50"),
+        t(quantile(0.95, "receiver_request_records"), "p95", "B"),
+        t(mean("receiver_request_records"), "mean", "C"),
+    ], 0, y, w=8,
+        desc="Logpush batch size as received. Logpush fills batches up to max_upload_records / max_upload_bytes or max_upload_interval_seconds; small batches at low traffic are normal.")); pid += 1
+
+    panels.append(ts_panel(pid, "Body Bytes/s", [
+        t(rate("receiver_body_bytes_total"), "Compressed"),
+        t(rate("receiver_inflated_bytes_total"), "Inflated", "B"),
+    ], 8, y, w=8, unit="Bps",
+        desc="Request bytes as sent (gzip) and after decompression. The ratio is the compression ratio Logpush achieves, typically 8-12x for http_requests.")); pid += 1
+
+    panels.append(ts_panel(pid, "Active Requests", [
+        t(f'sum by (instance, worker) ({pm("receiver_active_requests")})', "{{instance}}/{{worker}}"),
+    ], 16, y, w=8,
+        desc="Requests whose body is being read. Climbing while records/s stays flat means the receiver is reading slowly because the sink pushes back.")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "Delivery Delay by Dataset", [
+        t(quantile(0.5, "receiver_delivery_delay_seconds", "dataset"), "p50 {{dataset}}"),
+        t(quantile(0.95, "receiver_delivery_delay_seconds", "dataset"), "p95 {{dataset}}", "B"),
+    ], 0, y, unit="s",
+        desc="Receipt time minus the event time of the first record of each batch (EdgeStartTimestamp, Datetime, EventTimestampMs). Loki stamps lines with receipt time, so this is also how far the Logpush dashboard trails reality.")); pid += 1
+
+    panels.append(ts_panel(pid, "Invalid Records / Failed Requests", [
+        t(rate("receiver_invalid_records_total", "instance"), "Invalid records/s {{instance}}"),
+        t(rate("receiver_failed_requests_total", "instance"), "Failed requests/s {{instance}}", "B"),
+    ], 12, y,
+        desc="Invalid records lack the _dataset record prefix or name a dataset outside --datasets: check the job's output_options. Failed requests had a bad body, wrong auth header or were cut off mid-body.")); pid += 1
+    y += 8
+    return panels, pid, y
+
+# ============================================================
+# ROW: Receiver Processing
+# ============================================================
+@ROWS.row
+def row_receiver_processing(pid, y):
+    panels = []
+    panels.append(row(pid, "Receiver Processing", y)); pid += 1; y += 1
+
+    panels.append(ts_panel(pid, "CPU by Worker", [
+        t(f'sum by (instance, worker) (rate({pm("receiver_cpu_seconds_total")}[$__rate_interval]))', "{{instance}}/{{worker}}"),
+    ], 0, y, w=8, unit="percentunit",
+        desc="CPU time per second of each worker process. One worker at 100% while the others idle means sharding concentrates a busy zone on it (see --shard-by).")); pid += 1
+
+    panels.append(ts_panel(pid, "Decompress Time per Request", [
+        t(quantile(0.5, "receiver_inflate_seconds"), "p50"),
+        t(quantile(0.95, "receiver_inflate_seconds"), "p95", "B"),
+        t(mean("receiver_inflate_seconds"), "mean", "C"),
+    ], 8, y, w=8, unit="s",
+        desc="Seconds spent inflating each gzip body. Grows with batch size; compare with Records per Request.")); pid += 1
+
+    panels.append(ts_panel(pid, "Split & Check Time per Request", [
+        t(quantile(0.5, "receiver_parse_seconds"), "p50"),
+        t(quantile(0.95, "receiver_parse_seconds"), "p95", "B"),
+        t(mean("receiver_parse_seconds"), "mean", "C"),
+    ], 16, y, w=8, unit="s",
+        desc="Seconds spent splitting each body into records, checking their _dataset prefix and sorting them into batches.")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "Stage Time per Batch", [
+        t(mean("receiver_stage_seconds", "stage"), "{{stage}}"),
+    ], 0, y, unit="s",
+        desc="Average seconds each --stages entry spends on a batch. The first stage that reads decoded records pays for JSON decoding of the whole batch.")); pid += 1
+
+    panels.append(ts_panel(pid, "Records Dropped by Stages", [
+        t(rate("dedup_dropped_total", "dataset"), "dedup {{dataset}}"),
+        t(rate("sample_records_total", "dataset", 'outcome="dropped"'), "sample {{dataset}}", "B"),
+    ], 12, y, stack=True, fill=30,
+        desc="Records removed on purpose: duplicates Logpush delivered twice (dedup stage) and routine traffic thinned by the sample stage's policy. Empty when those stages are not enabled.")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "Hand-offs Between Workers", [
+        t(rate("receiver_handed_off_records_total", "instance, worker"), "Handed off {{instance}}/{{worker}}"),
+        t(rate("receiver_processed_records_total", "instance, worker"), "Processed {{instance}}/{{worker}}", "B"),
+    ], 0, y,
+        desc="With --workers, records are read by whichever worker got the connection and processed by the worker owning their shard. Processed shows how evenly the shards spread.")); pid += 1
+
+    panels.append(ts_panel(pid, "Waiting on Sink per Batch", [
+        t(quantile(0.5, "receiver_sink_write_seconds"), "p50"),
+        t(quantile(0.95, "receiver_sink_write_seconds"), "p95", "B"),
+        t(quantile(0.99, "receiver_sink_write_seconds"), "p99", "C"),
+    ], 12, y, unit="s",
+        desc="How long the sink took to accept each batch. Near zero while the Loki queue has room; seconds when it is full and the receiver is pushing back on Logpush.")); pid += 1
+    y += 8
+    return panels, pid, y
+
+# ============================================================
+# ROW: Loki Push
+# ============================================================
+@ROWS.row
+def row_loki_push(pid, y):
+    panels = []
+    panels.append(row(pid, "Loki Push", y)); pid += 1; y += 1
+
+    panels.append(ts_panel(pid, "Push Latency", [
+        t(quantile(0.5, "loki_push_seconds", "", 'outcome="ok"'), "p50"),
+        t(quantile(0.95, "loki_push_seconds", "", 'outcome="ok"'), "p95", "B"),
+        t(quantile(0.99, "loki_push_seconds", "", 'outcome="ok"'), "p99", "C"),
+    ], 0, y, w=8, unit="s",
+        desc="Latency of pushes Loki accepted. Each push carries up to --loki-batch-bytes of lines; rising latency at flat volume points at the distributor or ingesters.")); pid += 1
+
+    panels.append(ts_panel(pid, "Pushes/s by Outcome", [
+        t(rate("loki_push_seconds_count", "outcome"), "{{outcome}}"),
+    ], 8, y, w=8, stack=True, fill=30,
+        overrides=[color_override("ok", "green"), color_override("retryable", "orange"), color_override("rejected", "red")],
+        desc="Push attempts: ok, retryable (429, 5xx or a connection error; retried with backoff) and rejected (other 4xx; dropped).")); pid += 1
+
+    panels.append(ts_panel(pid, "Retries / Dropped Lines", [
+        t(rate("loki_retries_total"), "Retries/s"),
+        t(rate("loki_dropped_lines_total"), "Dropped lines/s", "B"),
+    ], 16, y, w=8,
+        overrides=[color_override("Dropped lines/s", "red")],
+        desc="Retries are harmless until they run out (--loki-retries); then the batch is dropped, or spooled with --loki-spool.")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "Queue Depth", [
+        t(f'sum({pm("loki_queue_batches")})', "Queued batches"),
+        t(f'sum({pm("loki_queue_capacity_batches")})', "Capacity", "B"),
+        t(f'sum({pm("loki_pending_lines")})', "Lines in open batch", "C"),
+    ], 0, y, w=8,
+        overrides=[color_override("Capacity", "red")],
+        desc="Encoded batches waiting for a push connection, against --loki-queue per worker. Lines in open batch are collecting until --loki-batch-bytes or --loki-batch-wait.")); pid += 1
+
+    panels.append(ts_panel(pid, "Sent to Loki", [
+        t(rate("loki_sent_lines_total"), "Lines/s"),
+        t(f'{rate("loki_sent_lines_total")} / {rate("loki_pushes_total")}', "Lines per push", "B"),
+    ], 8, y, w=8,
+        desc="Lines per second Loki accepted, and the average lines per push. Few lines per push means batches are flushed by --loki-batch-wait rather than filled.")); pid += 1
+
+    panels.append(ts_panel(pid, "Push Bytes/s", [
+        t(rate("loki_sent_bytes_total"), "Snappy-compressed protobuf"),
+    ], 16, y, w=8, unit="Bps",
+        desc="Compressed push bytes Loki accepted. Compare with Loki's distributor ingestion rate limit (ingestion_rate_mb).")); pid += 1
+    y += 8
+
+    panels.append(ts_panel(pid, "Disk Spool", [
+        t(f'sum({pm("loki_spool_bytes")})', "Bytes to replay"),
+    ], 0, y, unit="bytes",
+        desc="Bytes in the --loki-spool segments not yet replayed. Grows while Loki is down or slower than Logpush; empty when no spool is configured.")); pid += 1
+
+    panels.append(ts_panel(pid, "Spooled / Replayed Lines", [
+        t(rate("loki_spooled_lines_total"), "Spooled/s"),
+        t(rate("loki_replayed_lines_total"), "Replayed/s", "B"),
+        t(f'sum({pm("loki_spool_corrupt_segments_total")})', "Corrupt segments", "C"),
+    ], 12, y,
+        overrides=[color_override("Corrupt segments", "red")],
+        desc="Lines written to the spool and replayed from it, at most --loki-spool-rate lines/s. Corrupt segments (cut short by a crash) lose their remaining records.")); pid += 1
+    y += 8
+    return panels, pid, y
+
+panels = ROWS.build(pid=1, y=0)
+
+
+# Build the dashboard JSON
+dashboard = {}
+
+if EXPORT:
+    dashboard["__inputs"] = [
+        {"name": "DS_PROMETHEUS", "label": "Prometheus", "description": "Prometheus datasource scraping the Logpush receiver", "type": "datasource", "pluginId": "prometheus", "pluginName": "Prometheus"}
+    ]
+    dashboard["__elements"] = {}
+    dashboard["__requires"] = [
+        {"type": "grafana", "id": "grafana", "name": "Grafana", "version": "11.0.0"},
+        {"type": "datasource", "id": "prometheus", "name": "Prometheus", "version": "1.0.0"},
+        {"type": "panel", "id": "stat", "name": "Stat", "version": ""},
+        {"type": "panel", "id": "text", "name": "Text", "version": ""},
+        {"type": "panel", "id": "timeseries", "name": "Time series", "version": ""},
+    ]
+
+dashboard.update({
+    "annotations": {"list": [{"builtIn": 1, "datasource": {"type": "grafana", "uid": "-- Grafana --"}, "enable": True, "hide": True, "iconColor": "rgba(0, 211, 255, 1)", "name": "Annotations & Alerts", "type": "dashboard"}]},
+    "description": "Logpush ingest pipeline health from the receiver's own metrics — delivery delay, request and batch sizes, decompression, parsing and stage time, Loki push latency, queue depth, retries, drops and spool",
+    "editable": True if EXPORT else False,
+    "fiscalYearStartMonth": 0,
+    "graphTooltip": 1,
+    "id": None,
+    "links": [],
+    "liveNow": False,
+    "panels": collapse_rows(query_ir.optimize_panels(panels, PASSES, PASS_CTX)),
+    "schemaVersion": 39,
+    "tags": ["cloudflare", "logpush", "pipeline"],
+    "templating": {"list": [
+        {
+            "current": {"selected": False, "text": "cloudflare-logpush-receiver", "value": "cloudflare-logpush-receiver"},
+            "description": "Prometheus job scraping the receiver's /metrics",
+            "hide": 0,
+            "includeAll": False,
+            "label": "Job",
+            "multi": False,
+            "name": "job",
+            "options": [],
+            "query": {"query": "label_values(cloudflare_logpush_receiver_requests_total, job)", "refId": "A"},
+            "refresh": 2,
+            "regex": "",
+            "skipUrlSync": False,
+            "type": "query",
+            "datasource": DS,
+        },
+        {
+            "current": {"selected": True, "text": ["All"], "value": ["$__all"]},
+            "description": "Receiver instances (one per host; its workers are merged into one scrape)",
+            "hide": 0,
+            "includeAll": True,
+            "allValue": ".*",
+            "label": "Instance",
+            "multi": True,
+            "name": "instance",
+            "options": [],
+            "query": {"query": 'label_values(cloudflare_logpush_receiver_requests_total{job=~"$job"}, instance)', "refId": "A"},
+            "refresh": 2,
+            "regex": "",
+            "skipUrlSync": False,
+            "type": "query",
+            "datasource": DS,
+        },
+    ]},
+    "time": {"from": "now-6h", "to": "now"},
+    "timepicker": {},
+    "timezone": "",
+    "title": "Logpush Pipeline Health",
+    "uid": "logpush-pipeline",
+    "version": 1,
+    "weekStart": ""
+})
+# Variables whose filters were elided by --elide-vars are dropped from the picker too
+dashboard["templating"]["list"] = [v for v in dashboard["templating"]["list"] if v["name"] not in PASS_CTX.get("elide_vars", ())]
+
+# Output as standalone JSON (skipped when loaded as a skeleton by gen-tenants.py)
+if __name__ == "__main__":
+    if EXPORT:
+        outpath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logpush-pipeline-export.json")
+    else:
+        outpath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logpush-pipeline.json")
+    changed = row_cache.write_if_changed(outpath, ROWS.dumps(dashboard) + "\n")
+    for note in PASS_CTX["notes"]:
+        print(note)
+    print(f"{'Wrote' if changed else 'Unchanged:'} {len(panels)} panels to {outpath} ({ROWS.summary()})")
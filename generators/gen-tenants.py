@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Generate per-tenant dashboard variants from one config file.
+
+Usage:
+  python3 gen-tenants.py tenants.yaml                # All tenants, one worker per CPU
+  python3 gen-tenants.py tenants.json --jobs 4       # Explicit worker count
+  python3 gen-tenants.py tenants.yaml --out build/   # Output directory (default: ./tenants)
+
+Each generator runs once per distinct flag set to build a shared skeleton.
+Workers in a process pool then only patch the tenant-specific parts into a copy
+of it: datasource UIDs, custom/textbox variable options, open rows, title and uid.
+
+Config format (YAML needs PyYAML; JSON works with the standard library):
+
+  defaults:                      # merged into every tenant
+    generator: logpush           # logpush | cloudflared | capacity | pipeline
+  tenants:
+    - name: acme
+      title: Cloudflare Logpush (Acme)
+      uid: cf-logpush-acme
+      datasource: loki-acme      # UID for the generator's main datasource (Loki for logpush)
+      datasources:               # per-type UIDs, e.g. for logpush --metrics
+        prometheus: prometheus-acme
+      open_rows: [Overview, Security & Firewall]
+      variables:
+        zone: [acme.com, acme.io]
+        host: [www.acme.com, api.acme.com]
+      flags: [--metrics, --export]  # generator flags used to build the skeleton
+      output: acme/logpush.json  # optional, relative to --out
+"""
+import argparse, json, os, runpy, sys, time
+from concurrent.futures import ProcessPoolExecutor
+
+import row_cache
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+GENERATORS = {
+    "logpush": "gen-cloudflare-logpush.py",
+    "cloudflared": "gen-cloudflared.py",
+    "capacity": "gen-cloudflared-capacity.py",
+    "pipeline": "gen-logpush-pipeline.py",
+}
+
+# Datasource types a tenant can remap (the grafana annotation datasource stays as-is)
+DS_TYPES = ("loki", "prometheus")
+
+def load_config(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                sys.exit("PyYAML is required for YAML configs (pip install pyyaml), or use JSON")
+            cfg = yaml.safe_load(f)
+        else:
+            cfg = json.load(f)
+    defaults = cfg.get("defaults", {})
+    tenants = []
+    for i, t in enumerate(cfg.get("tenants", [])):
+        t = {**defaults, **t}
+        if "name" not in t:
+            sys.exit(f"tenant #{i} has no name")
+        if t.setdefault("generator", "logpush") not in GENERATORS:
+            sys.exit(f"tenant {t['name']}: unknown generator {t['generator']!r} (expected one of {', '.join(GENERATORS)})")
+        for var, values in t.get("variables", {}).items():
+            if isinstance(values, list) and not values:
+                sys.exit(f"tenant {t['name']}: variable {var} has no values")
+        unknown = set(t.get("datasources", {})) - set(DS_TYPES)
+        if unknown:
+            sys.exit(f"tenant {t['name']}: unknown datasource types {', '.join(sorted(unknown))} (expected one of {', '.join(DS_TYPES)})")
+        t["flags"] = tuple(t.get("flags", ()))
+        tenants.append(t)
+    return tenants
+
+def build_skeleton(generator, flags):
+    """Run a generator once in-process and return its dashboard as JSON text."""
+    script = os.path.join(HERE, GENERATORS[generator])
+    argv = sys.argv
+    sys.argv = [script, *flags]
+    try:
+        ns = runpy.run_path(script, run_name="__skeleton__")
+    finally:
+        sys.argv = argv
+    return json.dumps(ns["dashboard"])
+
+def _expand_rows(panels):
+    """Undo collapse_rows(): pull nested panels back out so rows can be re-collapsed per tenant."""
+    flat = []
+    for p in panels:
+        flat.append(p)
+        if p.get("type") == "row":
+            flat.extend(p["panels"])
+            p["panels"] = []
+    return flat
+
+def _patch_datasource(node, uids, old=None):
+    """Point datasource references at uids[type]. Returns {type: UID it replaced}."""
+    old = {} if old is None else old
+    if isinstance(node, dict):
+        ds = node.get("datasource")
+        if isinstance(ds, dict) and ds.get("type") in uids:
+            old[ds["type"]], ds["uid"] = ds["uid"], uids[ds["type"]]
+        for v in node.values():
+            _patch_datasource(v, uids, old)
+    elif isinstance(node, list):
+        for v in node:
+            _patch_datasource(v, uids, old)
+    return old
+
+def _patch_variable(var, values):
+    if var["type"] == "custom":
+        values = [str(v) for v in values] if isinstance(values, list) else [str(values)]
+        opts = [{"selected": False, "text": v, "value": v} for v in values]
+        if var.get("includeAll"):
+            opts.insert(0, {"selected": True, "text": "All", "value": "$__all"})
+            var["current"] = {"selected": True, "text": ["All"], "value": ["$__all"]}
+        else:
+            opts[0]["selected"] = True
+            var["current"] = {"selected": False, "text": values[0], "value": values[0]}
+        var["options"] = opts
+        var["query"] = ",".join(values)
+    else:
+        # textbox / query variables take a single default value
+        value = str(values[0] if isinstance(values, list) else values)
+        var["current"] = {"selected": False, "text": value, "value": value}
+        if var["type"] == "textbox":
+            var["query"] = value
+
+def _indent(text, depth):
+    """Re-indent a json.dumps(indent=2) fragment so it can be spliced in at list depth `depth`."""
+    pad = "  " * depth
+    return pad + text.replace("\n", "\n" + pad)
+
+def _ds_sentinel(ds_type):
+    return f"__TENANT_{ds_type.upper()}_UID__"
+
+_PANELS_SENTINEL = "__TENANT_PANELS__"
+
+class Skeleton:
+    """A generator's dashboard, pre-split into panels and the (small) remainder.
+
+    Panel JSON is rendered once per nesting depth with one sentinel UID per
+    datasource type, so a tenant variant only re-renders templating/title and
+    splices text.
+    """
+
+    def __init__(self, text, generator):
+        dashboard = json.loads(text)
+        self.ds_type = "loki" if generator == "logpush" else "prometheus"
+        self.panels = _expand_rows(dashboard["panels"])
+        dashboard["panels"] = _PANELS_SENTINEL
+        self.ds_uids = _patch_datasource(self.panels, {t: _ds_sentinel(t) for t in DS_TYPES})
+        self.open_rows = {p["title"] for p in self.panels if p.get("type") == "row" and not p["collapsed"]}
+        self.rest = json.dumps(dashboard)
+        self._fragments = {}
+
+    def _fragment(self, i, depth, collapsed=None):
+        key = (i, depth, collapsed)
+        if key not in self._fragments:
+            p = self.panels[i]
+            if collapsed is not None:
+                p = {**p, "collapsed": collapsed, "panels": _PANELS_SENTINEL if collapsed else []}
+            self._fragments[key] = _indent(json.dumps(p, indent=2), depth)
+        return self._fragments[key]
+
+    def _render_panels(self, open_rows):
+        out = []  # [fragment, children] pairs; children is None unless the row is collapsed
+        current_row = None
+        for i, p in enumerate(self.panels):
+            if p.get("type") == "row":
+                collapsed = p["title"] not in open_rows
+                current_row = [self._fragment(i, 2, collapsed), [] if collapsed else None]
+                out.append(current_row)
+            elif current_row is not None and current_row[1] is not None:
+                current_row[1].append(self._fragment(i, 4))
+            else:
+                out.append([self._fragment(i, 2), None])
+        items = []
+        for frag, children in out:
+            if children is not None:
+                inner = "[\n" + ",\n".join(children) + "\n      ]" if children else "[]"
+                frag = frag.replace(f'"{_PANELS_SENTINEL}"', inner)
+            items.append(frag)
+        return "[\n" + ",\n".join(items) + "\n  ]" if items else "[]"
+
+    def render(self, tenant):
+        """Return the tenant's dashboard as JSON text (same layout as json.dump(indent=2))."""
+        dashboard = json.loads(self.rest)
+        variables = tenant.get("variables", {})
+        names = {v["name"] for v in dashboard["templating"]["list"]}
+        unknown = set(variables) - names
+        if unknown:
+            raise ValueError(f"tenant {tenant['name']}: unknown variables {', '.join(sorted(unknown))}")
+        for var in dashboard["templating"]["list"]:
+            if var["name"] in variables:
+                _patch_variable(var, variables[var["name"]])
+        for key in ("title", "uid", "tags"):
+            if key in tenant:
+                dashboard[key] = tenant[key]
+        uids = dict(tenant.get("datasources", {}))
+        if "datasource" in tenant:
+            uids[self.ds_type] = tenant["datasource"]
+        _patch_datasource(dashboard, uids)
+        open_rows = set(tenant["open_rows"]) if "open_rows" in tenant else self.open_rows
+        text = json.dumps(dashboard, indent=2)
+        text = text.replace(f'"{_PANELS_SENTINEL}"', self._render_panels(open_rows), 1)
+        for ds_type, old in self.ds_uids.items():
+            text = text.replace(_ds_sentinel(ds_type), json.dumps(uids.get(ds_type, old))[1:-1])
+        return text
+
+# Worker state: skeletons per (generator, flags), sent once per worker process
+_SKELETONS = {}
+_OUT_DIR = ["."]
+
+def _init_worker(skeletons, out_dir):
+    for (generator, flags), text in skeletons.items():
+        _SKELETONS[generator, flags] = Skeleton(text, generator)
+    _OUT_DIR[0] = out_dir
+
+def build_tenant(tenant):
+    text = _SKELETONS[tenant["generator"], tenant["flags"]].render(tenant)
+    outpath = os.path.join(_OUT_DIR[0], tenant.get("output") or f"{tenant['name']}-{tenant['generator']}.json")
+    os.makedirs(os.path.dirname(outpath) or ".", exist_ok=True)
+    return outpath, row_cache.write_if_changed(outpath, text + "\n")
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate per-tenant dashboard variants from one config file.")
+    ap.add_argument("config", help="YAML or JSON tenant config")
+    ap.add_argument("--out", default="tenants", help="output directory (default: ./tenants)")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    tenants = load_config(args.config)
+    names = [t["name"] for t in tenants]
+    dupes = {n for n in names if names.count(n) > 1}
+    if dupes:
+        sys.exit(f"duplicate tenant names: {', '.join(sorted(dupes))}")
+
+    skeletons = {}
+    for t in tenants:
+        key = (t["generator"], t["flags"])
+        if key not in skeletons:
+            skeletons[key] = build_skeleton(*key)
+
+    jobs = max(1, min(args.jobs or 1, len(tenants)))
+    if jobs == 1:
+        _init_worker(skeletons, args.out)
+        results = [build_tenant(t) for t in tenants]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(skeletons, args.out)) as pool:
+            results = list(pool.map(build_tenant, tenants, chunksize=max(1, len(tenants) // (jobs * 4))))
+
+    for name, (path, changed) in zip(names, results):
+        print(f"{name}: {path}{'' if changed else ' (unchanged)'}")
+    written = sum(changed for _, changed in results)
+    print(f"Wrote {written} of {len(results)} dashboards from {len(skeletons)} skeleton(s) in {time.perf_counter() - start:.2f}s ({jobs} worker(s))")
+
+if __name__ == "__main__":
+    main()
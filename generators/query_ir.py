@@ -0,0 +1,842 @@
+"""Query IR for the dashboard generators.
+
+The panel helpers parse every LogQL/PromQL expression into a small tree, run the
+optimizer passes enabled on the command line over it, and render it back to
+text. With no passes enabled, parse(expr).render() == expr for everything the
+generators emit, so the default dashboards are unchanged.
+
+Passes (--passes=a,b; --elide-vars, --sample and --sample-rate-field enable
+theirs implicitly):
+  filter-elision   drop duplicate and redundant label filters, filters on the
+                   variables listed in --elide-vars=path,ip,..., and any
+                   `| json` fields nothing downstream reads any more
+  instant          run gauge panels and sum-reduced pie charts as instant queries
+  sampling         --sample=F keeps ~F of http/firewall lines with a RayID line
+                   filter ahead of `| json` and scales counts back up
+  sample-weights   weight count_over_time, rate and unwrapped sums by the rate
+                   the receiver's sample stage records in each kept line
+                   (--sample-rate-field=SampleRate; a line without it counts once)
+  shared-queries   a panel whose targets repeat an earlier panel in the same row
+                   reuses that panel's results via the -- Dashboard -- datasource
+  recording-rules  point PromQL `sum(rate(...))` and
+                   `histogram_quantile(..., sum by (le) (rate(..._bucket)))`
+                   at recorded series, collecting the rules in ctx["rules"]
+                   (gen-cloudflared.py --rules writes them to a rule file)
+"""
+import dataclasses, json, re, sys
+from dataclasses import dataclass, field
+
+class QueryError(ValueError):
+    """Raised for expressions outside the LogQL/PromQL subset the generators use."""
+
+def _quote(value, quote='"'):
+    if quote == "`":
+        return f"`{value}`"
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+class Node:
+    def render(self):
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.render()
+
+# ---- Selectors and log pipelines ------------------------------------------
+
+@dataclass
+class Matcher(Node):
+    name: str
+    op: str  # = != =~ !~
+    value: str
+
+    def render(self):
+        return f"{self.name}{self.op}{_quote(self.value)}"
+
+@dataclass
+class Selector(Node):
+    """Stream selector (LogQL) or instant vector selector (PromQL)."""
+    metric: str = None
+    matchers: list = field(default_factory=list)
+    offset: str = None
+
+    def label(self, name):
+        """Value of an equality matcher on name, or None."""
+        return next((m.value for m in self.matchers if m.name == name and m.op == "="), None)
+
+    def render(self):
+        s = self.metric or ""
+        if self.matchers or not self.metric:
+            s += "{" + ", ".join(m.render() for m in self.matchers) + "}"
+        return s + (f" offset {self.offset}" if self.offset else "")
+
+@dataclass
+class LineFilter(Node):
+    op: str  # |= != |~ !~
+    value: str
+    quote: str = '"'
+
+    def render(self):
+        return f"{self.op} {_quote(self.value, self.quote)}"
+
+@dataclass
+class Json(Node):
+    fields: list = field(default_factory=list)  # empty = extract everything
+
+    def render(self):
+        return "| json" + (" " + ", ".join(self.fields) if self.fields else "")
+
+@dataclass
+class LabelFilter(Node):
+    name: str
+    op: str  # = != =~ !~ == > >= < <=
+    value: str
+    quote: str = None  # None for numeric comparisons
+
+    def render(self):
+        v = _quote(self.value, self.quote) if self.quote else self.value
+        return f"| {self.name} {self.op} {v}"
+
+@dataclass
+class LabelFormat(Node):
+    name: str
+    template: str
+    quote: str = '"'
+
+    def refs(self):
+        return set(re.findall(r"\.(\w+)", self.template))
+
+    def render(self):
+        return f"| label_format {self.name}={_quote(self.template, self.quote)}"
+
+@dataclass
+class Unwrap(Node):
+    name: str
+
+    def render(self):
+        return f"| unwrap {self.name}"
+
+@dataclass
+class LogQuery(Node):
+    selector: Selector
+    stages: list = field(default_factory=list)
+
+    def render(self):
+        return " ".join([self.selector.render()] + [s.render() for s in self.stages])
+
+@dataclass
+class LogRange(Node):
+    query: LogQuery
+    range: str
+    offset: str = None
+
+    def render(self):
+        return f"{self.query.render()} [{self.range}]" + (f" offset {self.offset}" if self.offset else "")
+
+@dataclass
+class MatrixSelector(Node):
+    selector: Selector
+    range: str
+    offset: str = None
+
+    def render(self):
+        return f"{self.selector.render()}[{self.range}]" + (f" offset {self.offset}" if self.offset else "")
+
+# ---- Expressions ----------------------------------------------------------
+
+@dataclass
+class Literal(Node):
+    text: str  # number, $variable or quoted string, as written
+
+    def render(self):
+        return self.text
+
+@dataclass
+class Call(Node):
+    """Function call: range aggregations (rate, count_over_time, ...) and PromQL functions."""
+    func: str
+    args: list = field(default_factory=list)
+
+    def range_arg(self):
+        return next((a for a in self.args if isinstance(a, (LogRange, MatrixSelector))), None)
+
+    def render(self):
+        return f"{self.func}({', '.join(a.render() for a in self.args)})"
+
+@dataclass
+class VectorAgg(Node):
+    op: str
+    expr: Node
+    param: Node = None  # topk/approx_topk/quantile parameter
+    grouping: list = None  # None = no by/without clause
+    without: bool = False
+    postfix: bool = False  # `sum(x) by (le)` rather than `sum by (le) (x)`
+
+    def render(self):
+        inner = f"{self.param.render()}, {self.expr.render()}" if self.param else self.expr.render()
+        if self.grouping is None:
+            return f"{self.op}({inner})"
+        g = f"{'without' if self.without else 'by'} ({', '.join(self.grouping)})"
+        return f"{self.op}({inner}) {g}" if self.postfix else f"{self.op} {g} ({inner})"
+
+@dataclass
+class BinOp(Node):
+    op: str
+    lhs: Node
+    rhs: Node
+    modifier: str = ""  # bool / on (...) / ignoring (...) / group_left (...)
+
+    def render(self):
+        mod = f" {self.modifier}" if self.modifier else ""
+        return f"{self.lhs.render()} {self.op}{mod} {self.rhs.render()}"
+
+@dataclass
+class Paren(Node):
+    expr: Node
+
+    def render(self):
+        return f"({self.expr.render()})"
+
+@dataclass
+class Query:
+    expr: Node
+    dialect: str  # "logql" | "promql"
+    instant: bool = False
+
+    def render(self):
+        return self.expr.render()
+
+# ---- Tree helpers ---------------------------------------------------------
+
+def children(node):
+    for f in dataclasses.fields(node):
+        v = getattr(node, f.name)
+        if isinstance(v, Node):
+            yield v
+        elif isinstance(v, list):
+            yield from (x for x in v if isinstance(x, Node))
+
+def walk(node):
+    """Pre-order traversal of node and everything below it (including pipeline stages)."""
+    yield node
+    for c in children(node):
+        yield from walk(c)
+
+def transform(node, fn):
+    """Rebuild the tree bottom-up, replacing each node with fn(node)."""
+    for f in dataclasses.fields(node):
+        v = getattr(node, f.name)
+        if isinstance(v, Node):
+            setattr(node, f.name, transform(v, fn))
+        elif isinstance(v, list) and any(isinstance(x, Node) for x in v):
+            setattr(node, f.name, [transform(x, fn) if isinstance(x, Node) else x for x in v])
+    return fn(node)
+
+_PREC = {"or": 1, "and": 2, "unless": 2, "==": 3, "!=": 3, ">": 3, "<": 3, ">=": 3, "<=": 3,
+         "+": 4, "-": 4, "*": 5, "/": 5, "%": 5, "^": 6}
+
+def binop(op, lhs, rhs, modifier=""):
+    """Build a BinOp, parenthesizing operands that would otherwise re-associate."""
+    p = _PREC[op]
+    if isinstance(lhs, BinOp) and (_PREC[lhs.op] < p or (op == "^" and _PREC[lhs.op] == p)):
+        lhs = Paren(lhs)
+    if isinstance(rhs, BinOp) and (_PREC[rhs.op] < p or (op != "^" and _PREC[rhs.op] == p)):
+        rhs = Paren(rhs)
+    return BinOp(op, lhs, rhs, modifier)
+
+def log_ranges(node):
+    return [n for n in walk(node) if isinstance(n, LogRange)]
+
+_LINE_FIELD = re.compile(r'"(\w+)":')
+
+def json_fields(query):
+    """JSON fields the log queries in query read from each line, as {dataset: set}.
+
+    `| json a, b` reads a and b. After a bare `| json`, every label a filter,
+    unwrap, label_format or grouping names (other than labels label_format
+    creates) is taken to be a field. `"Field":` in a line filter counts too."""
+    grouping = set()
+    for node in walk(query.expr):
+        if isinstance(node, VectorAgg) and node.grouping and not node.without:
+            grouping.update(node.grouping)
+    out = {}
+    for node in walk(query.expr):
+        if not isinstance(node, LogQuery):
+            continue
+        fields = out.setdefault(node.selector.label("dataset"), set())
+        refs, made, bare = set(grouping), set(), False
+        for s in node.stages:
+            if isinstance(s, Json):
+                fields.update(s.fields)
+                bare = bare or not s.fields
+            elif isinstance(s, (LabelFilter, Unwrap)):
+                refs.add(s.name)
+            elif isinstance(s, LabelFormat):
+                refs |= s.refs()
+                made.add(s.name)
+            elif isinstance(s, LineFilter):
+                fields.update(_LINE_FIELD.findall(s.value))
+        if bare:
+            fields.update(refs - made - {m.name for m in node.selector.matchers} - {"__error__", "__line__"})
+    return out
+
+# ---- Parser ---------------------------------------------------------------
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<str>"(?:[^"\\]|\\.)*"|`[^`]*`)
+  | (?P<range>\[[^\]]*\])
+  | (?P<dur>\d+(?:ms|[smhdwy])(?:\d+(?:ms|[smhdwy]))*(?![\w.]))
+  | (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<var>\$\{\w+\}|\$\w+)
+  | (?P<ident>[A-Za-z_][\w:]*)
+  | (?P<op>=~|!~|!=|==|>=|<=|\|=|\|~|[=<>|,(){}*/+\-%^])
+""", re.X)
+
+_AGG_OPS = {"sum", "avg", "min", "max", "count", "stddev", "stdvar", "group",
+            "topk", "bottomk", "approx_topk", "quantile", "count_values", "sort", "sort_desc"}
+_LABEL_OPS = {"=", "!=", "=~", "!~", "==", ">", ">=", "<", "<="}
+_MATCH_OPS = {"=", "!=", "=~", "!~"}
+
+def _tokenize(text):
+    pos = 0
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m:
+            raise QueryError(f"unexpected character {text[pos]!r} at {pos} in {text!r}")
+        pos = m.end()
+        if m.lastgroup != "ws":
+            yield m.lastgroup, m.group()
+
+def _unquote(tok):
+    if tok[0] == "`":
+        return tok[1:-1], "`"
+    return re.sub(r"\\(.)", r"\1", tok[1:-1]), '"'
+
+class _Parser:
+    def __init__(self, text, dialect):
+        self.text = text
+        self.toks = list(_tokenize(text))
+        self.i = 0
+        self.dialect = dialect
+
+    def peek(self, k=0):
+        j = self.i + k
+        return self.toks[j] if j < len(self.toks) else (None, None)
+
+    def next(self):
+        tok = self.peek()
+        if tok[0] is None:
+            raise QueryError(f"unexpected end of query: {self.text!r}")
+        self.i += 1
+        return tok
+
+    def expect(self, kind, value=None):
+        k, v = self.next()
+        if k != kind or (value is not None and v != value):
+            raise QueryError(f"expected {value or kind}, got {v!r} in {self.text!r}")
+        return v
+
+    def at(self, kind, value=None):
+        k, v = self.peek()
+        return k == kind and (value is None or v == value)
+
+    def parse(self):
+        node = self.expr()
+        if self.peek()[0] is not None:
+            raise QueryError(f"unexpected {self.peek()[1]!r} in {self.text!r}")
+        return node
+
+    def expr(self, min_prec=1):
+        lhs = self.unary()
+        while True:
+            kind, op = self.peek()
+            if not ((kind == "op" or (kind == "ident" and op in ("and", "or", "unless"))) and op in _PREC):
+                return lhs
+            if _PREC[op] < min_prec:
+                return lhs
+            self.next()
+            modifier = self.modifier()
+            rhs = self.expr(_PREC[op] + (0 if op == "^" else 1))
+            lhs = BinOp(op, lhs, rhs, modifier)
+
+    def modifier(self):
+        parts = []
+        while self.at("ident") and self.peek()[1] in ("bool", "on", "ignoring", "group_left", "group_right"):
+            kw = self.next()[1]
+            if kw in ("on", "ignoring") or (kw.startswith("group_") and self.at("op", "(")):
+                kw += f" ({', '.join(self.label_list())})"
+            parts.append(kw)
+        return " ".join(parts)
+
+    def unary(self):
+        if self.at("op", "-") and self.peek(1)[0] == "num":
+            self.next()
+            return Literal("-" + self.next()[1])
+        return self.primary()
+
+    def primary(self):
+        kind, val = self.next()
+        if kind == "op" and val == "(":
+            node = Paren(self.expr())
+            self.expect("op", ")")
+            return node
+        if kind in ("num", "var", "str"):
+            return Literal(val)
+        if kind == "op" and val == "{":
+            self.i -= 1
+            return self.selector_expr(None)
+        if kind == "ident":
+            if val in _AGG_OPS and (self.at("op", "(") or self.at("ident", "by") or self.at("ident", "without")):
+                return self.aggregation(val)
+            if self.at("op", "("):
+                return self.call(val)
+            return self.selector_expr(val)
+        raise QueryError(f"unexpected {val!r} in {self.text!r}")
+
+    def label_list(self):
+        self.expect("op", "(")
+        labels = []
+        while not self.at("op", ")"):
+            labels.append(self.expect("ident"))
+            if not self.at("op", ")"):
+                self.expect("op", ",")
+        self.expect("op", ")")
+        return labels
+
+    def aggregation(self, op):
+        grouping, without, postfix = None, False, False
+        if self.at("ident", "by") or self.at("ident", "without"):
+            without = self.next()[1] == "without"
+            grouping = self.label_list()
+        self.expect("op", "(")
+        args = [self.expr()]
+        while self.at("op", ","):
+            self.next()
+            args.append(self.expr())
+        self.expect("op", ")")
+        if grouping is None and (self.at("ident", "by") or self.at("ident", "without")):
+            without = self.next()[1] == "without"
+            grouping, postfix = self.label_list(), True
+        param, inner = (args[0], args[1]) if len(args) == 2 else (None, args[0])
+        return VectorAgg(op, inner, param, grouping, without, postfix)
+
+    def call(self, func):
+        self.expect("op", "(")
+        args = []
+        while not self.at("op", ")"):
+            args.append(self.expr())
+            if not self.at("op", ")"):
+                self.expect("op", ",")
+        self.expect("op", ")")
+        return Call(func, args)
+
+    def offset(self):
+        if self.at("ident", "offset"):
+            self.next()
+            return self.expect("dur")
+        return None
+
+    def selector_expr(self, metric):
+        matchers = []
+        if self.at("op", "{"):
+            self.next()
+            while not self.at("op", "}"):
+                name = self.expect("ident")
+                op = self.expect("op")
+                if op not in _MATCH_OPS:
+                    raise QueryError(f"bad matcher operator {op!r} in {self.text!r}")
+                matchers.append(Matcher(name, op, _unquote(self.expect("str"))[0]))
+                if not self.at("op", "}"):
+                    self.expect("op", ",")
+            self.expect("op", "}")
+        sel = Selector(metric, matchers)
+        if self.dialect == "logql" and metric is None:
+            query = LogQuery(sel, self.pipeline())
+            if self.at("range"):
+                return LogRange(query, self.next()[1][1:-1], self.offset())
+            return query
+        if self.at("range"):
+            return MatrixSelector(sel, self.next()[1][1:-1], self.offset())
+        sel.offset = self.offset()
+        return sel
+
+    def pipeline(self):
+        stages = []
+        while True:
+            kind, val = self.peek()
+            if kind == "op" and val in ("|=", "|~", "!=", "!~"):
+                self.next()
+                stages.append(LineFilter(val, *_unquote(self.expect("str"))))
+            elif kind == "op" and val == "|":
+                self.next()
+                stages.append(self.stage())
+            else:
+                return stages
+
+    def stage(self):
+        name = self.expect("ident")
+        if name == "json":
+            fields = []
+            while self.at("ident") and not (self.peek(1)[0] == "op" and self.peek(1)[1] in _LABEL_OPS):
+                fields.append(self.next()[1])
+                if not self.at("op", ","):
+                    break
+                self.next()
+            return Json(fields)
+        if name == "unwrap":
+            return Unwrap(self.expect("ident"))
+        if name == "label_format":
+            target = self.expect("ident")
+            self.expect("op", "=")
+            return LabelFormat(target, *_unquote(self.expect("str")))
+        op = self.expect("op")
+        if op not in _LABEL_OPS:
+            raise QueryError(f"unsupported pipeline stage {name!r} in {self.text!r}")
+        kind, val = self.next()
+        if kind == "str":
+            return LabelFilter(name, op, *_unquote(val))
+        if kind in ("num", "dur"):
+            return LabelFilter(name, op, val)
+        raise QueryError(f"bad label filter value {val!r} in {self.text!r}")
+
+def parse(text, dialect="logql"):
+    """Parse a LogQL or PromQL expression into a Query."""
+    if dialect not in ("logql", "promql"):
+        raise ValueError(f"unknown dialect {dialect!r}")
+    return Query(_Parser(text, dialect).parse(), dialect)
+
+# ---- Pass registry --------------------------------------------------------
+
+PASSES = {}
+
+def register(name, scope="query"):
+    """Register an optimizer pass. Query passes take (Query, ctx) and return a Query;
+    dashboard passes take (flat panel list, ctx) and return a panel list."""
+    def deco(fn):
+        PASSES[name] = (scope, fn)
+        return fn
+    return deco
+
+def _pass(name):
+    if name not in PASSES:
+        raise QueryError(f"unknown pass {name!r} (known: {', '.join(sorted(PASSES))})")
+    return PASSES[name]
+
+def optimize(query, passes, ctx):
+    for name in passes:
+        scope, fn = _pass(name)
+        if scope == "query":
+            query = fn(query, ctx)
+    return query
+
+def optimize_panels(panels, passes, ctx):
+    for name in passes:
+        scope, fn = _pass(name)
+        if scope == "dashboard":
+            panels = fn(panels, ctx)
+    return panels
+
+def passes_from_argv(argv):
+    """Read --passes=a,b, --elide-vars=x,y, --sample=F and --sample-rate-field=F. Returns (passes, ctx)."""
+    opts = dict(a[2:].split("=", 1) for a in argv if a.startswith("--") and "=" in a)
+    passes = [p for p in opts.get("passes", "").split(",") if p]
+    ctx = {"notes": []}
+    if opts.get("elide-vars"):
+        ctx["elide_vars"] = {v for v in opts["elide-vars"].split(",") if v}
+        passes.append("filter-elision")
+    if opts.get("sample"):
+        ctx["sample"] = float(opts["sample"])
+        passes.append("sampling")
+    if opts.get("sample-rate-field"):
+        ctx["sample_rate_field"] = opts["sample-rate-field"]
+        passes.append("sample-weights")
+    passes = list(dict.fromkeys(passes))
+    unknown = [p for p in passes if p not in PASSES]
+    if unknown:
+        sys.exit(f"unknown pass(es) {', '.join(unknown)} (known: {', '.join(sorted(PASSES))})")
+    return passes, ctx
+
+# ---- Passes ---------------------------------------------------------------
+
+# Range aggregations whose result is a plain sum over lines, so series can be
+# merged (fewer labels) or scaled (sampling) without changing the answer.
+_LINEAR_RANGE = {"count_over_time", "rate", "sum_over_time", "bytes_over_time", "bytes_rate"}
+_SELECTING_AGGS = {"topk", "bottomk", "approx_topk"}
+
+def _prune_json(node, needed):
+    """Drop `| json` fields that no filter, unwrap, label_format or grouping reads.
+
+    needed is the set of labels the parent keeps, or None when every label
+    matters (series identity feeds an avg/quantile/count, or the result is
+    returned ungrouped)."""
+    if isinstance(node, VectorAgg):
+        if node.op == "sum" and not node.without:
+            inner = set(node.grouping or ())
+        elif node.op in _SELECTING_AGGS and node.grouping is None:
+            inner = needed
+        else:
+            inner = None
+        _prune_json(node.expr, inner)
+    elif isinstance(node, Call):
+        for a in node.args:
+            _prune_json(a, needed if node.func in _LINEAR_RANGE else None)
+    elif isinstance(node, BinOp):
+        keep = None if node.modifier else needed
+        _prune_json(node.lhs, keep)
+        _prune_json(node.rhs, keep)
+    elif isinstance(node, Paren):
+        _prune_json(node.expr, needed)
+    elif isinstance(node, LogRange) and needed is not None:
+        refs = set(needed)
+        for s in node.query.stages:
+            if isinstance(s, (LabelFilter, Unwrap)):
+                refs.add(s.name)
+            elif isinstance(s, LabelFormat):
+                refs |= s.refs()
+        stages = []
+        for s in node.query.stages:
+            if isinstance(s, Json) and s.fields:
+                s.fields = [f for f in s.fields if f in refs]
+                if not s.fields:
+                    continue  # nothing left to extract: skip parsing entirely
+            stages.append(s)
+        node.query.stages = stages
+
+@register("filter-elision")
+def elide_filters(query, ctx):
+    elided = {f"${v}" for v in ctx.get("elide_vars", ())}
+    for node in walk(query.expr):
+        if isinstance(node, Selector):
+            kept = []
+            for m in node.matchers:
+                if m.value not in elided and m not in kept:
+                    kept.append(m)
+            node.matchers = kept
+        elif isinstance(node, LogQuery):
+            filters = [s for s in node.stages if isinstance(s, LabelFilter)]
+            kept = []
+            for s in node.stages:
+                if isinstance(s, LabelFilter):
+                    if s.quote and s.value in elided:
+                        continue
+                    if s in kept:
+                        continue
+                    # `X != ""` is implied by `X = "v"`
+                    if s.op == "!=" and s.quote and s.value == "" and any(
+                            o.name == s.name and o.op == "=" and o.quote and o.value for o in filters):
+                        continue
+                kept.append(s)
+            node.stages = kept
+    _prune_json(query.expr, None)
+    return query
+
+_ADDITIVE_RANGE = {"count_over_time", "sum_over_time", "bytes_over_time"}
+
+@register("instant")
+def instant_queries(query, ctx):
+    panel = ctx.get("panel")
+    if panel == "gauge" and query.dialect == "promql":
+        query.instant = True
+    elif panel == "piechart" and ctx.get("reduce") == ["sum"] and query.dialect == "logql":
+        # A sum-reduced pie of per-step counts is the same total as one instant
+        # query over the whole range, at a fraction of the work.
+        calls = [n for n in walk(query.expr) if isinstance(n, Call) and n.range_arg() is not None]
+        aggs = [n for n in walk(query.expr) if isinstance(n, VectorAgg)]
+        if calls and all(c.func in _ADDITIVE_RANGE and c.range_arg().range == "$__auto" for c in calls) \
+                and all(a.op in ({"sum"} | _SELECTING_AGGS) for a in aggs):
+            for c in calls:
+                c.range_arg().range = "$__range"
+            query.instant = True
+    return query
+
+_HEX = "0123456789abcdef"
+_SAMPLED_DATASETS = {"http_requests", "firewall_events"}
+
+def _hex_class(k):
+    return "[0]" if k == 1 else f"[0-{_HEX[k - 1]}]" if k <= 10 else f"[0-9a-{_HEX[k - 1]}]" if k > 11 else "[0-9a]"
+
+@register("sampling")
+def sample_lines(query, ctx):
+    fraction = float(ctx.get("sample", 1))
+    if query.dialect != "logql" or not 0 < fraction < 1:
+        return query
+    # RayIDs are 16 lowercase hex digits; the last one is uniformly distributed,
+    # so keeping k of 16 values samples k/16 of lines with a cheap line filter.
+    k = min(15, max(1, round(fraction * 16)))
+    sample_filter = LineFilter("|~", '"RayID":"[0-9a-f]{15}' + _hex_class(k) + '"', "`")
+    scale = Literal(f"{16 / k:g}")
+
+    def fn(node):
+        if isinstance(node, Call):
+            rng = node.range_arg()
+            if isinstance(rng, LogRange) and rng.query.selector.label("dataset") in _SAMPLED_DATASETS:
+                if sample_filter not in rng.query.stages:
+                    rng.query.stages.insert(0, sample_filter)
+                if node.func in _LINEAR_RANGE:
+                    return binop("*", node, scale)
+        elif isinstance(node, BinOp):
+            return binop(node.op, node.lhs, node.rhs, node.modifier)
+        return node
+
+    query.expr = transform(query.expr, fn)
+    return query
+
+_WEIGHT = "sample_weight"
+
+@register("sample-weights")
+def weight_samples(query, ctx):
+    if query.dialect != "logql":
+        return query
+    field = ctx.get("sample_rate_field", "SampleRate")
+    # A line the sample stage kept 1 in N of stands for N lines; one without
+    # the field (kept by a keep rule, or ingested unsampled) stands for itself.
+    rate = LabelFormat(_WEIGHT, f'{{{{ or .{field} "1" }}}}', "`")
+    for node in walk(query.expr):
+        if not isinstance(node, Call):
+            continue
+        rng = node.range_arg()
+        if not isinstance(rng, LogRange) or any(isinstance(s, LabelFormat) and s.name == _WEIGHT for s in rng.query.stages):
+            continue
+        stages = rng.query.stages
+        unwrap = next((s for s in stages if isinstance(s, Unwrap)), None)
+        if node.func in ("count_over_time", "rate") and unwrap is None:
+            node.func = "sum_over_time" if node.func == "count_over_time" else "rate"
+            stages += [rate, Unwrap(_WEIGHT)]
+        elif node.func in ("sum_over_time", "rate") and unwrap is not None:
+            i = stages.index(unwrap)
+            stages[i:i + 1] = [rate, LabelFormat(_WEIGHT, f"{{{{ mulf .{unwrap.name} .{_WEIGHT} }}}}", "`"), Unwrap(_WEIGHT)]
+        else:
+            note = f"sample-weights: {node.func} is left unweighted (it is not a sum over lines)"
+            if note not in ctx["notes"]:
+                ctx["notes"].append(note)
+            continue
+        jsons = [s for s in stages if isinstance(s, Json)]
+        if not jsons:
+            stages.insert(stages.index(rate), Json([field]))
+        elif all(j.fields for j in jsons) and field not in jsons[-1].fields:
+            jsons[-1].fields.append(field)
+    return query
+
+@register("shared-queries", scope="dashboard")
+def share_queries(panels, ctx):
+    dashboard_ds = {"type": "datasource", "uid": "-- Dashboard --"}
+    seen, seen_anywhere = {}, {}
+    for p in panels:
+        if p.get("type") == "row":
+            seen = {}
+            continue
+        if not p.get("targets") or p.get("datasource") == dashboard_ds:
+            continue
+        key = json.dumps([{k: v for k, v in t.items() if k != "refId"} for t in p["targets"]], sort_keys=True)
+        if key in seen:
+            src = seen[key]
+            p["datasource"] = dashboard_ds
+            p["targets"] = [{"datasource": dashboard_ds, "panelId": src["id"], "refId": "A"}]
+            ctx["notes"].append(f"shared-queries: panel {p['id']} {p['title']!r} reuses panel {src['id']} {src['title']!r}")
+        elif key in seen_anywhere:
+            src = seen_anywhere[key]
+            ctx["notes"].append(f"shared-queries: panel {p['id']} {p['title']!r} repeats panel {src['id']} {src['title']!r} "
+                                f"in another row (not shared: rows load independently)")
+            seen[key] = p
+        else:
+            seen[key] = seen_anywhere[key] = p
+    return panels
+
+# Recorded series are `level:metric:operation`: the labels kept, the source
+# metric and what was done to it, e.g. job:cloudflared_proxy_connect_latency:p95_rate5m.
+RULE_WINDOW = "5m"  # rate window of rules replacing a Grafana $__rate_interval
+
+def _recordable_rate(node):
+    """(selector, window, labels the dashboard variables filter on) of a rate() over one plain selector, else None."""
+    if not (isinstance(node, Call) and node.func == "rate" and len(node.args) == 1):
+        return None
+    rng = node.args[0]
+    if not isinstance(rng, MatrixSelector) or rng.offset or rng.selector.offset or not rng.selector.metric:
+        return None
+    # Only variable matchers, which the query keeps applying to the recorded series
+    if not all("$" in m.value for m in rng.selector.matchers):
+        return None
+    window = RULE_WINDOW if rng.range.startswith("$") else rng.range
+    return rng.selector, window, sorted({m.name for m in rng.selector.matchers})
+
+def _sum_by(node):
+    """Grouping labels of a plain `sum [by (...)]`, else None."""
+    if isinstance(node, VectorAgg) and node.op == "sum" and node.param is None and not node.without:
+        return node.grouping or []
+    return None
+
+def _level(labels):
+    return "_".join(labels)
+
+@register("recording-rules", scope="dashboard")
+def record_rules(panels, ctx):
+    rules = ctx.setdefault("rules", {})  # record name -> expr, in the order panels use them
+
+    def quantiles(node):
+        # histogram_quantile(q, sum by (le, ...) (rate(m_bucket{$vars}[w]))) -> level:m:pNN_ratew{$vars}
+        if not (isinstance(node, Call) and node.func == "histogram_quantile" and len(node.args) == 2
+                and isinstance(node.args[0], Literal) and node.args[0].text[:1].isdigit()):
+            return node
+        by, rate = _sum_by(node.args[1]), _recordable_rate(getattr(node.args[1], "expr", None))
+        if by is None or "le" not in by or rate is None or not rate[0].metric.endswith("_bucket"):
+            return node
+        selector, window, scoped = rate
+        keep = scoped + [l for l in by if l not in scoped and l != "le"]
+        if not keep:
+            return node
+        q = node.args[0].text
+        name = f"{_level(keep)}:{selector.metric[:-len('_bucket')]}:p{float(q) * 100:g}_rate{window}".replace(".", "_")
+        rules[name] = f"histogram_quantile({q}, sum by ({', '.join(keep + ['le'])}) (rate({selector.metric}[{window}])))"
+        return Selector(name, list(selector.matchers))
+
+    def sums(node):
+        # sum by (...) (rate(m{$vars}[w])) -> sum by (...) (level:m:ratew{$vars})
+        by, rate = _sum_by(node), _recordable_rate(getattr(node, "expr", None))
+        if by is None or rate is None:
+            return node
+        selector, window, scoped = rate
+        keep = scoped + [l for l in by if l not in scoped]
+        if not keep:
+            return node
+        name = f"{_level(keep)}:{selector.metric}:rate{window}"
+        rules[name] = f"sum by ({', '.join(keep)}) (rate({selector.metric}[{window}]))"
+        return VectorAgg("sum", Selector(name, list(selector.matchers)), None, node.grouping, False, node.postfix)
+
+    count = 0
+    for p in panels:
+        for t in p.get("targets", []):
+            if (t.get("datasource") or p.get("datasource") or {}).get("type") != "prometheus" or "expr" not in t:
+                continue
+            query = parse(t["expr"], "promql")
+            query.expr = transform(transform(query.expr, quantiles), sums)
+            expr = query.render()
+            if expr != t["expr"]:
+                t["expr"] = expr
+                count += 1
+    ctx["notes"].append(f"recording-rules: {count} targets read {len(rules)} recorded series")
+    return panels
+
+def rule_file(group, rules):
+    """Prometheus rule file (YAML) with one group of recording rules."""
+    return rule_groups([(group, None, rules)])
+
+def rule_groups(groups):
+    """Prometheus rule file (YAML) with a group of rules per (name, interval or None, rules).
+
+    rules maps a recorded series to its expression, or an alert name to a dict
+    with expr and optionally for, labels and annotations."""
+    out = ["groups:"]
+    for group, interval, rules in groups:
+        out += [f"  - name: {group}"] + ([f"    interval: {interval}"] if interval else []) + ["    rules:"]
+        for name, rule in rules.items():
+            if isinstance(rule, str):
+                out += [f"      - record: {name}", f"        expr: {json.dumps(rule)}"]
+                continue
+            out += [f"      - alert: {name}", f"        expr: {json.dumps(rule['expr'])}"]
+            if "for" in rule:
+                out.append(f"        for: {rule['for']}")
+            for key in ("labels", "annotations"):
+                if rule.get(key):
+                    out.append(f"        {key}:")
+                    out += [f"          {k}: {json.dumps(v)}" for k, v in rule[key].items()]
+    return "\n".join(out) + "\n"
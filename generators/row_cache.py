@@ -0,0 +1,186 @@
+"""Content-addressed row cache for the dashboard generators.
+
+Each dashboard row is built by its own function registered with @ROWS.row. The
+panels it returns are cached under generators/.cache/, keyed by a hash of
+everything that can change them:
+
+  - the generator's helper code (its source with the row functions cut out)
+  - the row function's own source
+  - the other generator modules it imports (query_ir.py, country_codes.py, ...)
+  - the command-line flags (datasource mode, optimizer passes, ...)
+
+Panel ids and y positions are stored relative to the row, so an unchanged row is
+reused even when an edited row above it grew or shrank. The indented JSON of each
+panel is cached as well, keyed by the panel's content, so dumps() only renders
+panels that actually changed. Pass --no-cache to rebuild everything; the .cache/
+directory is safe to delete at any time.
+"""
+import hashlib, json, os, sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(HERE, ".cache")
+
+def _deps(module_file):
+    """Source files of the generator modules currently imported, minus module_file."""
+    skip = {os.path.abspath(module_file)}
+    files = set()
+    for name, mod in list(sys.modules.items()):
+        path = getattr(mod, "__file__", None)
+        if name == "__main__" or not path:
+            continue
+        path = os.path.abspath(path)
+        if os.path.dirname(path) == HERE and path.endswith(".py") and path not in skip:
+            files.add(path)
+    return sorted(files)
+
+def _indent(text, depth):
+    pad = "  " * depth
+    return pad + text.replace("\n", "\n" + pad)
+
+_SENTINEL = "__ROW_CACHE_PANELS__"
+
+def _rebase(panels, dpid, dy):
+    for p in panels:
+        p["id"] += dpid
+        p["gridPos"]["y"] += dy
+    return panels
+
+class RowCache:
+    def __init__(self, module_file, flags=None):
+        self.module_file = os.path.abspath(module_file)
+        self.flags = [a for a in (sys.argv[1:] if flags is None else flags) if a != "--no-cache"]
+        self.enabled = "--no-cache" not in sys.argv
+        self.dir = os.path.join(CACHE_DIR, os.path.splitext(os.path.basename(module_file))[0])
+        self.rows = []
+        self.hits = self.misses = 0
+        self._flags_key = None
+        self._fragments = self._used = None
+
+    def row(self, fn):
+        """Decorator: register fn(pid, y) -> (panels, pid, y) as the next dashboard row."""
+        self.rows.append(fn)
+        return fn
+
+    def _sources(self):
+        """Split the generator source into (helper source, [row source, ...]).
+
+        A row spans from its decorators to the next line at column 0 after its def."""
+        with open(self.module_file) as f:
+            lines = f.read().split("\n")
+        spans = []
+        for fn in self.rows:
+            start = end = fn.__code__.co_firstlineno - 1
+            while lines[end].startswith("@"):
+                end += 1  # decorators, then the def line itself
+            while end + 1 < len(lines) and (not lines[end + 1] or lines[end + 1][0].isspace()):
+                end += 1
+            spans.append((start, end + 1))
+        helpers, pos = [], 0
+        for start, end in spans:
+            helpers.extend(lines[pos:start])
+            pos = end
+        helpers.extend(lines[pos:])
+        return "\n".join(helpers), ["\n".join(lines[a:b]) for a, b in spans]
+
+    def _base_hash(self, helpers):
+        h = hashlib.sha256(helpers.encode())
+        for path in _deps(self.module_file):
+            with open(path, "rb") as f:
+                h.update(os.path.basename(path).encode() + b"\0" + f.read())
+        h.update(json.dumps(self.flags).encode())
+        return h
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, path, entry):
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def build(self, pid=1, y=0):
+        """Run (or load) every registered row in order and return the flat panel list."""
+        if not self.enabled:
+            panels = []
+            for fn in self.rows:
+                row_panels, pid, y = fn(pid, y)
+                panels.extend(row_panels)
+            return panels
+        helpers, sources = self._sources()
+        base = self._base_hash(helpers)
+        self._flags_key = base.hexdigest()[:16]
+        panels = []
+        for fn, src in zip(self.rows, sources):
+            h = base.copy()
+            h.update(src.encode())
+            path = os.path.join(self.dir, h.hexdigest()[:32] + ".json")
+            entry = self._load(path)
+            if entry is not None:
+                self.hits += 1
+                panels.extend(_rebase(entry["panels"], pid - entry["pid"], y - entry["y"]))
+                pid, y = pid + entry["pids"], y + entry["height"]
+                continue
+            self.misses += 1
+            row_panels, end_pid, end_y = fn(pid, y)
+            self._store(path, {"pid": pid, "y": y, "pids": end_pid - pid, "height": end_y - y, "panels": row_panels})
+            panels.extend(row_panels)
+            pid, y = end_pid, end_y
+        return panels
+
+    def _fragment(self, panel, depth):
+        key = hashlib.sha1(f"{depth}:{json.dumps(panel)}".encode()).hexdigest()
+        frag = self._fragments.get(key)
+        if frag is None:
+            frag = _indent(json.dumps(panel, indent=2), depth)
+        self._used[key] = frag
+        return frag
+
+    def dumps(self, dashboard):
+        """json.dumps(dashboard, indent=2), reusing the cached rendering of unchanged panels."""
+        if self._flags_key is None:
+            return json.dumps(dashboard, indent=2)
+        path = os.path.join(self.dir, f"fragments-{self._flags_key}.json")
+        self._fragments, self._used = self._load(path) or {}, {}
+        items = []
+        for p in dashboard["panels"]:
+            if p.get("type") == "row" and p.get("panels"):
+                children = ",\n".join(self._fragment(c, 4) for c in p["panels"])
+                frag = self._fragment({**p, "panels": _SENTINEL}, 2).replace(f'"{_SENTINEL}"', "[\n" + children + "\n      ]", 1)
+            else:
+                frag = self._fragment(p, 2)
+            items.append(frag)
+        text = json.dumps({**dashboard, "panels": _SENTINEL}, indent=2)
+        text = text.replace(f'"{_SENTINEL}"', "[\n" + ",\n".join(items) + "\n  ]" if items else "[]", 1)
+        if self._used.keys() != self._fragments.keys():
+            self._store(path, self._used)  # drops fragments no longer in the dashboard
+        return text
+
+    def summary(self):
+        if not self.enabled:
+            return f"{len(self.rows)} rows built (cache disabled)"
+        return f"{self.misses} of {len(self.rows)} rows rebuilt, {self.hits} from cache"
+
+def write_if_changed(path, text):
+    """Write text to path unless the file already holds exactly these bytes.
+
+    Returns True if the file was written. Unchanged files keep their mtime, so
+    file-based Grafana provisioning does not reload them.
+    """
+    data = text.encode()
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
@@ -0,0 +1,143 @@
+"""Streaming pre-aggregation of Logpush records into Prometheus metrics.
+
+Usage:
+  python3 logpush_receiver.py --stages metrics --sink loki:http://loki:3100
+  python3 logpush_receiver.py --stages metrics,project --fields fields.json --metrics-max-values 200
+
+The `metrics` stage counts every record into the families below and the
+receiver serves them on GET /metrics. `gen-cloudflare-logpush.py --metrics`
+builds a dashboard whose always-on panels (Overview, the request/status/
+cache breakdowns, TTFB and origin latency) query these series in Prometheus
+instead of scanning raw logs in Loki.
+
+Each family has a fixed set of labels, chosen so their product stays small:
+per host only status and cache status, per location only country and colo,
+no paths, IPs, ASNs or user agents. Any label is additionally capped at
+--metrics-max-values distinct values; later values are counted as "other".
+Counters advance when the receiver sees a record, not at the record's own
+timestamp, so rates lag Logpush's delivery by its batch interval.
+"""
+import prom
+from stages import Stage, register
+
+HTTP, FIREWALL, WORKERS = "http_requests", "firewall_events", "workers_trace_events"
+
+def _text(v):
+    if v is None:
+        return ""
+    if v is True or v is False:
+        return "true" if v else "false"
+    return v if isinstance(v, str) else str(v)
+
+def waf_class(rec):
+    """Cloudflare's WAF attack score bands; 0 or missing means not scored."""
+    s = rec.get("WAFAttackScore") or 0
+    return "none" if s <= 0 else "attack" if s <= 20 else "likely_attack" if s <= 50 else "likely_clean" if s <= 80 else "clean"
+
+def bot_class(rec):
+    """Bot score bands as the dashboard uses them (1-29 counts as bot traffic)."""
+    s = rec.get("BotScore") or 0
+    return "unscored" if s <= 0 else "automated" if s == 1 else "likely_automated" if s < 30 else "likely_human"
+
+ZONE_HOST = {"zone": "ZoneName", "host": "ClientRequestHost"}
+
+# name, dataset, help, {label: field name or function of the record}, field summed (None = count records)
+COUNTERS = [
+    ("http_requests_total", HTTP, "HTTP requests by zone, host, edge response status and cache status.",
+     {**ZONE_HOST, "status": "EdgeResponseStatus", "cache_status": "CacheCacheStatus"}, None),
+    ("http_requests_by_location_total", HTTP, "HTTP requests by zone, client country and edge colo.",
+     {"zone": "ZoneName", "country": "ClientCountry", "colo": "EdgeColoCode"}, None),
+    ("http_requests_by_client_total", HTTP, "HTTP requests by zone, host, method, protocol, scheme, request source and device type.",
+     {**ZONE_HOST, "method": "ClientRequestMethod", "protocol": "ClientRequestProtocol", "scheme": "ClientRequestScheme",
+      "source": "ClientRequestSource", "device_type": "ClientDeviceType"}, None),
+    ("http_requests_by_risk_total", HTTP, "HTTP requests by zone, host, WAF attack score band, bot score band and leaked credential check result.",
+     {**ZONE_HOST, "waf_class": waf_class, "bot_class": bot_class, "leaked_credentials": "LeakedCredentialCheckResult"}, None),
+    ("http_response_bytes_total", HTTP, "Bytes sent from the edge to clients (EdgeResponseBytes).",
+     {**ZONE_HOST, "cache_status": "CacheCacheStatus"}, "EdgeResponseBytes"),
+    ("http_cache_response_bytes_total", HTTP, "Bytes served from cache (CacheResponseBytes).",
+     dict(ZONE_HOST), "CacheResponseBytes"),
+    ("firewall_events_total", FIREWALL, "Firewall events by host, action and source.",
+     {"host": "ClientRequestHost", "action": "Action", "source": "Source"}, None),
+    ("workers_invocations_total", WORKERS, "Workers invocations by script and outcome.",
+     {"script": "ScriptName", "outcome": "Outcome"}, None),
+]
+
+# name, dataset, help, labels, millisecond field observed in seconds, only observe values > 0
+HISTOGRAMS = [
+    ("http_edge_ttfb_seconds", HTTP, "Edge time to first byte (EdgeTimeToFirstByteMs).",
+     dict(ZONE_HOST), "EdgeTimeToFirstByteMs", False),
+    ("http_origin_duration_seconds", HTTP, "Edge to origin request duration, cache hits excluded (OriginResponseDurationMs > 0).",
+     dict(ZONE_HOST), "OriginResponseDurationMs", True),
+]
+
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+def _getter(source):
+    if callable(source):
+        return source
+    return lambda rec: _text(rec.get(source))
+
+@register("metrics")
+class MetricsStage(Stage):
+    """Counts records into Prometheus counters and histograms with bounded labels."""
+
+    @staticmethod
+    def add_arguments(ap):
+        g = ap.add_argument_group("metrics stage")
+        g.add_argument("--metrics-prefix", default="cloudflare_logpush", help="metric name prefix (default: cloudflare_logpush)")
+        g.add_argument("--metrics-max-values", type=int, default=500,
+                       help="distinct values kept per label before new ones count as \"other\" (default: 500)")
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.prefix = args.metrics_prefix
+        self.limit = prom.LabelLimiter(args.metrics_max_values)
+        self.families = []
+        self.plans = {}  # dataset -> [(family, label names, getters, value field, positive only, aliases)]
+        for name, dataset, help, labels, value in COUNTERS:
+            fam = prom.Counter(f"{self.prefix}_{name}", help, labels)
+            self._plan(dataset, fam, labels, value, False)
+        for name, dataset, help, labels, value, positive in HISTOGRAMS:
+            fam = prom.Histogram(f"{self.prefix}_{name}", help, labels, BUCKETS)
+            self._plan(dataset, fam, labels, value, positive)
+        self.records = 0
+
+    def _plan(self, dataset, fam, labels, value, positive):
+        self.families.append(fam)
+        getters = tuple(_getter(src) for src in labels.values())
+        self.plans.setdefault(dataset, []).append((fam, tuple(labels), getters, value, positive, {}))
+
+    def _key(self, names, raw, aliases):
+        key = tuple(self.limit(n, v) for n, v in zip(names, raw))
+        if key == raw:
+            aliases[raw] = raw  # only unlimited keys are cached, so the cache is bounded by the series count
+        return key
+
+    def process(self, batch):
+        plans = self.plans.get(batch.dataset)
+        if not plans:
+            return
+        for rec in batch.records:
+            if rec is None:
+                continue
+            self.records += 1
+            for fam, names, getters, value, positive, aliases in plans:
+                raw = tuple(g(rec) for g in getters)
+                key = aliases.get(raw) or self._key(names, raw, aliases)
+                if value is None:
+                    fam.inc(key)
+                    continue
+                v = rec.get(value)
+                if not isinstance(v, (int, float)) or isinstance(v, bool):
+                    continue
+                if isinstance(fam, prom.Histogram):
+                    if v > 0 or not positive:
+                        fam.observe(key, v / 1000)
+                else:
+                    fam.inc(key, v)
+
+    def status(self):
+        return f"metrics: {sum(len(f.samples) for f in self.families)} label sets"
+
+    def metrics(self):
+        return "".join(f.render() for f in self.families) + self.limit.render(self.prefix)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Backfill Loki from archived Logpush files.
+
+Usage:
+  python3 backfill.py --loki http://loki:3100 http_requests=/archive/http firewall_events=/archive/firewall
+  python3 backfill.py --loki http://loki:3100 --rate 20 --jobs 8 --window 600 /archive/logpush
+  python3 backfill.py --loki http://loki:3100 --checkpoint /var/tmp/backfill.done --loki-header X-Scope-OrgID:cloudflare /archive
+
+Reads the gzipped NDJSON objects Logpush writes to R2 or S3-compatible storage
+(…/20260101/20260101T000012Z_20260101T000042Z_1a2b3c4d.log.gz), copied to
+local disk, and pushes them to the {job, dataset} streams the receiver's loki
+sink writes, stamped with each record's own event time rather than the time
+it is read. A record's dataset is its `_dataset` prefix; for archives written
+without a record_prefix, give it with DATASET=PATH.
+
+Files are grouped into --window second windows by the start time in their
+name (or their mtime). Each window is read by one of --jobs processes, which
+inflates its files, sorts each stream by timestamp and encodes the pushes, so
+the pushes of a window arrive in order and windows follow each other in time,
+within what Loki's unordered_writes accepts. Pushes of up to
+--loki-batch-bytes of lines (default 4 MiB here) go out over
+--loki-connections connections at most --rate MB of lines per second, the
+unit of Loki's ingestion_rate_mb.
+
+Once Loki has taken every push of a window, its files are appended to
+--checkpoint, and a restarted backfill skips them. At most the window in
+flight is sent twice; Loki ignores an entry with the same stream, timestamp
+and line as one it has. A push Loki rejects (a 4xx other than 429, such as a
+record older than reject_old_samples_max_age) is counted and dropped; one
+that still fails after --loki-retries stops the backfill.
+"""
+import argparse, asyncio, collections, concurrent.futures, datetime, gzip, os, re, sys, time
+
+import loki_push, sinks
+from logpush_receiver import DATASETS, PREFIX, dataset_of, event_ns
+
+SUFFIXES = (".gz", ".log", ".ndjson", ".json")
+NAME_TIME = re.compile(r"(\d{8}T\d{6}Z)")
+
+# ---- Finding files --------------------------------------------------------------
+
+def file_ns(path):
+    """Start time of a Logpush object from its name (20260101T000012Z_...), else its mtime, in unix ns."""
+    m = NAME_TIME.search(os.path.basename(path))
+    if m:
+        t = datetime.datetime.strptime(m.group(1), "%Y%m%dT%H%M%SZ").replace(tzinfo=datetime.timezone.utc)
+        return int(t.timestamp()) * 10**9
+    return int(os.path.getmtime(path) * 1e9)
+
+def find_files(specs):
+    """[DATASET=]PATH arguments -> [(start ns, path, dataset or None)], oldest first."""
+    files = []
+    for spec in specs:
+        dataset, eq, path = spec.partition("=")
+        if not eq:
+            dataset, path = None, spec
+        if os.path.isfile(path):
+            files.append((file_ns(path), os.path.abspath(path), dataset))
+            continue
+        if not os.path.isdir(path):
+            raise ValueError(f"no such file or directory: {path}")
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if name.endswith(SUFFIXES) and not name.startswith("."):
+                    p = os.path.join(root, name)
+                    files.append((file_ns(p), os.path.abspath(p), dataset))
+    files.sort(key=lambda f: (f[0], f[1]))
+    return files
+
+def windows(files, window_s):
+    """Group files by --window; -> [(window start ns, [(path, dataset, start ns)])], in time order."""
+    out = {}
+    size = int(window_s * 1e9)
+    for start, path, dataset in files:
+        out.setdefault(start // size * size, []).append((path, dataset, start))
+    return list(out.items())
+
+# ---- Loading (in the process pool) ------------------------------------------------
+
+def load_window(files, job, allowed, batch_bytes):
+    """Read one window's files; -> ([(push body, lines, line bytes)], lines read, invalid lines).
+
+    Each stream's entries are sorted by event time; a record without one gets
+    its file's start time."""
+    streams = {}
+    read = invalid = 0
+    for path, dataset, start in files:
+        with (gzip.open if path.endswith(".gz") else open)(path, "rb") as f:
+            for line in f:
+                line = line.rstrip(b"\r\n")
+                if not line:
+                    continue
+                read += 1
+                name = dataset_of(line, allowed) if line.startswith(PREFIX) else dataset
+                if name is None or (allowed is not None and name not in allowed):
+                    invalid += 1
+                    continue
+                streams.setdefault(name, []).append((event_ns(name, line) or start, line))
+    pushes = []
+    for name, entries in sorted(streams.items()):
+        entries.sort(key=lambda e: e[0])
+        labels = loki_push.format_labels({"job": job, "dataset": name})
+        i = 0
+        while i < len(entries):
+            size, j = 0, i
+            while j < len(entries) and (size < batch_bytes or j == i):
+                size += len(entries[j][1])
+                j += 1
+            body = loki_push.snappy_compress(loki_push.encode_push([(labels, entries[i:j])]))
+            pushes.append((body, j - i, size))
+            i = j
+    return pushes, read, invalid
+
+# ---- Pushing ----------------------------------------------------------------------
+
+class Backfill:
+    def __init__(self, args, todo):
+        self.args, self.todo = args, todo
+        self.sink = sinks.LokiSink(args.loki, args)
+        self.allowed = None if args.datasets == "*" else set(args.datasets.split(","))
+        self.windows_done = self.read = self.invalid = self.line_bytes = 0
+        self.failed = None
+        self.t0 = time.monotonic()
+
+    async def sender(self, queue):
+        conn = self.sink.connection()
+        try:
+            while True:
+                body, lines = await queue.get()
+                try:
+                    if self.failed is None:
+                        failed = await self.sink.send(conn, body, lines)
+                        if failed and failed[1]:
+                            self.failed = failed[0]
+                        elif failed:
+                            self.sink.dropped += lines
+                            print(f"backfill: dropped {lines} lines {failed[0]}", file=sys.stderr)
+                finally:
+                    queue.task_done()
+        finally:
+            conn.close()
+
+    async def run(self):
+        a = self.args
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(a.loki_connections * 2)
+        senders = [asyncio.create_task(self.sender(queue)) for _ in range(a.loki_connections)]
+        pending = collections.deque()
+        ahead = iter(self.todo)
+        rate, next_at, last_report = a.rate * 1e6, 0.0, time.monotonic()
+        with concurrent.futures.ProcessPoolExecutor(a.jobs) as pool, open(a.checkpoint, "a") as done:
+            def submit():
+                w = next(ahead, None)
+                if w is not None:
+                    pending.append((*w, loop.run_in_executor(
+                        pool, load_window, w[1], a.loki_job, self.allowed, a.loki_batch_bytes)))
+            for _ in range(a.jobs + 1):
+                submit()
+            while pending:
+                start, files, fut = pending.popleft()
+                pushes, read, invalid = await fut
+                submit()
+                for body, lines, size in pushes:
+                    await queue.put((body, lines))
+                    self.line_bytes += size
+                    if rate:
+                        now = time.monotonic()
+                        next_at = max(next_at, now) + size / rate
+                        await asyncio.sleep(next_at - now)
+                await queue.join()
+                if self.failed is not None:
+                    break
+                done.write("".join(path + "\n" for path, _, _ in files))
+                done.flush()
+                os.fsync(done.fileno())
+                self.windows_done += 1
+                self.read += read
+                self.invalid += invalid
+                if a.stats_interval and time.monotonic() - last_report >= a.stats_interval:
+                    last_report = time.monotonic()
+                    print(self.status(start + int(a.window * 1e9)), file=sys.stderr)
+            for fut in pending:
+                fut[2].cancel()
+        for t in senders:
+            t.cancel()
+        if self.failed is not None:
+            raise RuntimeError(f"Loki did not take a push {self.failed}; "
+                               f"rerun to resume after the last completed window")
+        print(self.status(), file=sys.stderr)
+
+    def status(self, at=None):
+        elapsed = time.monotonic() - self.t0
+        where = f" up to {datetime.datetime.fromtimestamp(at / 1e9, datetime.timezone.utc):%Y-%m-%dT%H:%M:%SZ}" if at else ""
+        return (f"backfill: {self.windows_done}/{len(self.todo)} windows{where}, {self.read} lines read, "
+                f"{self.invalid} invalid, {self.read / elapsed:.0f} lines/s, {self.line_bytes / 1e6 / elapsed:.1f} MB/s; "
+                f"{self.sink.status()}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Push archived Logpush files to Loki in event-time order, resumably.")
+    ap.add_argument("paths", nargs="+", metavar="[DATASET=]PATH",
+                    help="Logpush files or directories of them; DATASET= for records without a _dataset prefix")
+    ap.add_argument("--loki", required=True, metavar="URL", help="Loki base or push URL, e.g. http://loki:3100")
+    ap.add_argument("--datasets", default=",".join(DATASETS), help="datasets to push, or * for any")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="processes reading and encoding windows (default: CPUs)")
+    ap.add_argument("--window", type=float, default=300, help="seconds of files sorted together (default: 300)")
+    ap.add_argument("--rate", type=float, default=4, help="MB of lines pushed per second, 0 = unlimited (default: 4)")
+    ap.add_argument("--checkpoint", default="backfill.done", help="file listing the files Loki has taken (default: backfill.done)")
+    ap.add_argument("--stats-interval", type=float, default=10, help="seconds between progress reports, 0 = off (default: 10)")
+    sinks.LokiSink.add_arguments(ap)
+    ap.set_defaults(loki_batch_bytes=4 << 20, workers=1, worker=0, metrics_prefix="cloudflare_logpush")
+    args = ap.parse_args()
+
+    try:
+        files = find_files(args.paths)
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    done = set()
+    if os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as f:
+            done = {line.rstrip("\n") for line in f}
+    todo = windows([f for f in files if f[1] not in done], args.window)
+    print(f"backfill: {len(files)} files, {len(files) - sum(len(w) for _, w in todo)} already done, "
+          f"{len(todo)} windows to push", file=sys.stderr)
+    try:
+        asyncio.run(Backfill(args, todo).run())
+    except RuntimeError as e:
+        sys.exit(f"error: {e}")
+    except KeyboardInterrupt:
+        sys.exit(f"interrupted; completed windows are in {args.checkpoint}")
+
+if __name__ == "__main__":
+    main()
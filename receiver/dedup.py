@@ -0,0 +1,173 @@
+"""Drops records Logpush delivers twice, keyed on RayID.
+
+Usage:
+  python3 logpush_receiver.py --stages dedup --sink loki:http://loki:3100
+  python3 logpush_receiver.py --stages dedup,metrics --dedup-window 900 --dedup-capacity 4000000 --dedup-fp-rate 0.0001
+
+Logpush retries a whole batch on any error or timeout, including the part
+the receiver had already forwarded before a slow sink stalled it. Every
+retried record would be stored, and counted by every count_over_time panel,
+twice. The `dedup` stage remembers the key of each delivered record in a
+rotating Bloom filter and drops records it has seen:
+
+  http_requests     RayID
+  firewall_events   RayID + RuleID (one request can trigger several rules)
+
+Records of other datasets, without a RayID or not valid JSON pass through.
+
+The filter has --dedup-generations Bloom filters, each sized for
+--dedup-capacity keys. New keys go into the newest; lookups check all of
+them. The newest is retired after --dedup-window seconds or once it holds
+--dedup-capacity keys, whichever comes first, and the oldest is dropped, so
+memory is fixed and a retry is caught if it arrives within
+(generations - 1) windows. A unique record is wrongly dropped with
+probability at most --dedup-fp-rate; each filter is sized for its share
+of it. Keys are only added once the sink has accepted the batch, so a
+retry after a failed write is not mistaken for a duplicate.
+"""
+import hashlib, math, time
+
+import prom
+from stages import Stage, register
+
+# ---- Bloom filter ---------------------------------------------------------------
+
+class BloomFilter:
+    """Bit array of m bits, k probes per key by double hashing."""
+
+    def __init__(self, capacity, fp_rate):
+        self.m = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0
+
+    def probes(self, key):
+        """Bit positions of key; computed once and shared by same-sized filters."""
+        d = hashlib.blake2b(key, digest_size=16).digest()
+        h1, h2 = int.from_bytes(d[:8], "little"), int.from_bytes(d[8:], "little") | 1
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def __contains__(self, probes):
+        bits = self.bits
+        for p in probes:
+            if not bits[p >> 3] >> (p & 7) & 1:
+                return False
+        return True
+
+    def add(self, probes):
+        bits = self.bits
+        for p in probes:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+class RotatingBloom:
+    """Generations of Bloom filters, newest first, retired by age or fill."""
+
+    def __init__(self, capacity, fp_rate, generations, window):
+        self.capacity, self.window = capacity, window
+        self.fp_rate = fp_rate / generations  # a lookup can false-positive in any generation
+        self.generations = generations
+        self.filters = [BloomFilter(capacity, self.fp_rate)]
+        self.started = time.monotonic()
+        self.rotations = {"age": 0, "full": 0}
+
+    def _rotate(self, reason):
+        self.filters.insert(0, BloomFilter(self.capacity, self.fp_rate))
+        del self.filters[self.generations:]
+        self.started = time.monotonic()
+        self.rotations[reason] += 1
+
+    def probes(self, key):
+        if time.monotonic() - self.started >= self.window:
+            self._rotate("age")
+        return self.filters[0].probes(key)
+
+    def __contains__(self, probes):
+        return any(probes in f for f in self.filters)
+
+    def add(self, probes):
+        if self.filters[0].count >= self.capacity:
+            self._rotate("full")
+        self.filters[0].add(probes)
+
+    def nbytes(self):
+        return sum(len(f.bits) for f in self.filters)
+
+# ---- Stage -----------------------------------------------------------------------
+
+def _http_key(rec):
+    ray = rec.get("RayID")
+    return ray.encode() if ray else None
+
+def _firewall_key(rec):
+    ray = rec.get("RayID")
+    return f"{ray}/{rec.get('RuleID') or ''}".encode() if ray else None
+
+KEYS = {"http_requests": (b"h", _http_key), "firewall_events": (b"f", _firewall_key)}
+
+@register("dedup")
+class DedupStage(Stage):
+    """Drops records whose RayID (RayID + RuleID for firewall events) was already delivered."""
+
+    @staticmethod
+    def add_arguments(ap):
+        g = ap.add_argument_group("dedup stage (also uses --metrics-prefix)")
+        g.add_argument("--dedup-window", type=float, default=600, help="seconds per filter generation (default: 600)")
+        g.add_argument("--dedup-generations", type=int, default=3,
+                       help="filters kept; retries are caught for (generations - 1) windows (default: 3)")
+        g.add_argument("--dedup-capacity", type=int, default=2_000_000,
+                       help="keys per generation before it is retired early (default: 2000000)")
+        g.add_argument("--dedup-fp-rate", type=float, default=0.001,
+                       help="chance a unique record is dropped as a duplicate (default: 0.001)")
+
+    def __init__(self, args):
+        super().__init__(args)
+        if args.dedup_generations < 2:
+            raise ValueError("--dedup-generations must be at least 2")
+        self.seen = RotatingBloom(args.dedup_capacity, args.dedup_fp_rate, args.dedup_generations, args.dedup_window)
+        prefix = args.metrics_prefix
+        self.checked = prom.Counter(f"{prefix}_dedup_checked_total", "Records looked up in the duplicate filter.", ("dataset",))
+        self.dropped = prom.Counter(f"{prefix}_dedup_dropped_total", "Records dropped as already delivered.", ("dataset",))
+        self.rotations = prom.Counter(f"{prefix}_dedup_rotations_total",
+                                      "Filter generations retired, by reason (age, or full before its window ended).", ("reason",))
+        self.memory = prom.Gauge(f"{prefix}_dedup_filter_bytes", "Memory held by the duplicate filter's bit arrays.")
+
+    def process(self, batch):
+        spec = KEYS.get(batch.dataset)
+        if spec is None:
+            return
+        tag, key_of = spec
+        seen = self.seen
+        lines, records, new, batch_keys = [], [], [], set()
+        for line, rec in zip(batch.lines, batch.records):
+            key = key_of(rec) if rec is not None else None
+            if key is not None:
+                key = tag + key
+                probes = seen.probes(key)
+                if key in batch_keys or probes in seen:
+                    continue
+                batch_keys.add(key)
+                new.append(probes)
+            lines.append(line)
+            records.append(rec)
+        dropped = len(batch.lines) - len(lines)
+        self.checked.inc((batch.dataset,), len(new) + dropped)
+        if dropped:
+            self.dropped.inc((batch.dataset,), dropped)
+            batch.set(lines, records)
+
+        def commit():
+            for probes in new:
+                seen.add(probes)
+        batch.after_write(commit)
+
+    def status(self):
+        dropped = sum(self.dropped.samples.values())
+        return f"dedup: {dropped} dropped"
+
+    def metrics(self):
+        for reason, n in self.seen.rotations.items():
+            self.rotations.samples[(reason,)] = n
+        self.memory.set((), self.seen.nbytes())
+        return self.checked.render() + self.dropped.render() + self.rotations.render() + self.memory.render()
@@ -0,0 +1,160 @@
+"""Heavy hitters (top paths, IPs, JA4s, user agents, referers) counted at ingest.
+
+Usage:
+  python3 logpush_receiver.py --stages metrics,topk --sink loki:http://loki:3100
+  python3 logpush_receiver.py --stages topk --topk 25 --topk-capacity 2000 --topk-window 60
+
+The `topk` stage keeps one Space-Saving summary per dimension and zone in
+fixed memory (--topk-capacity items each). Every --topk-window seconds the
+--topk largest items of each summary are added to a Prometheus counter and
+the summaries start over, so the counters hold per-window top-K counts and
+`increase(...[$__range])` adds them up across windows. An item that is in
+the top K for only part of the range is counted only for those windows; the
+result is an approximate top-N like Loki's approx_topk, not an exact one.
+
+Each reported count overestimates the true count by at most
+cloudflare_logpush_topk_max_error, which is at most the window's requests
+divided by --topk-capacity. A family keeps at most --topk-series label sets
+per zone; the ones out of the top K the longest are dropped first.
+`gen-cloudflare-logpush.py --metrics` points the matching top-N tables at
+these counters.
+"""
+import heapq, time
+from operator import itemgetter
+
+import prom
+from stages import Stage, register
+
+class SpaceSaving:
+    """Space-Saving summary of a weighted stream, evicting in batches.
+
+    Counts are kept for up to 2 * capacity items; past that the summary keeps
+    the `capacity` largest. A new item starts from `floor`, the largest count
+    evicted so far, so every count overestimates by at most `floor` and any
+    item with a true count above `floor` is still in the summary.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.floor = 0
+
+    def update(self, weights):
+        counts, floor = self.counts, self.floor
+        for item, w in weights.items():
+            counts[item] = counts.get(item, floor) + w
+        if len(counts) > 2 * self.capacity:
+            kept = heapq.nlargest(self.capacity + 1, counts.items(), key=itemgetter(1))
+            self.floor = kept.pop()[1]
+            self.counts = dict(kept)
+
+    def top(self, k):
+        return heapq.nlargest(k, self.counts.items(), key=itemgetter(1))
+
+def _bot(rec):
+    s = rec.get("BotScore") or 0
+    return 0 < s < 30
+
+# name, metric label, field, predicate (None = every record), help
+DIMENSIONS = [
+    ("paths", "path", "ClientRequestPath", None, "Requests to the top paths."),
+    ("error_paths", "path", "ClientRequestPath", lambda rec: (rec.get("EdgeResponseStatus") or 0) >= 400,
+     "4xx and 5xx responses on the top paths."),
+    ("ips", "ip", "ClientIP", None, "Requests from the top client IPs."),
+    ("ja4", "ja4", "JA4", None, "Requests from the top JA4 TLS fingerprints."),
+    ("referers", "referer", "ClientRequestReferer", None, "Requests from the top referers."),
+    ("bot_user_agents", "user_agent", "ClientRequestUserAgent", _bot, "Likely bot requests (BotScore 1-29) from the top user agents."),
+    ("bot_paths", "path", "ClientRequestPath", _bot, "Likely bot requests (BotScore 1-29) to the top paths."),
+    ("bot_ips", "ip", "ClientIP", _bot, "Likely bot requests (BotScore 1-29) from the top client IPs."),
+    ("bot_ja4", "ja4", "JA4", _bot, "Likely bot requests (BotScore 1-29) from the top JA4 TLS fingerprints."),
+]
+
+@register("topk")
+class TopKStage(Stage):
+    """Per-window top-K of high-cardinality http_requests fields, as Prometheus counters."""
+
+    @staticmethod
+    def add_arguments(ap):
+        g = ap.add_argument_group("topk stage (also uses --metrics-prefix and --metrics-max-values for zones)")
+        g.add_argument("--topk", type=int, default=25, help="items per dimension and zone reported each window (default: 25)")
+        g.add_argument("--topk-capacity", type=int, default=1000,
+                       help="items each summary tracks; bounds the count error to requests/capacity (default: 1000)")
+        g.add_argument("--topk-window", type=float, default=60, help="seconds per window (default: 60)")
+        g.add_argument("--topk-series", type=int, default=100,
+                       help="label sets kept per dimension and zone before the stalest are dropped (default: 100)")
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.k, self.capacity, self.window = args.topk, args.topk_capacity, args.topk_window
+        self.max_series = max(args.topk_series, self.k)
+        self.zones = prom.LabelLimiter(args.metrics_max_values)
+        self.summaries = {}  # (dimension index, zone) -> SpaceSaving
+        self.families = [prom.Counter(f"{args.metrics_prefix}_top_{name}_requests_total", help, ("zone", label))
+                         for name, label, _, _, help in DIMENSIONS]
+        self.last_seen = [{} for _ in DIMENSIONS]  # per family: (zone, value) -> window it was last reported
+        self.max_error = prom.Gauge(f"{args.metrics_prefix}_topk_max_error",
+                                    "Largest overestimate of a top-K count in the last window, by dimension.", ("dimension",),
+                                    merge="max")
+        self.started = time.monotonic()
+        self.current = 0
+        self.windows = 0
+
+    def _roll(self):
+        now = int((time.monotonic() - self.started) // self.window)
+        if now == self.current:
+            return
+        self.current = now
+        self.windows += 1
+        errors = [0] * len(DIMENSIONS)
+        for (i, zone), summary in self.summaries.items():
+            family, seen = self.families[i], self.last_seen[i]
+            for value, count in summary.top(self.k):
+                family.inc((zone, value), count)
+                seen[(zone, value)] = now
+            errors[i] = max(errors[i], summary.floor)
+        for i, family in enumerate(self.families):
+            self.max_error.set((DIMENSIONS[i][0],), errors[i])
+            seen = self.last_seen[i]
+            per_zone = {}
+            for zone, _ in seen:
+                per_zone[zone] = per_zone.get(zone, 0) + 1
+            for zone, n in per_zone.items():
+                if n <= self.max_series:
+                    continue
+                stale = sorted((w, key) for key, w in seen.items() if key[0] == zone)[:n - self.max_series]
+                for _, key in stale:
+                    del seen[key]
+                    del family.samples[key]
+        self.summaries = {}
+
+    def process(self, batch):
+        self._roll()
+        if batch.dataset != "http_requests":
+            return
+        counts = {}
+        for rec in batch.records:
+            if rec is None:
+                continue
+            zone = self.zones("zone", rec.get("ZoneName") or "")
+            for i, (_, _, field, keep, _) in enumerate(DIMENSIONS):
+                value = rec.get(field)
+                if not value or (keep is not None and not keep(rec)):
+                    continue
+                if not isinstance(value, str):
+                    value = str(value)
+                c = counts.get((i, zone))
+                if c is None:
+                    c = counts[(i, zone)] = {}
+                c[value] = c.get(value, 0) + 1
+        for key, weights in counts.items():
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = SpaceSaving(self.capacity)
+            summary.update(weights)
+
+    def status(self):
+        return f"topk: {sum(len(s.counts) for s in self.summaries.values())} tracked, {self.windows} windows"
+
+    def metrics(self):
+        self._roll()
+        return "".join(f.render() for f in self.families) + self.max_error.render() + self.zones.render(self.args.metrics_prefix + "_topk")
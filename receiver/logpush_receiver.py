@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""Asyncio receiver for Cloudflare Logpush HTTP destinations.
+
+Usage:
+  python3 logpush_receiver.py --listen 0.0.0.0:3500 --sink stdout
+  python3 logpush_receiver.py --sink file:logpush.ndjson.gz --auth-header "X-Logpush-Token:secret"
+  python3 logpush_receiver.py --sink null --stats-interval 5
+  python3 logpush_receiver.py --sink loki:http://loki:3100 --loki-header X-Scope-OrgID:cloudflare
+  python3 logpush_receiver.py --sink loki:http://loki:3100 --loki-spool /var/spool/logpush
+  python3 logpush_receiver.py --stages project --fields cloudflare-logpush-fields.json --sink loki:http://loki:3100
+  python3 logpush_receiver.py --workers 4 --stages metrics --sink loki:http://loki:3100
+
+Accepts Logpush POSTs on any path, decompresses gzip bodies as they stream in
+(Content-Encoding: gzip, or a gzip body without the header, which is how
+Logpush sends them), splits them into NDJSON records and checks each one
+starts with the `_dataset` record prefix from the README. Valid records are
+handed to the --sink in per-dataset batches; invalid ones are counted and
+dropped, so Logpush does not retry a batch forever over one bad line. This
+replaces the reverse proxy + gunzip step in front of Alloy, and with the loki
+sink Alloy itself.
+
+Memory per request is bounded by the read size, --max-line and --batch, not by
+the body size: the body is read in 64 KiB pieces, each inflated in slices of
+at most 256 KiB, and records are flushed to the sink in batches of --batch.
+A sink that is slow makes the receiver stop reading, which pushes back on
+Logpush through TCP.
+
+--stages=a,b runs processing stages (stages.py) over each batch before the
+sink, e.g. `project`, which strips fields no dashboard panel reads,
+`dedup`, which drops records Logpush delivers twice, `metrics`, which keeps
+Prometheus counters served on GET /metrics, `topk`,
+which adds per-window top paths, IPs, JA4s and user agents to them,
+`distinct`, which adds HyperLogLog counts of distinct clients per host, or
+`sample`, which keeps 1 in N of routine traffic and records N in the record.
+
+--workers N forks N processes sharing --listen through SO_REUSEPORT, each
+running the stages and sink for a shard of the zones or clients (workers.py).
+"""
+import argparse, asyncio, datetime, signal, sys, time, zlib
+
+import prom, sinks, stages, workers
+import aggregate, dedup, distinct, heavy_hitters, sampling  # register the metrics, dedup, distinct, topk and sample stages
+
+DATASETS = ("http_requests", "firewall_events", "workers_trace_events")
+PREFIX = b'{"_dataset":"'
+READ_SIZE = 64 * 1024
+INFLATE_SIZE = 256 * 1024
+
+class BadRequest(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# ---- Body decoding ------------------------------------------------------------
+
+class Inflater:
+    """Incremental gzip/zlib decoder with bounded output per call; handles concatenated gzip members."""
+
+    def __init__(self):
+        self.d = zlib.decompressobj(zlib.MAX_WBITS | 32)
+        self.seconds = 0.0  # spent decompressing
+
+    def feed(self, data):
+        """Yield decompressed slices of at most INFLATE_SIZE bytes."""
+        while data:
+            t0 = time.perf_counter()
+            try:
+                out = self.d.decompress(data, INFLATE_SIZE)
+            except zlib.error as e:
+                raise BadRequest(400, f"bad gzip body: {e}")
+            finally:
+                self.seconds += time.perf_counter() - t0
+            if out:
+                yield out
+            if self.d.eof:
+                data = self.d.unused_data
+                self.d = zlib.decompressobj(zlib.MAX_WBITS | 32)
+            else:
+                data = self.d.unconsumed_tail
+
+    def finish(self):
+        tail = self.d.flush()
+        if tail:
+            yield tail
+
+class Splitter:
+    """Splits a byte stream into records on newlines, keeping the partial last one."""
+
+    def __init__(self, max_line):
+        self.buf = b""
+        self.max_line = max_line
+        self.seconds = 0.0  # spent splitting, plus what the receiver adds for checking
+
+    def feed(self, data):
+        t0 = time.perf_counter()
+        buf = self.buf + data if self.buf else data
+        lines = buf.split(b"\n")
+        self.buf = lines.pop()
+        self.seconds += time.perf_counter() - t0
+        if len(self.buf) > self.max_line:
+            raise BadRequest(413, f"record longer than {self.max_line} bytes")
+        return lines
+
+    def finish(self):
+        tail, self.buf = self.buf, b""
+        return [tail] if tail else []
+
+def dataset_of(line, allowed):
+    """The record's `_dataset` if it has the prefix and is an allowed dataset, else None."""
+    if not line.startswith(PREFIX) or not line.endswith(b"}"):
+        return None
+    end = line.find(b'"', len(PREFIX))
+    if end < 0:
+        return None
+    name = line[len(PREFIX):end].decode("ascii", "replace")
+    return name if allowed is None or name in allowed else None
+
+# ---- Stats --------------------------------------------------------------------
+
+class Stats:
+    def __init__(self):
+        self.requests = self.failed = self.body_bytes = self.raw_bytes = 0
+        self.records = self.invalid = self.handed_off = self.processed = 0
+        self.active = 0
+
+    @property
+    def cpu(self):
+        return time.process_time()
+
+    def snapshot(self):
+        return (self.requests, self.body_bytes, self.raw_bytes, self.records, self.invalid)
+
+# name, type, help, Stats attribute; exported per worker
+THROUGHPUT = [
+    ("requests_total", "counter", "Logpush requests accepted.", "requests"),
+    ("failed_requests_total", "counter", "Logpush requests rejected or cut off.", "failed"),
+    ("body_bytes_total", "counter", "Request body bytes read, as sent.", "body_bytes"),
+    ("inflated_bytes_total", "counter", "Request body bytes after gzip decompression.", "raw_bytes"),
+    ("records_total", "counter", "Valid records read.", "records"),
+    ("invalid_records_total", "counter", "Lines dropped for a missing _dataset prefix or an unlisted dataset.", "invalid"),
+    ("handed_off_records_total", "counter", "Records passed to the worker owning their dataset and zone.", "handed_off"),
+    ("processed_records_total", "counter", "Records run through the stages and the sink by this worker.", "processed"),
+    ("active_requests", "gauge", "Requests whose body is being read.", "active"),
+    ("cpu_seconds_total", "counter", "CPU time used by this worker; a rate near 1 means the worker is the bottleneck.", "cpu"),
+]
+
+RECORD_BUCKETS = (1, 10, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+DELAY_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+class Timings:
+    """Pipeline histograms, exported by every worker and summed across them by /metrics.
+
+    request_records counts whole Logpush requests; batch_records (by dataset)
+    the per-dataset batches handed to the stages, so its _count and _sum give
+    batches and lines per second. inflate and parse are the seconds of work
+    per request, stage and sink_write the seconds per batch; a sink whose
+    queue is full shows up as time spent in sink_write. delivery_delay is receipt
+    time minus the event time of each batch's first record: how far behind
+    Logpush is delivering.
+    """
+
+    def __init__(self, prefix):
+        p = f"{prefix}_receiver"
+        self.request_records = prom.Histogram(f"{p}_request_records", "Records per accepted Logpush request.", (), RECORD_BUCKETS)
+        self.batch_records = prom.Histogram(f"{p}_batch_records", "Records per batch run through the stages and sink.", ("dataset",), RECORD_BUCKETS)
+        self.inflate = prom.Histogram(f"{p}_inflate_seconds", "Time spent decompressing each request body.")
+        self.parse = prom.Histogram(f"{p}_parse_seconds", "Time spent splitting and checking the records of each request.")
+        self.stage = prom.Histogram(f"{p}_stage_seconds", "Time each stage spent on a batch.", ("stage",))
+        self.sink_write = prom.Histogram(f"{p}_sink_write_seconds", "Time the sink took to accept a batch, including waits for a full queue.")
+        self.delivery_delay = prom.Histogram(f"{p}_delivery_delay_seconds",
+                                             "Receipt time minus event time of the first record of each batch.", ("dataset",), DELAY_BUCKETS)
+
+    def render(self):
+        return "".join(h.render() for h in (self.request_records, self.batch_records, self.inflate, self.parse,
+                                            self.stage, self.sink_write, self.delivery_delay))
+
+# Event timestamp of each dataset, as RFC 3339 or unix s/ms/ns, read from the raw line
+EVENT_TIME = {"http_requests": b'"EdgeStartTimestamp":', "firewall_events": b'"Datetime":',
+              "workers_trace_events": b'"EventTimestampMs":'}
+
+def event_ns(dataset, line):
+    """The record's event time in unix ns, or None."""
+    key = EVENT_TIME.get(dataset)
+    i = line.find(key) if key else -1
+    if i < 0:
+        return None
+    i += len(key)
+    end = line.find(b",", i)
+    raw = line[i:end if end >= 0 else len(line) - 1].strip(b'" ')
+    try:
+        if raw[:1].isdigit() and b"-" not in raw:
+            v = float(raw)
+            return int(v if v >= 1e17 else v * 1e6 if v >= 1e11 else v * 1e9)
+        return int(datetime.datetime.fromisoformat(raw.decode().replace("Z", "+00:00")).timestamp() * 1e9)
+    except ValueError:
+        return None
+
+async def report(stats, parts, interval, label=""):
+    last, t0 = stats.snapshot(), time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now, t1 = stats.snapshot(), time.monotonic()
+        dt = t1 - t0
+        req, body, raw, rec, bad = (b - a for a, b in zip(last, now))
+        print(f"{label}{rec / dt:.0f} lines/s, {req / dt:.1f} req/s, {body / dt / 1e6:.2f} MB/s in, "
+              f"{raw / dt / 1e6:.2f} MB/s inflated, {bad} invalid, {stats.active} active, "
+              f"{stats.records} lines total" + "".join(f"; {s}" for s in (p.status() for p in parts) if s),
+              file=sys.stderr)
+        last, t0 = now, t1
+
+# ---- HTTP ---------------------------------------------------------------------
+
+class Receiver:
+    def __init__(self, sink, args, peers=None):
+        self.sink = sink
+        self.stages = stages.make_stages(args.stages, args)
+        self.args = args
+        self.worker = args.worker
+        self.peers = {i: workers.Peer(i, sock) for i, sock in (peers or {}).items()}
+        self.shard = workers.sharder(args.workers, args.shard_by) if self.peers else None
+        self.peer_tasks = []
+        self.allowed = None if args.datasets == "*" else set(args.datasets.split(","))
+        self.auth = None
+        if args.auth_header:
+            name, _, value = args.auth_header.partition(":")
+            self.auth = (name.strip().lower(), value.strip())
+        self.stats = Stats()
+        self.timings = Timings(args.metrics_prefix)
+        self.stage_names = [n for n in (args.stages or "").split(",") if n]
+
+    async def start(self):
+        self.peer_tasks = [await peer.start(self) for peer in self.peers.values()]
+
+    async def finish(self, grace=10):
+        """After the listener closed: let requests in flight end, then take the batches other workers still send."""
+        deadline = time.monotonic() + grace
+        while self.stats.active and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for peer in self.peers.values():
+            peer.close()
+        if self.peer_tasks:
+            await asyncio.wait(self.peer_tasks, timeout=max(0.1, deadline - time.monotonic()))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 431, "request header too large", close=True)
+                    return
+                keep = await self._request(head, reader, writer)
+                if not keep:
+                    return
+        finally:
+            writer.close()
+
+    async def _request(self, head, reader, writer):
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            await self._respond(writer, 400, "bad request line", close=True)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if method == "GET" and target in ("/ready", "/healthz"):
+            await self._respond(writer, 200, "ready", keep)
+            return keep
+        if method == "GET" and target == "/metrics":
+            try:
+                text = await self.metrics()
+            except (ConnectionError, asyncio.TimeoutError) as e:
+                await self._respond(writer, 503, f"metrics unavailable: {e}", keep)
+                return keep
+            await self._respond(writer, 200, text, keep, content_type="text/plain; version=0.0.4")
+            return keep
+        if method != "POST":
+            await self._respond(writer, 405, "only POST is accepted", close=True)
+            return False
+        if self.auth and headers.get(self.auth[0]) != self.auth[1]:
+            await self._respond(writer, 401, "unauthorized", close=True)
+            return False
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        self.stats.active += 1
+        try:
+            accepted = await self._body(headers, reader)
+        except BadRequest as e:
+            self.stats.failed += 1
+            await self._respond(writer, e.status, str(e), close=True)
+            return False
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.stats.failed += 1
+            return False
+        finally:
+            self.stats.active -= 1
+        self.stats.requests += 1
+        self.timings.request_records.observe((), accepted)
+        await self._respond(writer, 200, f"{accepted} records", keep)
+        return keep
+
+    async def _chunks(self, headers, reader):
+        """Raw body pieces, for Content-Length and chunked bodies."""
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size_line = await reader.readuntil(b"\r\n")
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readuntil(b"\r\n")  # trailers are not supported; expect the final CRLF
+                    return
+                while size:
+                    data = await reader.read(min(size, READ_SIZE))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b"", size)
+                    size -= len(data)
+                    yield data
+                await reader.readexactly(2)
+        else:
+            try:
+                remaining = int(headers.get("content-length", "0"))
+            except ValueError:
+                raise BadRequest(400, "bad Content-Length")
+            while remaining:
+                data = await reader.read(min(remaining, READ_SIZE))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(data)
+                yield data
+
+    async def _body(self, headers, reader):
+        stats, args = self.stats, self.args
+        encoding = headers.get("content-encoding", "").lower()
+        inflater = None
+        splitter = Splitter(args.max_line)
+        batches = {}
+        accepted = 0
+        received = time.time_ns()
+        first = True
+        async for data in self._chunks(headers, reader):
+            stats.body_bytes += len(data)
+            if first:
+                # Logpush gzips bodies whether or not it says so
+                if encoding in ("gzip", "deflate") or data[:2] == b"\x1f\x8b":
+                    inflater = Inflater()
+                elif encoding not in ("", "identity"):
+                    raise BadRequest(415, f"unsupported Content-Encoding {encoding}")
+                first = False
+            pieces = inflater.feed(data) if inflater else (data,)
+            for piece in pieces:
+                stats.raw_bytes += len(piece)
+                accepted += await self._records(splitter.feed(piece), batches, received, splitter)
+        if inflater:
+            for piece in inflater.finish():
+                accepted += await self._records(splitter.feed(piece), batches, received, splitter)
+        accepted += await self._records(splitter.finish(), batches, received, splitter)
+        for (dataset, owner), lines in batches.items():
+            if lines:
+                await self._dispatch(dataset, owner, lines, received)
+        if inflater:
+            self.timings.inflate.observe((), inflater.seconds)
+        self.timings.parse.observe((), splitter.seconds)
+        return accepted
+
+    async def _dispatch(self, dataset, owner, lines, received):
+        if owner == self.worker:
+            await self.process(dataset, lines, received)
+        else:
+            self.stats.handed_off += len(lines)
+            await self.peers[owner].send(dataset, lines, received)
+
+    async def process(self, dataset, lines, received):
+        """Run a batch through the stages and into the sink; batches from other workers come in here too."""
+        self.stats.processed += len(lines)
+        timings, clock = self.timings, time.perf_counter
+        timings.batch_records.observe((dataset,), len(lines))
+        ts = event_ns(dataset, lines[0])
+        if ts is not None:
+            timings.delivery_delay.observe((dataset,), max(0, received - ts) / 1e9)
+        batch = stages.Batch(dataset, lines)
+        for name, stage in zip(self.stage_names, self.stages):
+            t0 = clock()
+            stage.process(batch)
+            timings.stage.observe((name,), clock() - t0)
+            if not batch.lines:
+                break
+        else:
+            t0 = clock()
+            await self.sink.write(dataset, batch.lines, received)
+            timings.sink_write.observe((), clock() - t0)
+        for fn in batch.callbacks:
+            fn()
+
+    def local_metrics(self):
+        """This process's families: the stages', the sink's and its throughput counters."""
+        worker = (str(self.worker),)
+        out = [part.metrics() for part in self.stages + [self.sink]]
+        out.append(self.timings.render())
+        for name, kind, help, attr in THROUGHPUT:
+            fam = (prom.Counter if kind == "counter" else prom.Gauge)(f"{self.args.metrics_prefix}_receiver_{name}", help, ("worker",))
+            fam.samples[worker] = getattr(self.stats, attr)
+            out.append(fam.render())
+        return "".join(out)
+
+    async def metrics(self):
+        """The /metrics page: this process's families merged with every other worker's."""
+        if not self.peers:
+            return self.local_metrics()
+        texts = await asyncio.wait_for(asyncio.gather(*(peer.metrics() for peer in self.peers.values())), 5)
+        return prom.merge([self.local_metrics(), *texts])
+
+    async def _records(self, lines, batches, received, splitter):
+        """Sort lines into batches and dispatch the full ones; time spent outside dispatch counts as parsing."""
+        allowed, batch, shard, worker = self.allowed, self.args.batch, self.shard, self.worker
+        clock = time.perf_counter
+        t0 = clock()
+        n = 0
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if not line:
+                continue
+            dataset = dataset_of(line, allowed)
+            if dataset is None:
+                self.stats.invalid += 1
+                continue
+            n += 1
+            key = (dataset, shard(dataset, line) if shard else worker)
+            pending = batches.get(key)
+            if pending is None:
+                pending = batches[key] = []
+            pending.append(line)
+            if len(pending) >= batch:
+                batches[key] = []
+                splitter.seconds += clock() - t0
+                await self._dispatch(*key, pending, received)
+                t0 = clock()
+        splitter.seconds += clock() - t0
+        self.stats.records += n
+        return n
+
+    async def _respond(self, writer, status, message, keep=False, close=False, content_type="text/plain"):
+        reason = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 405: "Method Not Allowed",
+                  413: "Payload Too Large", 415: "Unsupported Media Type", 431: "Request Header Fields Too Large",
+                  503: "Service Unavailable"}.get(status, "")
+        body = (message if message.endswith("\n") else message + "\n").encode()
+        conn = "keep-alive" if keep and not close else "close"
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {conn}\r\n\r\n".encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+# ---- CLI ----------------------------------------------------------------------
+
+async def serve(args, worker=0, peers=None):
+    """Run one receiver process; with --workers, worker is its index and peers its sockets to the others."""
+    args.worker = worker
+    sink = sinks.make_sink(args.sink, args)
+    receiver = Receiver(sink, args, peers)
+    await receiver.start()
+    host, _, port = args.listen.rpartition(":")
+    server = await asyncio.start_server(receiver.handle, host or "0.0.0.0", int(port), limit=64 * 1024,
+                                        backlog=args.backlog, reuse_port=args.workers > 1)
+    label = f"worker {worker}: " if args.workers > 1 else ""
+    print(f"{label}listening on {args.listen}, sink {args.sink}", file=sys.stderr)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    reporter = (asyncio.create_task(report(receiver.stats, receiver.stages + [sink], args.stats_interval, label))
+                if args.stats_interval else None)
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            if args.workers > 1:
+                signal.signal(sig, signal.SIG_IGN)  # the process group and the supervisor may both signal a worker
+            else:
+                loop.remove_signal_handler(sig)  # a second ^C stops waiting for the sink
+        server.close()
+        await receiver.finish()
+        if reporter:
+            reporter.cancel()
+        await sink.close()
+
+def build_parser():
+    ap = argparse.ArgumentParser(description="Receive Cloudflare Logpush HTTP POSTs and forward the records.")
+    ap.add_argument("--listen", default="0.0.0.0:3500", help="host:port (default: 0.0.0.0:3500)")
+    ap.add_argument("--sink", default="stdout", help=f"where records go: {', '.join(sorted(sinks.SINKS))} (default: stdout)")
+    ap.add_argument("--stages", default="", help=f"comma-separated processing stages, in order: {', '.join(sorted(stages.STAGES))}")
+    ap.add_argument("--datasets", default=",".join(DATASETS), help="accepted _dataset values, or * for any")
+    ap.add_argument("--auth-header", metavar="NAME:VALUE", help="require this header (set it with header_NAME=VALUE in destination_conf)")
+    ap.add_argument("--batch", type=int, default=1000, help="records per sink write (default: 1000)")
+    ap.add_argument("--max-line", type=int, default=1 << 20, help="longest accepted record in bytes (default: 1 MiB)")
+    ap.add_argument("--backlog", type=int, default=1024, help="listen backlog (default: 1024)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="processes sharing --listen via SO_REUSEPORT, each running the stages and sink for a shard (default: 1)")
+    ap.add_argument("--shard-by", choices=sorted(workers.SHARD_FIELDS), default="zone",
+                    help="what a worker's shard is made of: zone keeps every stage exact, client spreads a busy zone (default: zone)")
+    ap.add_argument("--stats-interval", type=float, default=10, help="seconds between throughput reports, 0 = off (default: 10)")
+    for cls in [*stages.STAGES.values(), *sinks.SINKS.values()]:
+        cls.add_arguments(ap)
+    return ap
+
+def main():
+    args = build_parser().parse_args()
+    if args.workers < 1:
+        sys.exit("error: --workers must be at least 1")
+    if args.workers > 1:
+        sys.exit(workers.run(args, serve))
+    try:
+        asyncio.run(serve(args))
+    except ValueError as e:
+        sys.exit(f"error: {e}")
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Minimal Prometheus metric families and text exposition for the receiver.
+
+Families keep their samples in dicts keyed by label-value tuples; render()
+writes them in the text exposition format. LabelLimiter bounds how many
+distinct values a label may take: past the cap, new values are reported as
+"other" (and counted) so a flood of random hosts cannot blow up the series
+count. merge() combines the expositions of several receiver processes.
+"""
+
+# Families whose samples merge() combines by maximum instead of adding them up
+MAX_MERGED = set()
+
+def _escape(v):
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+class LabelLimiter:
+    """At most `cap` distinct values per label name, the rest become "other"."""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.values = {}
+        self.overflow = {}
+
+    def __call__(self, name, value):
+        seen = self.values.get(name)
+        if seen is None:
+            seen = self.values[name] = set()
+        if value in seen:
+            return value
+        if len(seen) < self.cap:
+            seen.add(value)
+            return value
+        self.overflow[name] = self.overflow.get(name, 0) + 1
+        return "other"
+
+    def render(self, prefix):
+        if not self.overflow:
+            return ""
+        lines = [f"# HELP {prefix}_label_overflow_total Label values reported as \"other\" because the label hit its value cap.",
+                 f"# TYPE {prefix}_label_overflow_total counter"]
+        lines += [f'{prefix}_label_overflow_total{{label="{n}"}} {c}' for n, c in sorted(self.overflow.items())]
+        return "\n".join(lines) + "\n"
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.samples = {}
+
+    def inc(self, key=(), value=1):
+        self.samples[key] = self.samples.get(key, 0) + value
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(self.samples.items())]
+        return "\n".join(out) + "\n"
+
+class Gauge(Counter):
+    """merge="max" for values that do not add up across worker processes (a largest error, a high-water mark)."""
+
+    def __init__(self, name, help, labelnames=(), merge="sum"):
+        super().__init__(name, help, labelnames)
+        if merge == "max":
+            MAX_MERGED.add(name)
+
+    def set(self, key=(), value=0):
+        self.samples[key] = value
+
+    def render(self):
+        return super().render().replace(f"# TYPE {self.name} counter", f"# TYPE {self.name} gauge", 1)
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.samples = {}  # key -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, key, value):
+        s = self.samples.get(key)
+        if s is None:
+            s = self.samples[key] = [0] * (len(self.buckets) + 2)
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                s[i] += 1
+                break
+        else:
+            s[-2] += 1
+        s[-1] += value
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        les = [f'le="{b:g}"' for b in self.buckets] + ['le="+Inf"']
+        for k, s in sorted(self.samples.items()):
+            total = 0
+            for i, le in enumerate(les):
+                total += s[i]
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {total}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(s[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {total}")
+        return "\n".join(out) + "\n"
+
+def merge(texts):
+    """One exposition from several processes' expositions of the same families.
+
+    Samples with equal labels are added up, or take the maximum for gauges
+    declared with merge="max".
+    """
+    families = {}  # name -> [HELP/TYPE lines, {series: value}, combine by max]
+    current = None
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith("# "):
+                name = line.split(" ", 3)[2]
+                current = families.get(name)
+                if current is None:
+                    current = families[name] = [[], {}, name in MAX_MERGED]
+                if len(current[0]) < 2 and line not in current[0]:
+                    current[0].append(line)
+            elif line and current is not None:
+                series, _, value = line.rpartition(" ")
+                have = current[1].get(series)
+                if have is None:
+                    current[1][series] = float(value)
+                else:
+                    current[1][series] = max(have, float(value)) if current[2] else have + float(value)
+    out = []
+    for head, samples, _ in families.values():
+        out += head
+        out += [f"{series} {_num(v)}" for series, v in samples.items()]
+    return "\n".join(out) + "\n" if out else ""
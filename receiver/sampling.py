@@ -0,0 +1,207 @@
+"""Tiered ingest sampling: keep what matters, 1-in-N of the rest, with the rate recorded.
+
+Usage:
+  python3 logpush_receiver.py --stages dedup,metrics,sample --sink loki:http://loki:3100
+  python3 logpush_receiver.py --stages sample --sample-policy policy.txt --sample-rate-field SampleRate
+
+Most stored http_requests are cache hits that the dashboard only ever counts.
+The `sample` stage applies a policy, one rule per line, first match wins:
+
+  DATASET [CONDITION ...] ACTION
+
+DATASET is a dataset name or *. A CONDITION compares a top-level field:
+Field=value, Field!=value, Field=~regex (full match) and numeric Field<n,
+Field<=n, Field>n, Field>=n; a missing field never matches a numeric
+comparison and compares as "" otherwise. ACTION is `keep`, `drop`, or `1/N`
+to keep one record in N, optionally `per FIELD` to count separately for each
+value of FIELD (so a quiet host keeps its share too). A record no rule
+matches is kept. `#` starts a comment. The default policy:
+
+  firewall_events                                         keep
+  http_requests  EdgeResponseStatus>=500                  keep
+  http_requests  WAFAttackScore>0 WAFAttackScore<=20      keep
+  http_requests  BotScore>0 BotScore<30                   keep
+  http_requests  CacheCacheStatus=hit EdgeResponseStatus>=200 EdgeResponseStatus<300  1/20 per ClientRequestHost
+
+A record kept by a 1/N rule gets "--sample-rate-field":N appended, so
+`gen-cloudflare-logpush.py --passes=sample-weights` can weight counts and sums
+by it; a record without the field stands for itself (rate 1). A record that
+already carries the field (sampled data ingested again) gets its rate
+multiplied by N instead. Which record of
+each N is kept is decided by a counter starting at a random offset, so the
+kept count of every (rule, FIELD value) is within one of its true count / N.
+
+Run it after `metrics`, `topk` and `distinct`, which should see every record,
+and before `project`.
+"""
+import json, random, re
+
+import prom
+from stages import Stage, register
+
+DEFAULT_POLICY = """\
+firewall_events                                         keep
+http_requests  EdgeResponseStatus>=500                  keep
+http_requests  WAFAttackScore>0 WAFAttackScore<=20      keep
+http_requests  BotScore>0 BotScore<30                   keep
+http_requests  CacheCacheStatus=hit EdgeResponseStatus>=200 EdgeResponseStatus<300  1/20 per ClientRequestHost
+"""
+
+_CONDITION = re.compile(r"(\w+)(=~|!=|<=|>=|=|<|>)(.*)$")
+_NUMERIC = {"<": float.__lt__, "<=": float.__le__, ">": float.__gt__, ">=": float.__ge__}
+
+def _text(v):
+    if v is None:
+        return ""
+    if v is True or v is False:
+        return "true" if v else "false"
+    return v if isinstance(v, str) else str(v)
+
+def _condition(token):
+    m = _CONDITION.match(token)
+    if not m:
+        raise ValueError(f"bad sampling condition {token!r} (expected Field=value, Field=~regex or Field<n)")
+    field, op, value = m.groups()
+    if op in _NUMERIC:
+        limit, cmp = float(value), _NUMERIC[op]
+
+        def test(rec):
+            v = rec.get(field)
+            return isinstance(v, (int, float)) and not isinstance(v, bool) and cmp(float(v), limit)
+    elif op == "=~":
+        pattern = re.compile(value)
+        test = lambda rec: pattern.fullmatch(_text(rec.get(field))) is not None
+    elif op == "=":
+        test = lambda rec: _text(rec.get(field)) == value
+    else:
+        test = lambda rec: _text(rec.get(field)) != value
+    return test
+
+class Rule:
+    def __init__(self, number, dataset, conditions, rate, per):
+        self.number, self.dataset, self.conditions = str(number), dataset, conditions
+        self.rate, self.per = rate, per
+        self.counters = {}  # per-field value -> records until the next one kept
+
+    def matches(self, rec):
+        return all(test(rec) for test in self.conditions)
+
+    def keep(self, rec):
+        if self.rate <= 1:
+            return self.rate == 1
+        key = _text(rec.get(self.per)) if self.per else ""
+        left = self.counters.get(key)
+        if left is None:
+            if len(self.counters) >= 100_000:
+                self.counters.clear()
+            left = random.randrange(self.rate)
+        self.counters[key] = left - 1 if left else self.rate - 1
+        return left == 0
+
+def parse_policy(text):
+    """-> [Rule]; rate 1 is keep, 0 is drop."""
+    rules = []
+    for number, line in enumerate(text.splitlines(), 1):
+        words = line.split("#", 1)[0].split()
+        if not words:
+            continue
+        per = None
+        if len(words) >= 3 and words[-2] == "per":
+            per = words[-1]
+            words = words[:-2]
+        if len(words) < 2:
+            raise ValueError(f"sampling policy line {number}: expected DATASET [CONDITION ...] ACTION")
+        action = words[-1]
+        if action == "keep":
+            rate = 1
+        elif action == "drop":
+            rate = 0
+        elif re.fullmatch(r"1/[1-9]\d*", action):
+            rate = int(action[2:])
+        else:
+            raise ValueError(f"sampling policy line {number}: unknown action {action!r} (keep, drop or 1/N)")
+        if per and rate < 2:
+            raise ValueError(f"sampling policy line {number}: `per` only applies to 1/N")
+        rules.append(Rule(number, words[0], [_condition(w) for w in words[1:-1]], rate, per))
+    return rules
+
+@register("sample")
+class SampleStage(Stage):
+    """Keeps or drops records by a tiered policy and records the rate of 1-in-N rules in the kept ones."""
+
+    @staticmethod
+    def add_arguments(ap):
+        g = ap.add_argument_group("sample stage (also uses --metrics-prefix)")
+        g.add_argument("--sample-policy", metavar="FILE", help="sampling rules, one per line (default: the built-in policy in sampling.py)")
+        g.add_argument("--sample-rate-field", default="SampleRate",
+                       help="field added to records kept by a 1/N rule, holding N (default: SampleRate)")
+
+    def __init__(self, args):
+        super().__init__(args)
+        if args.sample_policy:
+            with open(args.sample_policy) as f:
+                self.rules = parse_policy(f.read())
+        else:
+            self.rules = parse_policy(DEFAULT_POLICY)
+        self.by_dataset = {}  # dataset -> rules that can apply to it, in order
+        self.suffix = {}  # rate -> bytes appended to a kept line
+        self.field = args.sample_rate_field
+        self.records = prom.Counter(f"{args.metrics_prefix}_sample_records_total",
+                                    "Records seen by the sample stage, by dataset, policy rule (line number) and outcome.",
+                                    ("dataset", "rule", "outcome"))
+        self.kept = self.dropped = 0
+
+    def _rules(self, dataset):
+        rules = self.by_dataset.get(dataset)
+        if rules is None:
+            rules = self.by_dataset[dataset] = [r for r in self.rules if r.dataset in (dataset, "*")]
+        return rules
+
+    def process(self, batch):
+        rules = self._rules(batch.dataset)
+        if not rules:
+            return
+        field = self.field
+        lines, records, counts = [], [], {}
+        for line, rec in zip(batch.lines, batch.records):
+            rule = None
+            if rec is not None:
+                rule = next((r for r in rules if r.matches(rec)), None)
+            if rule is None:
+                lines.append(line)
+                records.append(rec)
+                continue
+            kept = rule.keep(rec)
+            key = (rule.number, "kept" if kept else "dropped")
+            counts[key] = counts.get(key, 0) + 1
+            if not kept:
+                continue
+            if rule.rate > 1:
+                prev = rec.get(field)
+                if prev is None and rec:
+                    suffix = self.suffix.get(rule.rate)
+                    if suffix is None:
+                        suffix = self.suffix[rule.rate] = f',"{field}":{rule.rate}}}'.encode()
+                    line = line.rstrip()[:-1] + suffix  # records are JSON objects, so the line ends in }
+                    rec[field] = rule.rate
+                else:
+                    # {} has no field to put a comma after, and already-sampled (re-ingested,
+                    # backfilled) records stand for prev records each: rebuild with the product
+                    rate = prev * rule.rate if isinstance(prev, (int, float)) and not isinstance(prev, bool) else rule.rate
+                    rec[field] = rate
+                    line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")).encode()
+            lines.append(line)
+            records.append(rec)
+        for (number, outcome), n in counts.items():
+            self.records.inc((batch.dataset, number, outcome), n)
+        self.dropped += len(batch.lines) - len(lines)
+        self.kept += len(lines)
+        if len(lines) != len(batch.lines) or any(r.rate > 1 for r in rules):
+            batch.set(lines, records)
+
+    def status(self):
+        total = self.kept + self.dropped
+        return f"sample: {self.kept / total if total else 1:.0%} of records kept"
+
+    def metrics(self):
+        return self.records.render()
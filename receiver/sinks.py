@@ -0,0 +1,489 @@
+"""Record sinks for the Logpush receiver.
+
+A sink receives validated Logpush records in batches:
+
+    await sink.write(dataset, lines, received_ns)
+
+where lines is a list of raw NDJSON records (bytes, no trailing newline) of one
+dataset and received_ns is when the receiver read them. write() may await to
+push back on the receiver; the receiver stops reading request bodies until it
+returns. close() flushes anything buffered.
+
+Sinks are registered by name with @register and built from a `--sink` spec of
+the form `name` or `name:argument`, e.g. `file:logs.ndjson.gz`. A sink's
+add_arguments() adds its own options to the receiver's command line,
+status() is appended to the receiver's periodic throughput line and metrics()
+to its /metrics page.
+"""
+import asyncio, base64, concurrent.futures, gzip, itertools, os, random, struct, sys, time, zlib
+from urllib.parse import urlsplit
+
+import loki_push, prom
+from spool import Spool
+
+SINKS = {}
+
+def register(name):
+    def deco(cls):
+        SINKS[name] = cls
+        return cls
+    return deco
+
+def make_sink(spec, args):
+    """Build a sink from 'name[:argument]'; args is the receiver's argparse namespace."""
+    name, _, arg = spec.partition(":")
+    cls = SINKS.get(name)
+    if cls is None:
+        raise ValueError(f"unknown sink {name!r} (choose from {', '.join(sorted(SINKS))})")
+    return cls(arg, args)
+
+class Sink:
+    def __init__(self, arg, args):
+        self.arg, self.args = arg, args
+
+    @staticmethod
+    def add_arguments(ap):
+        pass
+
+    def status(self):
+        return ""
+
+    def metrics(self):
+        return ""
+
+    async def write(self, dataset, lines, received_ns):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+@register("null")
+class NullSink(Sink):
+    """Drops everything; for measuring the receiver itself."""
+
+    async def write(self, dataset, lines, received_ns):
+        pass
+
+@register("stdout")
+class StdoutSink(Sink):
+    """NDJSON on stdout, one record per line."""
+
+    def __init__(self, arg, args):
+        super().__init__(arg, args)
+        if args.workers > 1:
+            raise ValueError("--workers would interleave records on stdout; use the file, loki or null sink")
+
+    async def write(self, dataset, lines, received_ns):
+        sys.stdout.buffer.write(b"".join(line + b"\n" for line in lines))
+
+    async def close(self):
+        sys.stdout.buffer.flush()
+
+@register("file")
+class FileSink(Sink):
+    """Appends NDJSON to a file, gzipped when the name ends in .gz (file:PATH).
+
+    Under --workers each worker writes its own file, PATH with the worker
+    index before the first dot (logpush.3.ndjson.gz).
+    """
+
+    def __init__(self, arg, args):
+        super().__init__(arg, args)
+        if not arg:
+            raise ValueError("file sink needs a path: file:PATH")
+        if args.workers > 1:
+            head, tail = os.path.split(arg)
+            stem, dot, ext = tail.partition(".")
+            arg = os.path.join(head, f"{stem}.{args.worker}{dot}{ext}")
+        self.f = gzip.open(arg, "ab", compresslevel=1) if arg.endswith(".gz") else open(arg, "ab")
+
+    async def write(self, dataset, lines, received_ns):
+        self.f.write(b"".join(line + b"\n" for line in lines))
+
+    async def close(self):
+        self.f.close()
+
+# ---- Loki -----------------------------------------------------------------------
+
+class _Connection:
+    """One keep-alive HTTP/1.1 connection to the push endpoint."""
+
+    def __init__(self, url, timeout):
+        self.url, self.timeout = url, timeout
+        self.reader = self.writer = None
+
+    async def post(self, body, headers):
+        """-> (status, headers, body); reconnects if the server closed the connection."""
+        if self.writer is None or self.writer.is_closing():
+            u = self.url
+            port = u.port or (443 if u.scheme == "https" else 80)
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(u.hostname, port, ssl=u.scheme == "https" or None), self.timeout)
+        head = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        self.writer.write(f"POST {self.url.path or '/'} HTTP/1.1\r\nHost: {self.url.netloc.rpartition('@')[2]}\r\n"
+                          f"Content-Length: {len(body)}\r\n{head}\r\n".encode() + body)
+        try:
+            return await asyncio.wait_for(self._response(), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _response(self):
+        await self.writer.drain()
+        lines = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                body += await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            body = await self.reader.readexactly(int(headers.get("content-length", "0")))
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+# name, type, help, LokiSink attribute; summed across workers by /metrics
+LOKI_METRICS = [
+    ("pushes_total", "counter", "Pushes Loki accepted.", "pushes"),
+    ("sent_lines_total", "counter", "Lines in pushes Loki accepted.", "sent_lines"),
+    ("sent_bytes_total", "counter", "Compressed bytes of pushes Loki accepted.", "sent_bytes"),
+    ("retries_total", "counter", "Pushes retried after a 429, 5xx or connection error.", "retries"),
+    ("dropped_lines_total", "counter", "Lines dropped after a non-retryable error or running out of retries.", "dropped"),
+    ("pending_lines", "gauge", "Lines in the batch being filled.", "batch_lines"),
+    ("queue_batches", "gauge", "Encoded batches waiting for a sender.", "queued"),
+    ("queue_capacity_batches", "gauge", "Batches the queue holds before write() blocks (--loki-queue).", "queue_capacity"),
+]
+SPOOL_METRICS = [
+    ("spooled_lines_total", "counter", "Lines written to the disk spool.", "spooled"),
+    ("replayed_lines_total", "counter", "Spooled lines Loki has since accepted.", "replayed"),
+    ("spool_bytes", "gauge", "Spool bytes not yet replayed.", "spool_bytes"),
+    ("spool_corrupt_segments_total", "counter", "Spool segments cut short by a bad record.", "spool_corrupt"),
+]
+
+def _encode(streams):
+    return loki_push.snappy_compress(loki_push.encode_push(streams))
+
+_STREAM = struct.Struct("!HI")  # labels bytes, entries
+_ENTRY = struct.Struct("!QI")   # timestamp ns, line bytes
+
+def _spool_record(streams):
+    """A batch of [(labels, [(ts, line)])] as one spool record, timestamps included, zlib level 1."""
+    out = []
+    for labels, entries in streams:
+        lb = labels.encode()
+        out += (_STREAM.pack(len(lb), len(entries)), lb)
+        for ts, line in entries:
+            out += (_ENTRY.pack(ts, len(line)), line)
+    return zlib.compress(b"".join(out), 1)
+
+def _unspool(record):
+    record = zlib.decompress(record)
+    streams, pos = [], 0
+    while pos < len(record):
+        n, count = _STREAM.unpack_from(record, pos)
+        pos += _STREAM.size
+        labels = record[pos:pos + n].decode()
+        pos += n
+        entries = []
+        for _ in range(count):
+            ts, size = _ENTRY.unpack_from(record, pos)
+            pos += _ENTRY.size
+            entries.append((ts, record[pos:pos + size]))
+            pos += size
+        streams.append((labels, entries))
+    return streams
+
+@register("loki")
+class LokiSink(Sink):
+    """Pushes to Loki as snappy-compressed protobuf (loki:URL, e.g. loki:http://loki:3100).
+
+    Records are stamped with the time the receiver read them (as Alloy's
+    loki.source.api does) plus 1 ns per line, so each stream's timestamps only
+    increase. They are grouped into {job, dataset} streams (plus shard, the
+    worker index, under --workers, so each stream has one writer) and
+    collected into one batch until it holds --loki-batch-bytes of lines or its
+    first line is --loki-batch-wait old. Full batches are encoded and queued
+    for --loki-connections sender tasks, each owning one keep-alive connection.
+    When --loki-queue batches are waiting, write() blocks, which stops the
+    receiver reading and pushes back on Logpush.
+
+    429, 5xx and connection errors are retried after a random delay of up to
+    --loki-min-backoff * 2^attempt (capped at --loki-max-backoff, at least any
+    Retry-After) for --loki-retries attempts; other 4xx and exhausted retries
+    drop the batch.
+
+    With --loki-spool DIR, a batch that would wait for a full queue, or whose
+    retries run out, goes to a disk spool (spool.py) instead, so the receiver
+    keeps accepting Logpush at full speed while Loki is down. Once anything is
+    spooled, later batches are spooled behind it to keep their order. One
+    drain task replays the spool oldest first over its own connection,
+    retrying each batch until Loki takes it, at most --loki-spool-rate lines
+    per second. When the spool holds --loki-spool-max-bytes, write() blocks
+    again. A batch is replayed at least once: the drain position survives a
+    restart, but a batch in flight when the receiver stops is sent again.
+    """
+
+    @staticmethod
+    def add_arguments(ap):
+        g = ap.add_argument_group("loki sink")
+        g.add_argument("--loki-job", default="cloudflare-logpush", help="job label of the pushed streams (default: cloudflare-logpush)")
+        g.add_argument("--loki-header", action="append", default=[], metavar="NAME:VALUE", help="extra push header, e.g. X-Scope-OrgID:tenant")
+        g.add_argument("--loki-batch-bytes", type=int, default=1 << 20, help="line bytes per push (default: 1 MiB)")
+        g.add_argument("--loki-batch-wait", type=float, default=1.0, help="max seconds a line waits for its batch to fill (default: 1)")
+        g.add_argument("--loki-queue", type=int, default=8, help="encoded batches waiting to be sent before write() blocks (default: 8)")
+        g.add_argument("--loki-connections", type=int, default=2, help="concurrent keep-alive push connections (default: 2)")
+        g.add_argument("--loki-encoders", type=int, default=0, help="processes encoding batches, 0 = encode in the receiver (default: 0)")
+        g.add_argument("--loki-retries", type=int, default=10, help="attempts per batch before it is dropped (default: 10)")
+        g.add_argument("--loki-min-backoff", type=float, default=0.5, help="first retry delay cap in seconds (default: 0.5)")
+        g.add_argument("--loki-max-backoff", type=float, default=30, help="longest retry delay in seconds (default: 30)")
+        g.add_argument("--loki-timeout", type=float, default=30, help="seconds per push request (default: 30)")
+        g.add_argument("--loki-spool", metavar="DIR", help="spool batches Loki cannot take yet to segment files in DIR")
+        g.add_argument("--loki-spool-max-bytes", type=int, default=10_000_000_000,
+                       help="disk the spool may use before write() blocks (default: 10 GB)")
+        g.add_argument("--loki-spool-segment-bytes", type=int, default=64 << 20, help="bytes per spool segment file (default: 64 MiB)")
+        g.add_argument("--loki-spool-rate", type=float, default=50_000,
+                       help="lines/s the spool is replayed at once Loki is back, 0 = unlimited (default: 50000)")
+
+    def __init__(self, arg, args):
+        super().__init__(arg, args)
+        if not arg:
+            raise ValueError("loki sink needs a URL: loki:http://HOST:3100")
+        url = urlsplit(arg if "://" in arg else "http://" + arg)
+        if url.path in ("", "/"):
+            url = url._replace(path="/loki/api/v1/push")
+        self.url = url
+        self.headers = {"Content-Type": "application/x-protobuf", "User-Agent": "logpush-receiver"}
+        if url.username:
+            auth = f"{url.username}:{url.password or ''}".encode()
+            self.headers["Authorization"] = "Basic " + base64.b64encode(auth).decode()
+        for h in args.loki_header:
+            name, _, value = h.partition(":")
+            self.headers[name.strip()] = value.strip()
+        self.labels = {}
+        self.last_ts = {}
+        self.batch, self.batch_bytes, self.batch_lines, self.batch_started = {}, 0, 0, 0.0
+        self.queue = self.tasks = None
+        self.conns = []
+        self.pool = (concurrent.futures.ProcessPoolExecutor(args.loki_encoders)
+                     if args.loki_encoders > 0 else None)
+        self.sent_lines = self.sent_bytes = self.pushes = self.retries = self.dropped = 0
+        self.spool = None
+        self.spooled = self.replayed = 0
+        self.closing = False
+        self.push_seconds = prom.Histogram(f"{args.metrics_prefix}_loki_push_seconds",
+                                           "Push request latency, by outcome: ok, retryable (429, 5xx, connection error) or rejected.",
+                                           ("outcome",), (.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+        if args.loki_spool:
+            path = args.loki_spool if args.workers == 1 else os.path.join(args.loki_spool, f"shard-{args.worker}")
+            self.spool = Spool(path, args.loki_spool_max_bytes, args.loki_spool_segment_bytes)
+            if self.spool.pending:
+                self._start()  # replay what an earlier run left
+
+    def _start(self):
+        a = self.args
+        self.queue = asyncio.Queue(a.loki_queue)
+        self.conns = [_Connection(self.url, a.loki_timeout) for _ in range(a.loki_connections)]
+        self.tasks = [asyncio.create_task(self._sender(conn)) for conn in self.conns]
+        self.tasks.append(asyncio.create_task(self._ticker()))
+        if self.spool is not None:
+            self.tasks.append(asyncio.create_task(self._drainer()))
+
+    def _stream(self, dataset):
+        labels = self.labels.get(dataset)
+        if labels is None:
+            names = {"job": self.args.loki_job, "dataset": dataset}
+            if self.args.workers > 1:
+                names["shard"] = str(self.args.worker)
+            labels = self.labels[dataset] = loki_push.format_labels(names)
+        return labels
+
+    async def write(self, dataset, lines, received_ns):
+        if self.queue is None:
+            self._start()
+        if not self.batch:
+            self.batch_started = time.monotonic()
+        ts = max(received_ns, self.last_ts.get(dataset, 0) + 1)
+        entries = self.batch.setdefault(self._stream(dataset), [])
+        for line in lines:
+            entries.append((ts, line))
+            ts += 1
+        self.last_ts[dataset] = ts - 1
+        self.batch_bytes += sum(map(len, lines))
+        self.batch_lines += len(lines)
+        if self.batch_bytes >= self.args.loki_batch_bytes:
+            await self._flush()
+
+    async def _flush(self):
+        if not self.batch:
+            return
+        streams, lines = list(self.batch.items()), self.batch_lines
+        self.batch, self.batch_bytes, self.batch_lines = {}, 0, 0
+        if self.spool is not None and (self.spool.pending or self.queue.full()):
+            if self.spool.append(_spool_record(streams)):
+                self.spooled += lines
+                return
+        if self.pool:
+            body = asyncio.get_running_loop().run_in_executor(self.pool, _encode, streams)
+        else:
+            body = _encode(streams)
+        await self.queue.put((body, lines, streams))
+
+    async def _ticker(self):
+        wait = self.args.loki_batch_wait
+        while True:
+            await asyncio.sleep(wait / 4)
+            if self.batch and time.monotonic() - self.batch_started >= wait:
+                await self._flush()
+
+    async def _sender(self, conn):
+        while True:
+            body, lines, streams = await self.queue.get()
+            try:
+                if isinstance(body, asyncio.Future):
+                    body = await body
+                failed = await self._push(conn, body, lines, self.args.loki_retries)
+                if failed:
+                    self._failed(streams, lines, *failed)
+            except Exception as e:  # keep the sender alive whatever one batch does
+                self.dropped += lines
+                print(f"loki: dropped {lines} lines: {e!r}", file=sys.stderr)
+            finally:
+                self.queue.task_done()
+
+    def _failed(self, streams, lines, why, retryable):
+        """Spool a push that failed for a reason retrying can fix, if there is room; else drop it."""
+        if retryable and self.spool is not None and self.spool.append(_spool_record(streams)):
+            self.spooled += lines
+            return
+        self.dropped += lines
+        print(f"loki: dropped {lines} lines {why}", file=sys.stderr)
+
+    async def _drainer(self):
+        """Replay the spool in order over one connection, at most --loki-spool-rate lines/s."""
+        conn = _Connection(self.url, self.args.loki_timeout)
+        rate, next_at = self.args.loki_spool_rate, 0.0
+        while True:
+            record = self.spool.read()
+            if record is None:
+                await asyncio.sleep(0.25)
+                continue
+            streams = _unspool(record)
+            lines = sum(len(entries) for _, entries in streams)
+            if self.pool:
+                body = await asyncio.get_running_loop().run_in_executor(self.pool, _encode, streams)
+            else:
+                body = _encode(streams)
+            failed = await self._push(conn, body, lines, None)
+            if failed and failed[1]:
+                return  # closing; the record stays spooled
+            if failed:
+                self.dropped += lines
+                print(f"loki: dropped {lines} spooled lines {failed[0]}", file=sys.stderr)
+            else:
+                self.replayed += lines
+            self.spool.commit()
+            if rate:
+                now = time.monotonic()
+                next_at = max(next_at, now) + lines / rate
+                await asyncio.sleep(next_at - now)
+
+    async def _push(self, conn, body, lines, attempts):
+        """Send one push; -> None once Loki took it, else (why, retryable). attempts=None retries until it works."""
+        a = self.args
+        for attempt in range(attempts) if attempts else itertools.count():
+            retry_after = 0.0
+            t0 = time.monotonic()
+            try:
+                status, headers, reply = await conn.post(body, self.headers)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+                error = f"{type(e).__name__}: {e}"
+                self.push_seconds.observe(("retryable",), time.monotonic() - t0)
+            else:
+                if 200 <= status < 300:
+                    self.push_seconds.observe(("ok",), time.monotonic() - t0)
+                    self.pushes += 1
+                    self.sent_lines += lines
+                    self.sent_bytes += len(body)
+                    return
+                error = f"HTTP {status}: {reply[:200].decode(errors='replace').strip()}"
+                if status != 429 and status < 500:
+                    self.push_seconds.observe(("rejected",), time.monotonic() - t0)
+                    return f"after {attempt + 1} attempts: {error}", False
+                self.push_seconds.observe(("retryable",), time.monotonic() - t0)
+                try:
+                    retry_after = float(headers.get("retry-after", 0))
+                except ValueError:
+                    pass
+            if self.closing and self.spool is not None:
+                break  # shutting down: spool the batch rather than wait for Loki
+            if attempts is None or attempt + 1 < attempts:
+                self.retries += 1
+                delay = random.uniform(0, min(a.loki_max_backoff, a.loki_min_backoff * 2 ** min(attempt, 30)))
+                await asyncio.sleep(max(delay, retry_after))
+        return f"after {attempt + 1} attempts: {error}", True
+
+    def connection(self):
+        """A keep-alive connection of its own, for send()."""
+        return _Connection(self.url, self.args.loki_timeout)
+
+    async def send(self, conn, body, lines):
+        """Push a batch encoded by the caller (backfill.py) with the sink's retries; -> None once Loki took it, else (why, retryable)."""
+        return await self._push(conn, body, lines, self.args.loki_retries)
+
+    @property
+    def queued(self):
+        return self.queue.qsize() if self.queue else 0
+
+    @property
+    def queue_capacity(self):
+        return self.args.loki_queue
+
+    @property
+    def spool_bytes(self):
+        return self.spool.pending
+
+    @property
+    def spool_corrupt(self):
+        return self.spool.corrupt
+
+    def metrics(self):
+        out = [self.push_seconds.render()]
+        for name, kind, help, attr in LOKI_METRICS + (SPOOL_METRICS if self.spool is not None else []):
+            fam = (prom.Counter if kind == "counter" else prom.Gauge)(f"{self.args.metrics_prefix}_loki_{name}", help)
+            fam.samples[()] = getattr(self, attr)
+            out.append(fam.render())
+        return "".join(out)
+
+    def status(self):
+        queued = self.queued
+        spool = (f", {self.spooled} spooled, {self.replayed} replayed, {self.spool.pending / 1e6:.1f} MB in spool, "
+                 f"{self.spool.corrupt} corrupt segments" if self.spool is not None else "")
+        return (f"loki: {self.pushes} pushes, {self.sent_lines} lines, {self.sent_bytes / 1e6:.1f} MB sent, "
+                f"{queued} queued, {self.retries} retries, {self.dropped} dropped{spool}")
+
+    async def close(self):
+        self.closing = True
+        if self.queue is not None:
+            await self._flush()
+            await self.queue.join()
+            for t in self.tasks:
+                t.cancel()
+            for conn in self.conns:
+                conn.close()
+        if self.pool:
+            self.pool.shutdown()
+        if self.spool is not None:
+            self.spool.close()
@@ -0,0 +1,145 @@
+"""Segmented append-only disk spool, used by the loki sink (--loki-spool DIR).
+
+Usage:
+  python3 logpush_receiver.py --sink loki:http://loki:3100 --loki-spool /var/spool/logpush
+  python3 logpush_receiver.py --sink loki:http://loki:3100 --loki-spool /var/spool/logpush \\
+      --loki-spool-max-bytes 20000000000 --loki-spool-rate 100000
+
+Records are appended to numbered segment files in DIR (0000000000000001.seg,
+...) of at most segment_bytes each, framed as
+
+    payload length (4 bytes) | crc32 of payload (4 bytes) | payload
+
+and read back in order through mmap. read() returns the oldest record not
+yet committed, the same one until commit() is called, so a record is only
+forgotten once the reader is done with it. The committed position is kept
+in DIR/head and a segment is deleted once all its records are committed, so
+a restarted receiver resumes after the last committed record. A record whose
+length or CRC is wrong (a write cut short by a crash) ends its segment: the
+rest of it is skipped and counted in `corrupt`.
+
+Appends always go to a segment the reader is not in; the one being written
+is closed when the reader reaches it. append() refuses a record that would
+take the segments past max_bytes.
+"""
+import mmap, os, struct, sys, zlib
+
+FRAME = struct.Struct("!II")
+
+class Spool:
+    def __init__(self, path, max_bytes, segment_bytes):
+        self.path, self.max_bytes, self.segment_bytes = path, max_bytes, segment_bytes
+        os.makedirs(path, exist_ok=True)
+        self.sizes = {}  # segment number -> bytes, oldest first
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".seg") and name[:-4].isdigit():
+                self.sizes[int(name[:-4])] = os.path.getsize(self._segment(int(name[:-4])))
+        self.head, self.pos = self._load_head()
+        for seq in [s for s in self.sizes if s < self.head]:  # committed, but not deleted before a crash
+            self._remove(seq)
+        self.tail = max(self.sizes, default=0)
+        self.fd = None  # never append to a segment from before a restart; its end may be torn
+        self.map, self.end = None, 0
+        self.pending = sum(self.sizes.values()) - (self.pos if self.head in self.sizes else 0)
+        self.corrupt = 0
+
+    def _segment(self, seq):
+        return os.path.join(self.path, f"{seq:016d}.seg")
+
+    def _load_head(self):
+        try:
+            with open(os.path.join(self.path, "head")) as f:
+                seq, pos = map(int, f.read().split())
+        except (OSError, ValueError):
+            return min(self.sizes, default=0), 0
+        return (seq, pos) if seq in self.sizes else (min(self.sizes, default=0), 0)
+
+    def _save_head(self):
+        tmp = os.path.join(self.path, "head.tmp")
+        with open(tmp, "w") as f:
+            f.write(f"{self.head} {self.pos}\n")
+        os.replace(tmp, os.path.join(self.path, "head"))
+
+    def _remove(self, seq):
+        try:
+            os.remove(self._segment(seq))
+        except FileNotFoundError:
+            pass
+        self.sizes.pop(seq, None)
+
+    def _seal(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    @property
+    def disk_bytes(self):
+        return sum(self.sizes.values())
+
+    def append(self, payload):
+        """Add one record; False if the spool is full."""
+        size = FRAME.size + len(payload)
+        if self.disk_bytes + size > self.max_bytes:
+            return False
+        if self.fd is None or (self.sizes[self.tail] and self.sizes[self.tail] + size > self.segment_bytes):
+            self._seal()
+            self.tail += 1
+            self.fd = os.open(self._segment(self.tail), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self.sizes[self.tail] = 0
+        os.writev(self.fd, [FRAME.pack(len(payload), zlib.crc32(payload)), payload])
+        self.sizes[self.tail] += size
+        self.pending += size
+        return True
+
+    def read(self):
+        """The oldest uncommitted record, or None if there is none."""
+        while self.sizes:
+            if self.map is None:
+                if self.head not in self.sizes:
+                    self.head, self.pos = min(self.sizes), 0
+                if self.head == self.tail:
+                    self._seal()  # caught up with the writer: new records go to a new segment
+                if self.pos >= self.sizes[self.head]:
+                    self._next_segment()
+                    continue
+                with open(self._segment(self.head), "rb") as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            m, pos = self.map, self.pos
+            if pos < len(m):
+                if pos + FRAME.size <= len(m):
+                    n, crc = FRAME.unpack_from(m, pos)
+                    end = pos + FRAME.size + n
+                    if end <= len(m):
+                        payload = m[pos + FRAME.size:end]
+                        if zlib.crc32(payload) == crc:
+                            self.end = end
+                            return payload
+                self.corrupt += 1
+                print(f"spool: {self._segment(self.head)} is corrupt at byte {pos}, skipping {len(m) - pos} bytes",
+                      file=sys.stderr)
+            self._next_segment()
+        return None
+
+    def commit(self):
+        """Forget the record read() returned."""
+        self.pending -= self.end - self.pos
+        self.pos = self.end
+        self._save_head()
+
+    def _next_segment(self):
+        """Delete the head segment, whose records are all committed (or unreadable)."""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.pending -= self.sizes[self.head] - self.pos
+        self._remove(self.head)
+        self.pos = 0
+        if self.sizes:
+            self.head = min(self.sizes)
+            self._save_head()
+
+    def close(self):
+        self._seal()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
@@ -0,0 +1,145 @@
+"""Processing stages between the Logpush receiver and its sink.
+
+A stage sees every batch of validated records before the sink does:
+
+    stage.process(batch)
+
+batch.lines holds the raw NDJSON records (bytes) of one dataset and
+batch.records the same records decoded, parsed once on first use and shared
+by every stage (None for a line that is not valid JSON). A stage that
+rewrites or drops records replaces both with batch.set(). State that must
+only change once the sink has taken the batch (say, remembering records as
+delivered) goes in a callback added with batch.after_write(). Stages run in the
+order given by --stages=a,b and are registered by name with @register, like
+sinks. add_arguments() adds a stage's own options to the receiver's command
+line, status() is appended to the periodic throughput line and metrics()
+to the receiver's /metrics page.
+"""
+import json
+
+STAGES = {}
+
+def register(name):
+    def deco(cls):
+        STAGES[name] = cls
+        return cls
+    return deco
+
+def make_stages(spec, args):
+    """Build the stages named in a comma-separated spec, in order."""
+    names = [n for n in (spec or "").split(",") if n]
+    unknown = [n for n in names if n not in STAGES]
+    if unknown:
+        raise ValueError(f"unknown stage(s) {', '.join(unknown)} (choose from {', '.join(sorted(STAGES))})")
+    return [STAGES[n](args) for n in names]
+
+def _decode(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+class Batch:
+    __slots__ = ("dataset", "lines", "_records", "callbacks")
+
+    def __init__(self, dataset, lines):
+        self.dataset, self.lines, self._records = dataset, lines, None
+        self.callbacks = []
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = [_decode(line) for line in self.lines]
+        return self._records
+
+    def set(self, lines, records=None):
+        """Replace the batch contents; records, if given, must match lines one to one."""
+        self.lines, self._records = lines, records
+
+    def after_write(self, fn):
+        """Call fn() once the sink has accepted the batch; not at all if the write fails."""
+        self.callbacks.append(fn)
+
+class Stage:
+    def __init__(self, args):
+        self.args = args
+
+    @staticmethod
+    def add_arguments(ap):
+        pass
+
+    def process(self, batch):
+        raise NotImplementedError
+
+    def status(self):
+        return ""
+
+    def metrics(self):
+        return ""
+
+# ---- Field projection -----------------------------------------------------------
+
+@register("project")
+class ProjectStage(Stage):
+    """Strips every field the dashboard does not read (--fields manifest) except --keep-fields.
+
+    The manifest is what `gen-cloudflare-logpush.py --manifest` writes. A
+    top-level field is kept when the manifest names it, or names a label Loki's
+    `| json` flattens out of it (`Field_sub`). Datasets the manifest does not
+    list, and records that are not valid JSON, pass through unchanged.
+    """
+
+    @staticmethod
+    def add_arguments(ap):
+        g = ap.add_argument_group("project stage")
+        g.add_argument("--fields", metavar="MANIFEST", help="field manifest from gen-cloudflare-logpush.py --manifest")
+        g.add_argument("--keep-fields", default="RayID,EdgeStartTimestamp,Datetime,EventTimestampMs",
+                       help="fields kept even if no panel reads them (default: RayID and the timestamp fields)")
+
+    def __init__(self, args):
+        super().__init__(args)
+        if not args.fields:
+            raise ValueError("the project stage needs --fields MANIFEST")
+        with open(args.fields) as f:
+            manifest = json.load(f)
+        keep = {k for k in args.keep_fields.split(",") if k} | {"_dataset"}
+        self.fields = {d: set(fields) | keep for d, fields in manifest["datasets"].items()}
+        self.decisions = {d: {} for d in self.fields}  # per dataset: field -> kept?
+        self.bytes_in = self.bytes_out = self.unparsed = 0
+
+    def _keep(self, dataset, key):
+        fields = self.fields[dataset]
+        kept = key in fields or any(f.startswith(key + "_") for f in fields)
+        self.decisions[dataset][key] = kept
+        return kept
+
+    def process(self, batch):
+        dataset = batch.dataset
+        decisions = self.decisions.get(dataset)
+        if decisions is None:
+            return
+        get = decisions.get
+        lines, records = [], []
+        for line, rec in zip(batch.lines, batch.records):
+            if rec is None:
+                self.unparsed += 1
+                lines.append(line)
+                records.append(rec)
+                continue
+            kept = {}
+            for k, v in rec.items():
+                keep = get(k)
+                if keep is None:
+                    keep = self._keep(dataset, k)
+                if keep:
+                    kept[k] = v
+            projected = json.dumps(kept, ensure_ascii=False, separators=(",", ":")).encode()
+            self.bytes_in += len(line)
+            self.bytes_out += len(projected)
+            lines.append(projected)
+            records.append(kept)
+        batch.set(lines, records)
+
+    def status(self):
+        ratio = self.bytes_out / self.bytes_in if self.bytes_in else 1
+        return f"project: {ratio:.0%} of bytes kept, {self.unparsed} unparsed"
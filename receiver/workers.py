@@ -0,0 +1,185 @@
+"""Multi-process mode for the Logpush receiver (--workers N).
+
+Usage:
+  python3 logpush_receiver.py --workers 4 --sink loki:http://loki:3100
+  python3 logpush_receiver.py --workers 8 --stages dedup,metrics,topk --sink loki:http://loki:3100
+  python3 logpush_receiver.py --workers 8 --shard-by client --loki-encoders 4 --sink loki:http://loki:3100
+
+One process tops out on inflating gzip and handling JSON long before the
+network does. With --workers N the receiver forks N processes that each bind
+--listen with SO_REUSEPORT, so the kernel spreads Logpush's connections over
+them, and each inflates, splits and checks the bodies it reads.
+
+Records are then sharded: every (dataset, key) pair belongs to one worker,
+crc32(dataset, key) % N, and batches for another worker are handed to it
+over a Unix socket pair; the owner runs the stages and the sink. The loki
+sink adds a `shard` stream label, so each stream has a single writer and its
+timestamps still only increase. --shard-by picks the key:
+
+  zone    ZoneName for http_requests, ClientRequestHost for firewall_events
+          (the field the dashboard's $zone filters), ScriptName for
+          workers_trace_events. A zone's dedup filter, top-K summaries and
+          HyperLogLog sketches live in one process, so every stage is exact,
+          but one busy zone's stage and sink work lands on one worker.
+  client  ClientIP (ScriptName for workers_trace_events). Spreads one zone
+          over all workers; dedup, metrics, distinct IPs and top IPs stay
+          exact, while top-K of other fields becomes a sum of per-worker
+          top-Ks and distinct JA4s and ASNs are overcounted.
+
+GET /metrics on any worker collects and merges every worker's families
+(prom.merge) and adds per-worker throughput counters, so one scrape target
+covers them all. A worker that exits takes the others down with it.
+"""
+import asyncio, collections, os, signal, socket, struct, sys, traceback, zlib
+
+# ---- Sharding ---------------------------------------------------------------------
+
+SHARD_FIELDS = {
+    "zone": {"http_requests": b'"ZoneName":"', "firewall_events": b'"ClientRequestHost":"',
+             "workers_trace_events": b'"ScriptName":"'},
+    "client": {"http_requests": b'"ClientIP":"', "firewall_events": b'"ClientIP":"',
+               "workers_trace_events": b'"ScriptName":"'},
+}
+
+def sharder(n, by="zone"):
+    """-> shard(dataset, line), the index of the worker owning the line's dataset and --shard-by key."""
+    fields, seeds, owners = SHARD_FIELDS[by], {}, {}
+
+    def shard(dataset, line):
+        key = fields.get(dataset)
+        value = b""
+        if key is not None:
+            i = line.find(key)
+            if i >= 0:
+                i += len(key)
+                value = line[i:line.find(b'"', i)]
+        owner = owners.get((dataset, value))
+        if owner is None:
+            seed = seeds.get(dataset)
+            if seed is None:
+                seed = seeds[dataset] = zlib.crc32(dataset.encode() + b"\n")
+            owner = zlib.crc32(value, seed) % n
+            if len(owners) < 100_000:
+                owners[(dataset, value)] = owner
+        return owner
+    return shard
+
+# ---- Peer channels ----------------------------------------------------------------
+
+HEADER = struct.Struct("!cIQ")  # frame kind, payload bytes, received_ns
+
+class Peer:
+    """Framed channel to one other worker over its end of a Unix socket pair.
+
+    A `B` frame carries a batch for the peer to process (dataset, then the
+    lines, newline-separated), `Q` asks for the peer's metrics and `M` answers
+    it. Answers come back in the order the questions were asked.
+    """
+
+    def __init__(self, index, sock):
+        self.index, self.sock = index, sock
+        self.reader = self.writer = None
+        self.waiting = collections.deque()
+
+    async def start(self, receiver):
+        self.reader, self.writer = await asyncio.open_unix_connection(sock=self.sock)
+        return asyncio.create_task(self._serve(receiver))
+
+    def _frame(self, kind, payload, received_ns=0):
+        self.writer.write(HEADER.pack(kind, len(payload), received_ns))
+        self.writer.write(payload)
+
+    async def send(self, dataset, lines, received_ns):
+        self._frame(b"B", dataset.encode() + b"\n" + b"\n".join(lines), received_ns)
+        await self.writer.drain()
+
+    async def metrics(self):
+        fut = asyncio.get_running_loop().create_future()
+        self.waiting.append(fut)
+        self._frame(b"Q", b"")
+        return await fut
+
+    def close(self):
+        """No more batches from this side; the peer's reader sees EOF."""
+        if self.writer.can_write_eof() and not self.writer.is_closing():
+            self.writer.write_eof()
+
+    async def _serve(self, receiver):
+        try:
+            while True:
+                kind, size, received_ns = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+                payload = await self.reader.readexactly(size)
+                if kind == b"B":
+                    dataset, _, body = payload.partition(b"\n")
+                    await receiver.process(dataset.decode(), body.split(b"\n"), received_ns)
+                elif kind == b"Q":
+                    self._frame(b"M", receiver.local_metrics().encode())
+                elif self.waiting:
+                    self.waiting.popleft().set_result(payload.decode())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            while self.waiting:
+                self.waiting.popleft().set_exception(ConnectionError(f"worker {self.index} is gone"))
+
+# ---- Supervisor -------------------------------------------------------------------
+
+def run(args, serve):
+    """Fork args.workers processes running serve(args, index, {peer index: socket}); -> exit status."""
+    n = args.workers
+    pairs = {(i, j): socket.socketpair() for i in range(n) for j in range(i + 1, n)}
+    children = {}
+    for index in range(n):
+        pid = os.fork()
+        if pid == 0:
+            peers = {}
+            for (i, j), (a, b) in pairs.items():
+                if index in (i, j):
+                    mine, other = (a, b) if index == i else (b, a)
+                    peers[j if index == i else i] = mine
+                    other.close()
+                else:
+                    a.close()
+                    b.close()
+            status = 0
+            try:
+                asyncio.run(serve(args, index, peers))
+            except ValueError as e:
+                print(f"error: {e}", file=sys.stderr)
+                status = 2
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stderr.flush()
+                os._exit(status)
+        children[pid] = index
+    for a, b in pairs.values():
+        a.close()
+        b.close()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"{n} workers listening on {args.listen}", file=sys.stderr)
+    status = 0
+    while children:
+        pid, wait_status = os.wait()
+        index = children.pop(pid)
+        if not stopping:  # one worker gone leaves its shards unowned
+            code = os.waitstatus_to_exitcode(wait_status)
+            print(f"worker {index} exited with status {code}, stopping the others", file=sys.stderr)
+            status = code if code > 0 else 1
+            stop(None, None)
+    return status
@@ -0,0 +1,126 @@
+"""Read generated dashboard JSON the way Grafana does when it runs the queries.
+
+Shared by the offline tools: walks panels/targets (including panels nested in
+collapsed rows), resolves template variables from their current values, and
+expands Grafana's interval macros ($__range, $__auto, $__interval,
+$__rate_interval) for a given time range and step.
+"""
+import re
+
+_UNITS = {"ns": 1, "us": 1_000, "µs": 1_000, "ms": 1_000_000, "s": 1_000_000_000, "m": 60_000_000_000,
+          "h": 3_600_000_000_000, "d": 86_400_000_000_000, "w": 604_800_000_000_000, "y": 31_536_000_000_000_000}
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h|d|w|y)")
+
+def parse_duration(text):
+    """'1h30m' / '500ms' / '21600s' -> nanoseconds."""
+    text = text.strip()
+    pos, total = 0, 0
+    for m in _DURATION.finditer(text):
+        if m.start() != pos:
+            break
+        total += int(float(m.group(1)) * _UNITS[m.group(2)])
+        pos = m.end()
+    if pos != len(text) or not text:
+        raise ValueError(f"bad duration {text!r}")
+    return total
+
+def format_duration(ns):
+    """Nanoseconds -> the shortest exact form Loki/Prometheus accept ('5m', '90s', '250ms')."""
+    for unit in ("d", "h", "m", "s", "ms"):
+        if ns % _UNITS[unit] == 0 and ns >= _UNITS[unit]:
+            return f"{ns // _UNITS[unit]}{unit}"
+    return f"{max(1, ns // 1_000_000)}ms"
+
+# Grafana's kbn.roundInterval(): raw interval (ms) upper bound -> rounded interval (ms)
+_ROUND = [(10, 1), (15, 10), (35, 20), (75, 50), (150, 100), (350, 200), (750, 500), (1500, 1000),
+          (3500, 2000), (7500, 5000), (12500, 10000), (17500, 15000), (25000, 20000), (45000, 30000),
+          (90000, 60000), (210000, 120000), (450000, 300000), (1050000, 900000), (1500000, 1200000),
+          (2700000, 1800000), (5400000, 3600000), (9000000, 7200000), (16200000, 10800000),
+          (24300000, 21600000), (64800000, 43200000), (129600000, 86400000), (604800000, 86400000),
+          (1814400000, 604800000), (3628800000, 2592000000)]
+
+def grafana_interval(start_ns, end_ns, max_points, min_interval_ns=0):
+    """The step Grafana picks for a panel: (range / max data points), rounded, at least min_interval."""
+    raw_ms = (end_ns - start_ns) / 1_000_000 / max(1, max_points)
+    step_ms = next((r for bound, r in _ROUND if raw_ms <= bound), 31536000000)
+    return max(step_ms * 1_000_000, min_interval_ns)
+
+def panel_max_points(panel, screen_width=1800):
+    """Grafana uses the panel's pixel width as maxDataPoints unless the panel sets it."""
+    return panel.get("maxDataPoints") or max(1, int(panel.get("gridPos", {}).get("w", 24) * screen_width / 24))
+
+def iter_targets(dashboard):
+    """Yield (row, panel, target) for every query target; row is None above the first row.
+
+    Targets that reuse another panel's results (-- Dashboard -- datasource) and
+    hidden targets are skipped, as Grafana does not send them to the datasource.
+    """
+    row = None
+    for p in dashboard.get("panels", []):
+        if p.get("type") == "row":
+            row = p
+            children = p.get("panels", [])
+        else:
+            children = [p]
+        for panel in children:
+            ds = panel.get("datasource") or {}
+            if ds.get("uid") == "-- Dashboard --":
+                continue
+            for t in panel.get("targets", []):
+                if t.get("expr") and not t.get("hide"):
+                    yield row, panel, t
+
+def is_instant(target):
+    return bool(target.get("instant")) or target.get("queryType") == "instant"
+
+def _regex_escape(value):
+    # Doubled backslash: the value lands inside a double-quoted query string
+    return re.sub(r"([\\^$.|?*+()\[\]{}])", r"\\\\\1", value)
+
+def variable_values(dashboard, overrides=None):
+    """Current value of every template variable, formatted for a Loki/Prometheus query.
+
+    overrides maps name -> value or list of values (e.g. from --var zone=a.com).
+    Multi-value and All selections of custom variables become regex
+    alternations, like Grafana's default formatting for these datasources.
+    """
+    values = {}
+    overrides = overrides or {}
+    for var in dashboard.get("templating", {}).get("list", []):
+        name = var["name"]
+        regex = bool(var.get("multi") or var.get("includeAll"))
+        current = overrides.get(name, (var.get("current") or {}).get("value", ""))
+        if regex and isinstance(current, str):
+            current = current.split(",")
+        if current in ("$__all", ["$__all"]):
+            if var.get("allValue") is not None:
+                values[name] = var["allValue"]
+                continue
+            current = [o["value"] for o in var.get("options", []) if o.get("value") != "$__all"]
+        if isinstance(current, list):
+            escaped = [_regex_escape(str(v)) for v in current]
+            values[name] = escaped[0] if len(escaped) == 1 else "(" + "|".join(escaped) + ")"
+        else:
+            values[name] = str(current)
+    return values
+
+def interpolate(expr, values, start_ns, end_ns, step_ns, instant=False, scrape_interval_ns=15_000_000_000):
+    """Expand template variables and Grafana macros in expr."""
+    rng = end_ns - start_ns
+    macros = {
+        "__range": format_duration(rng),
+        "__range_s": str(rng // 1_000_000_000),
+        "__range_ms": str(rng // 1_000_000),
+        "__interval": format_duration(step_ns),
+        "__interval_ms": str(step_ns // 1_000_000),
+        # Loki resolves $__auto to the step for range queries and to $__range for instant ones
+        "__auto": format_duration(rng if instant else step_ns),
+        "__rate_interval": format_duration(max(step_ns + scrape_interval_ns, 4 * scrape_interval_ns)),
+    }
+    lookup = {**values, **macros}
+
+    def sub(m):
+        name = m.group(1) or m.group(2) or m.group(3)
+        return lookup.get(name, m.group(0))
+
+    return re.sub(r"\$\{(\w+)(?::\w+)?\}|\[\[(\w+)\]\]|\$(\w+)", sub, expr)
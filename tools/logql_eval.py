@@ -0,0 +1,877 @@
+#!/usr/bin/env python3
+"""Offline evaluator for the LogQL subset the Logpush dashboard uses.
+
+Usage:
+  python3 logql_eval.py logs/*.ndjson.gz --query 'sum(count_over_time({job="cloudflare-logpush", dataset="http_requests"} [5m]))' --step 1m
+  python3 logql_eval.py logs/*.ndjson.gz --query '...' --instant
+  python3 logql_eval.py logs/*.ndjson.gz --dashboard ../dashboards/cloudflare-logpush.json --var host=www.example.com
+  python3 logql_eval.py synth.ndjson --dashboard ../dashboards/cloudflare-logpush.json --max-rss 1200  # memory gate
+
+Input is Logpush NDJSON (plain or gzipped) with the `_dataset` record prefix
+from the README. Every line belongs to the stream {job="cloudflare-logpush",
+dataset="<_dataset>"} and is timestamped from the dataset's timestamp field
+(EdgeStartTimestamp, Datetime, EventTimestampMs). Loki uses ingest time instead,
+so results match Loki only when ingestion kept up with Logpush.
+
+Supported: stream selectors, line filters, `| json [fields]`, label filters
+(string and numeric), `| label_format x="{{ subf .a .b }}"`, `| unwrap`,
+count/sum/avg/min/max/quantile_over_time, rate, bytes_over_time/bytes_rate,
+sum/avg/min/max/count [by|without], topk/bottomk/approx_topk (evaluated
+exactly), vector(), and arithmetic/comparison between vectors and scalars.
+
+All queries are fed from a single pass over the files. Lines are bucketed per
+series into step-aligned windows (width = gcd(range, step)) as they stream
+past, and each step's range window is folded from those partial aggregates, so
+memory grows with the buckets a series actually has rather than with lines.
+Results stay sparse ({step index: value} per series) through aggregation and
+binary operators, so a series only costs the steps whose window it touches.
+Leaves with the same pipeline extract labels once per line and share series
+keys, and leaves that differ only in the quantile share one bucket store. An
+aggregation folds a range function's series one at a time instead of holding
+its whole matrix. A `sum by (...)` of a count/sum/rate is pushed down into the scan and
+keyed by the grouping labels directly.
+"""
+import argparse, bisect, calendar, gzip, json, math, os, re, resource, sys, time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "generators"))
+import query_ir
+from query_ir import (BinOp, Call, Json, LabelFilter, LabelFormat, LineFilter, Literal, LogQuery, LogRange,
+                      Paren, QueryError, Unwrap, VectorAgg)
+import dashboard_json
+
+JOB = "cloudflare-logpush"
+TS_FIELDS = {"http_requests": "EdgeStartTimestamp", "firewall_events": "Datetime",
+             "workers_trace_events": "EventTimestampMs"}
+
+# ---- Input ----------------------------------------------------------------
+
+_RFC3339 = re.compile(r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?$")
+
+def parse_timestamp(value):
+    """RFC 3339 string or unix s/ms/us/ns number -> nanoseconds."""
+    if isinstance(value, str):
+        m = _RFC3339.match(value)
+        if not m:
+            return parse_timestamp(float(value))
+        y, mo, d, h, mi, s, frac, tz = m.groups()
+        secs = calendar.timegm((int(y), int(mo), int(d), int(h), int(mi), int(s)))
+        if tz and tz != "Z":
+            sign = 1 if tz[0] == "+" else -1
+            secs -= sign * (int(tz[1:3]) * 3600 + int(tz[-2:]) * 60)
+        return secs * 1_000_000_000 + (int((frac or "0")[:9].ljust(9, "0")))
+    v = float(value)
+    for limit, scale in ((1e17, 1), (1e14, 1_000), (1e11, 1_000_000)):
+        if v >= limit:
+            return int(v * scale)
+    return int(v * 1_000_000_000)
+
+def _field_token(raw, field):
+    """Value of a top-level JSON field straight from the raw bytes (no full decode)."""
+    i = raw.find(b'"' + field + b'":')
+    if i < 0:
+        return None
+    j = i + len(field) + 3
+    if raw[j:j + 1] == b'"':
+        return raw[j + 1:raw.index(b'"', j + 1)].decode()
+    k = j
+    while k < len(raw) and raw[k:k + 1] not in b",}":
+        k += 1
+    return raw[j:k].decode().strip()
+
+class LogpushFiles:
+    """Logpush NDJSON files as (ts_ns, stream labels, raw line) entries."""
+
+    def __init__(self, paths, job=JOB):
+        self.paths = paths
+        self.job = job
+        self._streams = {}
+        self._ts_fields = {ds: f.encode() for ds, f in TS_FIELDS.items()}
+
+    def _stream(self, dataset):
+        if dataset not in self._streams:
+            self._streams[dataset] = {"job": self.job, "dataset": dataset} if dataset else {"job": self.job}
+        return self._streams[dataset]
+
+    def __iter__(self):
+        for path in self.paths:
+            with open(path, "rb") as f:
+                gz = f.read(2) == b"\x1f\x8b"
+            with (gzip.open(path, "rb") if gz else open(path, "rb")) as f:
+                for raw in f:
+                    raw = raw.rstrip(b"\r\n")
+                    if not raw:
+                        continue
+                    dataset = ""
+                    if raw.startswith(b'{"_dataset":"'):
+                        dataset = raw[13:raw.index(b'"', 13)].decode()
+                    field = self._ts_fields.get(dataset)
+                    token = _field_token(raw, field) if field else None
+                    if token is None:
+                        rec = json.loads(raw)
+                        token = next((rec[f] for f in TS_FIELDS.values() if f in rec), None)
+                        if token is None:
+                            continue
+                    yield parse_timestamp(token), self._stream(dataset), raw
+
+def time_bounds(source):
+    lo = hi = None
+    for ts, _, _ in source:
+        lo = ts if lo is None or ts < lo else lo
+        hi = ts if hi is None or ts > hi else hi
+    return lo, hi
+
+# ---- Pipeline -------------------------------------------------------------
+
+def _label_value(v):
+    if isinstance(v, str):
+        return v
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, separators=(",", ":"))
+    return str(v)
+
+def _flatten(rec, prefix=""):
+    for k, v in rec.items():
+        if isinstance(v, dict):
+            yield from _flatten(v, f"{prefix}{k}_")
+        elif v is not None:
+            yield prefix + k, _label_value(v)
+
+def format_value(v):
+    """Go strconv.FormatFloat(v, 'f', -1, 64), as Loki renders sample values."""
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return format(Decimal(repr(v)), "f")
+
+def _to_float(s):
+    try:
+        return float(s) if s != "" else 0.0
+    except ValueError:
+        return 0.0
+
+_TEMPLATE_FUNCS = {"subf": lambda a, b: a - b, "addf": lambda a, b: a + b, "mulf": lambda a, b: a * b,
+                   "divf": lambda a, b: a / b if b else math.inf,
+                   "sub": lambda a, b: int(a) - int(b), "add": lambda a, b: int(a) + int(b),
+                   "mul": lambda a, b: int(a) * int(b), "div": lambda a, b: int(a) // int(b) if int(b) else 0}
+
+def compile_template(text):
+    """label_format templates: literal text plus {{ .label }}, {{ fn .a .b }} and {{ or .a "default" }} actions."""
+    parts = []
+    pos = 0
+    for m in re.finditer(r"\{\{-?\s*(.*?)\s*-?\}\}", text):
+        if m.start() > pos:
+            parts.append(text[pos:m.start()])
+        words = m.group(1).split()
+        if len(words) == 1 and words[0].startswith("."):
+            name = words[0][1:]
+            parts.append(lambda labels, name=name: labels.get(name, ""))
+        elif words and words[0] in _TEMPLATE_FUNCS:
+            fn = _TEMPLATE_FUNCS[words[0]]
+            args = [(lambda labels, n=w[1:]: _to_float(labels.get(n, ""))) if w.startswith(".")
+                    else (lambda labels, c=float(w): c) for w in words[1:]]
+
+            def call(labels, fn=fn, args=args):
+                v = fn(*(a(labels) for a in args))
+                return format_value(v) if isinstance(v, float) else str(v)
+            parts.append(call)
+        elif len(words) > 1 and words[0] == "or":  # first non-empty argument
+            args = [(lambda labels, n=w[1:]: labels.get(n, "")) if w.startswith(".")
+                    else (lambda labels, c=w.strip('"`'): c) for w in words[1:]]
+            parts.append(lambda labels, args=args: next((v for v in (a(labels) for a in args) if v), args[-1](labels)))
+        else:
+            raise QueryError(f"unsupported label_format template {text!r}")
+        pos = m.end()
+    if pos < len(text):
+        parts.append(text[pos:])
+    return lambda labels: "".join(p if isinstance(p, str) else p(labels) for p in parts)
+
+_NUMERIC_OPS = {"==": lambda a, b: a == b, "=": lambda a, b: a == b, "!=": lambda a, b: a != b,
+                ">": lambda a, b: a > b, ">=": lambda a, b: a >= b, "<": lambda a, b: a < b, "<=": lambda a, b: a <= b}
+
+def _string_matcher(op, value):
+    if op == "=":
+        return lambda s: s == value
+    if op == "!=":
+        return lambda s: s != value
+    rx = re.compile(value)
+    if op == "=~":
+        return lambda s: rx.fullmatch(s) is not None
+    return lambda s: rx.fullmatch(s) is None
+
+def _line_matcher(op, value):
+    if op == "|=":
+        return lambda s: value in s
+    if op == "!=":
+        return lambda s: value not in s
+    rx = re.compile(value)
+    if op == "|~":
+        return lambda s: rx.search(s) is not None
+    return lambda s: rx.search(s) is None
+
+class _Line:
+    """Per-line lazy decode shared by every query the line is fed to."""
+    __slots__ = ("raw", "_text", "_rec")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._text = self._rec = None
+
+    def text(self):
+        if self._text is None:
+            self._text = self.raw.decode("utf-8", "replace")
+        return self._text
+
+    def rec(self):
+        if self._rec is None:
+            try:
+                self._rec = json.loads(self.raw)
+            except ValueError:
+                self._rec = False
+        return self._rec
+
+class _Pipeline:
+    """A stream selector plus pipeline, compiled to closures.
+
+    run() is memoized on the last line, so leaves that share a pipeline (run()
+    dedupes them by rendered text) extract labels and build series keys once.
+    """
+
+    def __init__(self, query):
+        self.text = query.render()
+        self.matchers = [(m.name, _string_matcher(m.op, m.value)) for m in query.selector.matchers]
+        self.stages = []
+        self.unwrap = None
+        for s in query.stages:
+            if isinstance(s, LineFilter):
+                self.stages.append(("line", _line_matcher(s.op, s.value)))
+            elif isinstance(s, Json):
+                self.stages.append(("json", list(s.fields)))
+            elif isinstance(s, LabelFilter):
+                if s.quote:
+                    self.stages.append(("label", s.name, _string_matcher(s.op, s.value)))
+                else:
+                    self.stages.append(("number", s.name, _NUMERIC_OPS[s.op], float(s.value)))
+            elif isinstance(s, LabelFormat):
+                self.stages.append(("format", s.name, compile_template(s.template)))
+            elif isinstance(s, Unwrap):
+                self.stages.append(("unwrap", s.name))
+                self.unwrap = s.name
+            else:
+                raise QueryError(f"unsupported stage {s.render()!r}")
+        self.failed = False  # the last line hit a pipeline error
+        self.pairs = {}  # interned (label, value) pairs; run() shares one dict between pipelines
+        self._line = self._out = self._key = None
+
+    def selects(self, stream):
+        return all(m(stream.get(name, "")) for name, m in self.matchers)
+
+    def run(self, stream, line):
+        """Return (labels, value) for a line that passes, else None."""
+        if line is not self._line:
+            self._line, self._key = line, None
+            self.failed = False
+            self._out = self._run(stream, line)
+        return self._out
+
+    def key(self):
+        """Series key of the last line run() passed, built once per line."""
+        if self._key is None:
+            pairs = self.pairs
+            self._key = tuple([pairs.setdefault(p, p) for p in sorted(self._out[0].items())])
+        return self._key
+
+    def _run(self, stream, line):
+        labels = stream
+        value = 1.0
+        for stage in self.stages:
+            kind = stage[0]
+            if kind == "line":
+                if not stage[1](line.text()):
+                    return None
+            elif kind == "json":
+                rec = line.rec()
+                if rec is False:
+                    self.failed = True
+                    return None
+                labels = dict(labels) if labels is stream else labels
+                if stage[1]:
+                    for f in stage[1]:
+                        v = rec.get(f)
+                        if v is not None:
+                            labels[f + "_extracted" if f in stream else f] = _label_value(v)
+                else:
+                    for k, v in _flatten(rec):
+                        labels[k + "_extracted" if k in stream else k] = v
+            elif kind == "label":
+                if not stage[2](labels.get(stage[1], "")):
+                    return None
+            elif kind == "number":
+                v = labels.get(stage[1])
+                if v is None:
+                    return None
+                try:
+                    if not stage[2](float(v), stage[3]):
+                        return None
+                except ValueError:
+                    self.failed = True  # Loki would fail the query with a LabelFilterErr
+                    return None
+            elif kind == "format":
+                labels = dict(labels) if labels is stream else labels
+                labels[stage[1]] = stage[2](labels)
+            elif kind == "unwrap":
+                labels = dict(labels) if labels is stream else labels
+                try:
+                    value = float(labels.pop(stage[1]))
+                except (KeyError, ValueError):
+                    self.failed = True  # SampleExtractionErr in Loki
+                    return None
+        return labels, value
+
+# ---- Range aggregation ------------------------------------------------------
+
+_COUNT_FUNCS = {"count_over_time", "rate"}
+_LINEAR = {"count_over_time", "rate", "sum_over_time", "bytes_over_time", "bytes_rate"}
+_RANGE_FUNCS = _LINEAR | {"avg_over_time", "min_over_time", "max_over_time", "quantile_over_time"}
+
+def quantile(q, values):
+    """Prometheus-style quantile with linear interpolation between ranks."""
+    if q < 0:
+        return -math.inf
+    if q > 1:
+        return math.inf
+    values = sorted(values)
+    rank = q * (len(values) - 1)
+    lo = int(rank)
+    hi = min(lo + 1, len(values) - 1)
+    w = rank - lo
+    return values[lo] * (1 - w) + values[hi] * w
+
+class _RangeLeaf:
+    """One range aggregation over a log range: the unit the scan feeds."""
+
+    def __init__(self, call, grid):
+        rng = call.range_arg()
+        if call.func not in _RANGE_FUNCS or not isinstance(rng, LogRange):
+            raise QueryError(f"unsupported range aggregation {call.func}")
+        self.func = call.func
+        self.param = float(call.args[0].render()) if call.func == "quantile_over_time" else None
+        self.pipe = _Pipeline(rng.query)
+        if self.pipe.unwrap is None and call.func not in _COUNT_FUNCS | {"bytes_over_time", "bytes_rate"}:
+            raise QueryError(f"{call.func} needs | unwrap")
+        self.range_ns = dashboard_json.parse_duration(rng.range)
+        offset = dashboard_json.parse_duration(rng.offset) if rng.offset else 0
+        self.steps, self.step_ns = grid
+        self.g = math.gcd(self.range_ns, self.step_ns)
+        self.origin = self.steps[0] - offset - self.range_ns
+        self.end = self.steps[-1] - offset
+        self.group = None  # grouping labels when a sum by (...) is pushed down
+        self.series = {}
+        self.shared = False  # series is another leaf's, which fills it
+        self.lines = self.bytes = self.post_filter = self.errors = 0
+        self.elapsed = 0.0
+
+    def layout(self):
+        """Leaves with equal layouts fill identical buckets (quantile_over_time keeps raw values for any q)."""
+        return (self.pipe.text, self.func, self.range_ns, self.origin, self.end, self.g,
+                None if self.group is None else tuple(self.group))
+
+    def feed(self, ts, stream, line):
+        if not self.origin < ts <= self.end:
+            return
+        self.lines += 1
+        self.bytes += len(line.raw)
+        out = self.pipe.run(stream, line)
+        if out is None:
+            self.errors += self.pipe.failed
+            return
+        self.post_filter += 1
+        if self.shared:
+            return
+        labels, value = out
+        if self.group is not None:
+            key = tuple(labels.get(g, "") for g in self.group)
+        else:
+            key = self.pipe.key()
+        buckets = self.series.get(key)
+        if buckets is None:
+            buckets = self.series[key] = {}
+        b = (ts - self.origin - 1) // self.g
+        func = self.func
+        if func in _COUNT_FUNCS and self.pipe.unwrap is None:
+            buckets[b] = buckets.get(b, 0) + 1
+        elif func in ("bytes_over_time", "bytes_rate"):
+            buckets[b] = buckets.get(b, 0) + len(line.raw)
+        elif func in ("sum_over_time", "rate"):
+            buckets[b] = buckets.get(b, 0.0) + value
+        elif func == "avg_over_time":
+            acc = buckets.get(b)
+            if acc is None:
+                buckets[b] = [value, 1]
+            else:
+                acc[0] += value
+                acc[1] += 1
+        elif func == "min_over_time":
+            buckets[b] = min(buckets.get(b, value), value)
+        elif func == "max_over_time":
+            buckets[b] = max(buckets.get(b, value), value)
+        else:
+            buckets.setdefault(b, []).append(value)
+
+    def _steps(self, order, width, stride):
+        """Indices of the steps whose window holds at least one of the sorted buckets."""
+        last = len(self.steps) - 1
+        nxt = 0
+        for b in order:
+            # step i covers buckets [i*stride, i*stride + width)
+            hi = min(last, b // stride)
+            for i in range(max(nxt, (b - width) // stride + 1), hi + 1):
+                yield i
+            nxt = max(nxt, hi + 1)
+
+    def iter_series(self):
+        """Yield (key, {step index: value}) per scanned series, with only the steps it has data for."""
+        width = self.range_ns // self.g
+        stride = self.step_ns // self.g
+        secs = self.range_ns / 1e9
+        func = self.func
+        for key, buckets in self.series.items():
+            order = sorted(buckets)
+            values = {}
+            for i in self._steps(order, width, stride):
+                lo = i * stride
+                a = bisect.bisect_left(order, lo)
+                z = bisect.bisect_left(order, lo + width, a)
+                accs = [buckets[b] for b in order[a:z]]
+                if func == "avg_over_time":
+                    values[i] = sum(x[0] for x in accs) / sum(x[1] for x in accs)
+                elif func == "min_over_time":
+                    values[i] = float(min(accs))
+                elif func == "max_over_time":
+                    values[i] = float(max(accs))
+                elif func == "quantile_over_time":
+                    values[i] = quantile(self.param, [v for x in accs for v in x])
+                elif func in ("rate", "bytes_rate"):
+                    values[i] = sum(accs) / secs
+                else:
+                    values[i] = float(sum(accs))
+            yield key, values
+
+    def matrix(self):
+        """-> {labels tuple: {step index: value}}."""
+        if self.group is None:
+            return dict(self.iter_series())
+        out = {}
+        for key, values in self.iter_series():
+            key = tuple(sorted((g, v) for g, v in zip(self.group, key) if v != ""))
+            prev = out.get(key)
+            if prev is None:
+                out[key] = values
+            else:  # grouping labels listed twice collapse to one series
+                for i, v in values.items():
+                    prev[i] = prev[i] + v if i in prev else v
+        return out
+
+class _StreamLeaf:
+    """A log (non-metric) query: newest `limit` matching lines."""
+
+    def __init__(self, query, start, end, limit):
+        self.pipe = _Pipeline(query)
+        self.start, self.end, self.limit = start, end, limit
+        self.entries = []
+        self.lines = self.bytes = self.post_filter = self.errors = 0
+        self.elapsed = 0.0
+
+    def feed(self, ts, stream, line):
+        if not self.start <= ts <= self.end:
+            return
+        self.lines += 1
+        self.bytes += len(line.raw)
+        out = self.pipe.run(stream, line)
+        if out is None:
+            self.errors += self.pipe.failed
+        else:
+            self.post_filter += 1
+            self.entries.append((ts, out[0], line.text()))
+            if len(self.entries) > 4 * self.limit:
+                self.entries.sort(key=lambda e: -e[0])
+                del self.entries[self.limit:]
+
+# ---- Vector evaluation --------------------------------------------------------
+
+_ARITH = {"+": lambda a, b: a + b, "-": lambda a, b: a - b, "*": lambda a, b: a * b,
+          "/": lambda a, b: a / b if b else (math.nan if a == 0 or math.isnan(a) else math.copysign(math.inf, a)),
+          "%": lambda a, b: math.fmod(a, b) if b else math.nan, "^": lambda a, b: a ** b}
+_CMP = {"==": lambda a, b: a == b, "!=": lambda a, b: a != b, ">": lambda a, b: a > b,
+        "<": lambda a, b: a < b, ">=": lambda a, b: a >= b, "<=": lambda a, b: a <= b}
+# Vector aggregations as (running value, next value) -> running value; count and avg also use the member count
+_FOLDS = {"sum": lambda a, b: a + b, "avg": lambda a, b: a + b, "min": min, "max": max, "count": lambda a, b: a}
+
+class Plan:
+    """A parsed query bound to a time grid, ready to be fed lines."""
+
+    def __init__(self, text, start_ns, end_ns, step_ns=None, instant=False, limit=100):
+        self.text = text
+        self.query = query_ir.parse(text, "logql")
+        self.instant = instant or step_ns is None
+        if self.instant:
+            self.steps, self.step_ns = [end_ns], max(1, end_ns - start_ns)
+        else:
+            n = (end_ns - start_ns) // step_ns + 1
+            self.steps, self.step_ns = [start_ns + i * step_ns for i in range(n)], step_ns
+        self.leaves = []
+        self._leaf_of = {}
+        if isinstance(self.query.expr, LogQuery):
+            self.stream = _StreamLeaf(self.query.expr, start_ns, end_ns, limit)
+            self.leaves.append(self.stream)
+        else:
+            self.stream = None
+            self._plan(self.query.expr, pushdown=None)
+
+    def _plan(self, node, pushdown):
+        if isinstance(node, Call) and isinstance(node.range_arg(), LogRange):
+            leaf = _RangeLeaf(node, (self.steps, self.step_ns))
+            if pushdown is not None and node.func in _LINEAR:
+                leaf.group = pushdown
+            self.leaves.append(leaf)
+            self._leaf_of[id(node)] = leaf
+            return
+        if isinstance(node, VectorAgg):
+            push = None
+            if node.op == "sum" and not node.without:
+                push = list(node.grouping or ())
+            self._plan(node.expr, push)
+            return
+        if isinstance(node, Paren):
+            self._plan(node.expr, pushdown)
+            return
+        for child in query_ir.children(node):
+            if not isinstance(child, Literal):
+                self._plan(child, None)
+
+    def _pushed(self, node):
+        leaf = self._leaf_of.get(id(node))
+        return leaf is not None and leaf.group is not None
+
+    def _eval(self, node):
+        """-> float (scalar) or {labels tuple: {step index: value}} (steps without a value left out)."""
+        if isinstance(node, Literal):
+            try:
+                return float(node.text)
+            except ValueError:
+                raise QueryError(f"uninterpolated or non-numeric literal {node.text!r}")
+        if isinstance(node, Paren):
+            return self._eval(node.expr)
+        if isinstance(node, Call):
+            if node.func == "vector" and len(node.args) == 1:
+                return {(): dict.fromkeys(range(len(self.steps)), self._eval(node.args[0]))}
+            leaf = self._leaf_of.get(id(node))
+            if leaf is None:
+                raise QueryError(f"unsupported function {node.func}")
+            return leaf.matrix()
+        if isinstance(node, VectorAgg):
+            inner = node.expr.expr if isinstance(node.expr, Paren) else node.expr
+            if node.op == "sum" and not node.without and self._pushed(inner):
+                return self._eval(inner)
+            return self._aggregate(node, self._series(node.expr))
+        if isinstance(node, BinOp):
+            return self._binop(node, self._eval(node.lhs), self._eval(node.rhs))
+        raise QueryError(f"unsupported expression {node.render()!r}")
+
+    def _series(self, node):
+        """Like _eval, but a bare range aggregation streams its series instead of building the whole matrix."""
+        inner = node.expr if isinstance(node, Paren) else node
+        leaf = self._leaf_of.get(id(inner))
+        if leaf is not None and leaf.group is None:
+            return leaf.iter_series()
+        m = self._eval(node)
+        return m.items() if isinstance(m, dict) else m
+
+    def _group_key(self, key, node):
+        if node.grouping is None:
+            return ()
+        if node.without:
+            return tuple((k, v) for k, v in key if k not in node.grouping)
+        return tuple((k, v) for k, v in key if k in node.grouping and v != "")
+
+    def _aggregate(self, node, series):
+        """Fold (key, values) pairs into groups as they arrive, so only the groups are held."""
+        if isinstance(series, float):
+            raise QueryError(f"{node.op} needs a vector argument")
+        out = {}
+        if node.op in ("topk", "bottomk", "approx_topk"):
+            k = int(self._eval(node.param))
+            columns = {}  # (group, step index) -> [(value, key)]
+            for key, values in series:
+                gkey = self._group_key(key, node)
+                for i, v in values.items():
+                    columns.setdefault((gkey, i), []).append((v, key))
+            for (_, i), present in columns.items():
+                present.sort(key=lambda e: e[0], reverse=node.op != "bottomk")
+                for value, key in present[:k]:
+                    out.setdefault(key, {})[i] = value
+            return out
+        fold = _FOLDS.get(node.op)
+        if fold is None:
+            raise QueryError(f"unsupported aggregation {node.op}")
+        accs = {}  # group -> {step index: [folded value, count]}
+        for key, values in series:
+            acc = accs.setdefault(self._group_key(key, node), {})
+            for i, v in values.items():
+                a = acc.get(i)
+                if a is None:
+                    acc[i] = [v, 1]
+                else:
+                    a[0] = fold(a[0], v)
+                    a[1] += 1
+        for gkey, acc in accs.items():
+            if node.op == "avg":
+                out[gkey] = {i: a[0] / a[1] for i, a in acc.items()}
+            elif node.op == "count":
+                out[gkey] = {i: float(a[1]) for i, a in acc.items()}
+            else:
+                out[gkey] = {i: float(a[0]) if node.op == "sum" else a[0] for i, a in acc.items()}
+        return out
+
+    def _binop(self, node, lhs, rhs):
+        op = node.op
+        fn = _ARITH.get(op) or _CMP.get(op)
+        is_bool = "bool" in node.modifier.split()
+        if fn is None:
+            if op in ("and", "or", "unless") and isinstance(lhs, dict) and isinstance(rhs, dict):
+                return self._setop(op, lhs, rhs)
+            raise QueryError(f"unsupported operator {op}")
+        if not isinstance(lhs, dict) and not isinstance(rhs, dict):
+            v = fn(lhs, rhs)
+            return float(v) if op in _ARITH or is_bool else (lhs if v else math.nan)
+
+        def apply(pairs):
+            """(step index, a, b, kept value) -> {step index: result}; a failed comparison drops the step."""
+            values = {}
+            for i, a, b, keep in pairs:
+                if op in _ARITH:
+                    values[i] = fn(a, b)
+                elif is_bool:
+                    values[i] = float(fn(a, b))
+                elif fn(a, b):
+                    values[i] = keep
+            return values
+
+        if not isinstance(rhs, dict):
+            return {k: apply((i, a, rhs, a) for i, a in v.items()) for k, v in lhs.items()}
+        if not isinstance(lhs, dict):
+            return {k: apply((i, lhs, b, b) for i, b in v.items()) for k, v in rhs.items()}
+        match = self._matcher(node.modifier)
+        right = {match(k): v for k, v in rhs.items()}
+        out = {}
+        for k, v in lhs.items():
+            other = right.get(match(k))
+            if other is not None:
+                values = apply((i, a, other[i], a) for i, a in v.items() if i in other)
+                if values:
+                    out[k] = values
+        return out
+
+    @staticmethod
+    def _matcher(modifier):
+        m = re.search(r"\b(on|ignoring) \(([^)]*)\)", modifier)
+        if not m:
+            return lambda key: key
+        labels = {l.strip() for l in m.group(2).split(",") if l.strip()}
+        if m.group(1) == "on":
+            return lambda key: tuple((k, v) for k, v in key if k in labels)
+        return lambda key: tuple((k, v) for k, v in key if k not in labels)
+
+    def _setop(self, op, lhs, rhs):
+        if op == "or":
+            return {**rhs, **lhs}
+        if op == "and":
+            return {k: {i: a for i, a in v.items() if i in rhs[k]} for k, v in lhs.items() if k in rhs}
+        return {k: {i: a for i, a in v.items() if i not in rhs.get(k, ())} for k, v in lhs.items()}
+
+    def result(self, exec_time):
+        lines = sum(l.lines for l in self.leaves)
+        nbytes = sum(l.bytes for l in self.leaves)
+        post = sum(l.post_filter for l in self.leaves)
+        if self.stream is not None:
+            entries = sorted(self.stream.entries, key=lambda e: -e[0])[:self.stream.limit]
+            streams = {}
+            for ts, labels, text in entries:
+                streams.setdefault(tuple(sorted(labels.items())), []).append([str(ts), text])
+            data = {"resultType": "streams", "result": [{"stream": dict(k), "values": v} for k, v in sorted(streams.items())]}
+            returned = len(entries)
+        else:
+            value = self._eval(self.query.expr)
+            data, returned = self._render(value)
+        errors = sum(l.errors for l in self.leaves)
+        t = max(exec_time, 1e-9)
+        data["stats"] = {"summary": {
+            "bytesProcessedPerSecond": int(nbytes / t), "linesProcessedPerSecond": int(lines / t),
+            "totalBytesProcessed": nbytes, "totalLinesProcessed": lines, "totalPostFilterLines": post,
+            "execTime": exec_time, "queueTime": 0, "subqueries": 0, "totalEntriesReturned": returned,
+            "splits": 0, "shards": 0, "pipelineErrors": errors}}
+        return {"status": "success", "data": data}
+
+    def _render(self, value):
+        def ts(t):
+            s = t / 1e9
+            return int(s) if s == int(s) else s
+        if not isinstance(value, dict):
+            return {"resultType": "scalar", "result": [ts(self.steps[-1]), format_value(value)]}, 1
+        series = sorted(value.items())
+        if self.instant:
+            last = len(self.steps) - 1
+            result = [{"metric": dict(k), "value": [ts(self.steps[-1]), format_value(v[last])]}
+                      for k, v in series if last in v]
+            return {"resultType": "vector", "result": result}, len(result)
+        result = []
+        for k, v in series:
+            points = [[ts(self.steps[i]), format_value(x)] for i, x in sorted(v.items())]
+            if points:
+                result.append({"metric": dict(k), "values": points})
+        return {"resultType": "matrix", "result": result}, sum(len(r["values"]) for r in result)
+
+def run(plans, source):
+    """Feed every line of source to all plans in one pass; returns Loki-style responses."""
+    leaves = [leaf for p in plans for leaf in p.leaves]
+    pipes, stores, pairs = {}, {}, {}
+    for leaf in leaves:  # identical pipelines run once per line, identical bucket layouts are filled once
+        leaf.pipe = pipes.setdefault(leaf.pipe.text, leaf.pipe)
+        leaf.pipe.pairs = pairs
+        if isinstance(leaf, _RangeLeaf):
+            owner = stores.setdefault(leaf.layout(), leaf)
+            if owner is not leaf:
+                leaf.series, leaf.shared = owner.series, True
+    selected = {}  # id(stream labels) -> (labels, [leaves whose selector matches])
+    start = time.perf_counter()
+    for ts, stream, raw in source:
+        hit = selected.get(id(stream))
+        if hit is None or hit[0] is not stream:
+            hit = selected[id(stream)] = (stream, [l for l in leaves if l.pipe.selects(stream)])
+        if not hit[1]:
+            continue
+        line = _Line(raw)
+        for leaf in hit[1]:
+            t0 = time.perf_counter()
+            leaf.feed(ts, stream, line)
+            leaf.elapsed += time.perf_counter() - t0
+    scan = time.perf_counter() - start
+    results = []
+    for p in plans:
+        t0 = time.perf_counter()
+        # Shared scan time is attributed by each query's share of per-line work
+        own = sum(l.elapsed for l in p.leaves)
+        try:
+            res = p.result(own)
+        except QueryError as e:
+            res = {"status": "error", "errorType": "bad_data", "error": str(e)}
+        if res["status"] == "success":
+            res["data"]["stats"]["summary"]["execTime"] = own + time.perf_counter() - t0
+        results.append(res)
+    return results, scan
+
+def evaluate(text, source, start_ns, end_ns, step_ns=None, instant=False, limit=100):
+    """Evaluate one query over source; returns the Loki-style JSON response."""
+    return run([Plan(text, start_ns, end_ns, step_ns, instant, limit)], source)[0][0]
+
+# ---- CLI ----------------------------------------------------------------------
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+def _check_rss(limit):
+    peak = peak_rss_mb()
+    if limit and peak > limit:
+        print(f"peak RSS {peak:.0f} MB exceeds --max-rss {limit} MB", file=sys.stderr)
+        return False
+    return True
+
+def _parse_time(s):
+    try:
+        return parse_timestamp(float(s))
+    except ValueError:
+        return parse_timestamp(s)
+
+def main():
+    ap = argparse.ArgumentParser(description="Evaluate Logpush dashboard LogQL offline over NDJSON files.")
+    ap.add_argument("files", nargs="+", help="Logpush NDJSON files (.gz ok)")
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--query", help="LogQL expression")
+    g.add_argument("--dashboard", help="evaluate every Loki target of a generated dashboard")
+    ap.add_argument("--start", help="RFC 3339 or unix time (default: first line)")
+    ap.add_argument("--end", help="RFC 3339 or unix time (default: last line)")
+    ap.add_argument("--step", help="range query step, e.g. 1m (default: Grafana's interval for the panel)")
+    ap.add_argument("--instant", action="store_true", help="--query: run as an instant query at --end")
+    ap.add_argument("--var", action="append", default=[], metavar="NAME=VALUE", help="--dashboard: template variable value")
+    ap.add_argument("--job", default=JOB, help=f"job label of the stream (default: {JOB})")
+    ap.add_argument("--limit", type=int, default=100, help="max lines for log queries")
+    ap.add_argument("--json", action="store_true", help="--dashboard: print every response as JSON")
+    ap.add_argument("--max-rss", type=int, metavar="MB", help="exit 1 if peak resident memory goes above MB")
+    args = ap.parse_args()
+
+    source = LogpushFiles(args.files, args.job)
+    start, end = (_parse_time(args.start) if args.start else None), (_parse_time(args.end) if args.end else None)
+    if start is None or end is None:
+        lo, hi = time_bounds(source)
+        if lo is None:
+            sys.exit("no timestamped lines in input")
+        # Whole seconds around the data, so $__range covers the first line exactly
+        start, end = start or (lo - 1) // 10**9 * 10**9, end or -(-hi // 10**9) * 10**9
+    step = dashboard_json.parse_duration(args.step) if args.step else None
+
+    if args.query:
+        try:
+            plan = Plan(args.query, start, end, None if args.instant else step or dashboard_json.grafana_interval(start, end, 1000),
+                        args.instant, args.limit)
+        except (QueryError, ValueError) as e:
+            sys.exit(f"error: {e}")
+        results, _ = run([plan], source)
+        json.dump(results[0], sys.stdout, indent=2)
+        print()
+        sys.exit(0 if _check_rss(args.max_rss) else 1)
+
+    with open(args.dashboard) as f:
+        dashboard = json.load(f)
+    values = dashboard_json.variable_values(dashboard, dict(v.split("=", 1) for v in args.var))
+    plans, labels, failed = [], [], 0
+    for row, panel, target in dashboard_json.iter_targets(dashboard):
+        if (target.get("datasource") or panel.get("datasource") or {}).get("type") != "loki":
+            continue
+        instant = dashboard_json.is_instant(target)
+        pstep = step or dashboard_json.grafana_interval(start, end, dashboard_json.panel_max_points(panel))
+        expr = dashboard_json.interpolate(target["expr"], values, start, end, pstep, instant)
+        name = f"{panel.get('title', '')} [{target.get('refId', 'A')}]"
+        try:
+            plans.append(Plan(expr, start, end, None if instant else pstep, instant, args.limit))
+            labels.append(name)
+        except (QueryError, ValueError) as e:
+            failed += 1
+            print(f"PARSE ERROR  {name}: {e}", file=sys.stderr)
+    results, scan = run(plans, source)
+    if args.json:
+        json.dump([{"panel": n, "query": p.text, **r} for n, p, r in zip(labels, plans, results)], sys.stdout, indent=2)
+        print()
+    else:
+        rows = []
+        for name, plan, res in zip(labels, plans, results):
+            if res["status"] != "success":
+                failed += 1
+                print(f"EVAL ERROR   {name}: {res['error']}", file=sys.stderr)
+                continue
+            s = res["data"]["stats"]["summary"]
+            rows.append((s["execTime"], name, s["totalLinesProcessed"], s["totalPostFilterLines"], len(res["data"]["result"]), s["pipelineErrors"]))
+        print(f"{'ms':>8} {'lines':>10} {'matched':>10} {'series':>7} {'errors':>7}  panel")
+        for ms, name, lines, post, series, errors in sorted(rows, reverse=True):
+            print(f"{ms * 1000:8.1f} {lines:10d} {post:10d} {series:7d} {errors:7d}  {name}")
+        print(f"{len(rows)} queries evaluated in one {scan:.2f}s pass ({peak_rss_mb():.0f} MB peak RSS), {failed} failed")
+    sys.exit(1 if failed or not _check_rss(args.max_rss) else 0)
+
+if __name__ == "__main__":
+    main()
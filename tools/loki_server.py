@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""Local Loki-compatible query server for end-to-end dashboard tests.
+
+Usage:
+  python3 loki_server.py --load logs/*.ndjson.gz
+  python3 loki_server.py --listen 0.0.0.0:3100 --workers 8 --chunk 15m
+  python3 synth_logpush.py --push http://localhost:3100/loki/api/v1/push --rate 10000 --duration 10m
+
+Serves /loki/api/v1/query, /query_range, /labels, /label/<name>/values and
+/push (JSON, optionally gzipped, or snappy protobuf as Promtail/Alloy send
+it) over an in-process store, so a real Grafana
+or a load replayer can be pointed at it with no other services running.
+Queries are evaluated by logql_eval.py and accept what the Logpush dashboard
+generator emits.
+
+Lines loaded with --load are stamped from their Logpush timestamp field and
+belong to {job="cloudflare-logpush", dataset="<_dataset>"}; pushed lines keep
+the labels and timestamps of the push request, as in Loki.
+
+Each stream's lines are kept in chunks covering one --chunk of time, so a
+query only scans chunks that overlap its range and streams its selectors
+match. Queries run on a fixed pool of --workers threads (requests beyond that
+queue, as with Loki's max concurrency) and responses are cached until a push
+lands inside the range they cover.
+"""
+import argparse, bisect, collections, concurrent.futures, gzip, json, os, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "receiver"))
+import loki_push
+import logql_eval
+from logql_eval import JOB, LogpushFiles, Plan, QueryError
+import dashboard_json
+
+# ---- Store --------------------------------------------------------------------
+
+class Chunk:
+    """Lines of one stream within one time partition, sorted by timestamp on read."""
+    __slots__ = ("ts", "lines", "sorted")
+
+    def __init__(self):
+        self.ts, self.lines, self.sorted = [], [], True
+
+    def append(self, ts, raw):
+        if self.ts and ts < self.ts[-1]:
+            self.sorted = False
+        self.ts.append(ts)
+        self.lines.append(raw)
+
+    def sort(self):
+        order = sorted(range(len(self.ts)), key=self.ts.__getitem__)
+        self.ts = [self.ts[i] for i in order]
+        self.lines = [self.lines[i] for i in order]
+        self.sorted = True
+
+class LogStore:
+    """Streams of (ts_ns, raw line) in time-partitioned chunks."""
+
+    def __init__(self, chunk_ns):
+        self.chunk_ns = chunk_ns
+        self.streams = {}  # sorted label tuple -> (labels dict, {partition: Chunk})
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.writes = collections.deque(maxlen=4096)  # (generation, min ts, max ts) per append
+        self.lines = self.bytes = 0
+
+    def append(self, labels, entries):
+        """Add [(ts_ns, raw bytes), ...] to the stream with these labels."""
+        if not entries:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                stream = self.streams[key] = (dict(key), {})
+            chunks = stream[1]
+            lo = hi = entries[0][0]
+            for ts, raw in entries:
+                part = ts // self.chunk_ns
+                chunk = chunks.get(part)
+                if chunk is None:
+                    chunk = chunks[part] = Chunk()
+                chunk.append(ts, raw)
+                lo, hi = min(lo, ts), max(hi, ts)
+                self.bytes += len(raw)
+            self.lines += len(entries)
+            self.generation += 1
+            self.writes.append((self.generation, lo, hi))
+
+    def load(self, source, batch=10000):
+        """Append every (ts, stream, raw) entry of a logql_eval source."""
+        pending = {}
+        for ts, stream, raw in source:
+            entries = pending.setdefault(id(stream), (stream, []))[1]
+            entries.append((ts, raw))
+            if len(entries) >= batch:
+                self.append(stream, entries)
+                entries.clear()
+        for stream, entries in pending.values():
+            self.append(stream, entries)
+
+    def changed(self, generation, lo, hi):
+        """Has any append since `generation` touched [lo, hi]?"""
+        with self.lock:
+            if generation == self.generation:
+                return False
+            if not self.writes or self.writes[0][0] > generation + 1:
+                return True  # older than the write log, assume so
+            return any(g > generation and w_lo <= hi and w_hi >= lo for g, w_lo, w_hi in self.writes)
+
+    def _overlapping(self, start, end, select=None):
+        """[(labels, [chunks overlapping start..end])] for streams `select` accepts."""
+        first, last = start // self.chunk_ns, end // self.chunk_ns
+        out = []
+        with self.lock:
+            for labels, chunks in self.streams.values():
+                if select is not None and not select(labels):
+                    continue
+                if last - first < len(chunks):
+                    parts = [chunks[p] for p in range(first, last + 1) if p in chunks]
+                else:
+                    parts = [c for p, c in chunks.items() if first <= p <= last]
+                if parts:
+                    for c in parts:
+                        if not c.sorted:
+                            c.sort()
+                    # Snapshot lengths so lines appended during the scan are not half-read
+                    out.append((labels, [(c, len(c.ts)) for c in parts]))
+        return out
+
+    def scan(self, start, end, select=None):
+        """Yield (ts, labels, raw) for lines in [start, end], the shape logql_eval.run() reads."""
+        for labels, parts in self._overlapping(start, end, select):
+            for chunk, n in parts:
+                ts, lines = chunk.ts, chunk.lines
+                a = bisect.bisect_left(ts, start, 0, n)
+                z = bisect.bisect_right(ts, end, a, n)
+                for i in range(a, z):
+                    yield ts[i], labels, lines[i]
+
+    def label_names(self, start, end):
+        return sorted({k for labels, _ in self._overlapping(start, end) for k in labels})
+
+    def label_values(self, name, start, end):
+        return sorted({labels[name] for labels, _ in self._overlapping(start, end) if name in labels})
+
+# ---- Queries ------------------------------------------------------------------
+
+def _window(plan):
+    """Oldest and newest line timestamps a plan can read."""
+    lo, hi = [], []
+    for leaf in plan.leaves:
+        if isinstance(leaf, logql_eval._StreamLeaf):
+            lo.append(leaf.start)
+            hi.append(leaf.end)
+        else:
+            lo.append(leaf.origin + 1)
+            hi.append(leaf.end)
+    return (min(lo), max(hi)) if lo else (0, -1)
+
+class QueryEngine:
+    """Runs plans against the store on a bounded thread pool, with a response cache."""
+
+    def __init__(self, store, workers, cache_size):
+        self.store = store
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="query")
+        self.cache = collections.OrderedDict()  # key -> (generation, lo, hi, response)
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def query(self, key, make_plan):
+        """Return the Loki response for a request; make_plan() raises QueryError/ValueError on bad input."""
+        with self.cache_lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+        if entry is not None and not self.store.changed(entry[0], entry[1], entry[2]):
+            self.hits += 1
+            return entry[3]
+        self.misses += 1
+        queued = time.perf_counter()
+        return self.pool.submit(self._execute, key, make_plan, queued).result()
+
+    def _execute(self, key, make_plan, queued):
+        queue_time = time.perf_counter() - queued
+        plan = make_plan()
+        generation = self.store.generation
+        lo, hi = _window(plan)
+        select = lambda labels: any(leaf.pipe.selects(labels) for leaf in plan.leaves)
+        res = logql_eval.run([plan], self.store.scan(lo, hi, select))[0][0]
+        if res["status"] != "success":
+            raise QueryError(res["error"])
+        res["data"]["stats"]["summary"]["queueTime"] = queue_time
+        if self.cache_size:
+            with self.cache_lock:
+                self.cache[key] = (generation, lo, hi, res)
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return res
+
+# ---- HTTP ---------------------------------------------------------------------
+
+class BadRequest(Exception):
+    pass
+
+def parse_time(value, default):
+    """Loki's parseTimestamp: float seconds, <= 10 digit unix seconds, nanoseconds or RFC 3339."""
+    if not value:
+        return default
+    try:
+        if "." in value:
+            return int(float(value) * 1e9)
+        n = int(value)
+        return n * 1_000_000_000 if len(value) <= 10 else n
+    except ValueError:
+        try:
+            return logql_eval.parse_timestamp(value)
+        except ValueError:
+            raise BadRequest(f"cannot parse {value!r} to a valid timestamp")
+
+def parse_step(value, start, end):
+    if not value:
+        return max((end - start) // 250 // 1_000_000_000, 1) * 1_000_000_000
+    try:
+        return int(float(value) * 1e9)
+    except ValueError:
+        try:
+            return dashboard_json.parse_duration(value)
+        except ValueError:
+            raise BadRequest(f"cannot parse {value!r} to a valid duration")
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "loki-server"
+    protocol_version = "HTTP/1.1"
+    store = engine = None  # set by main()
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, code, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = (json.dumps(body, separators=(",", ":")) if content_type == "application/json" else body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        return data
+
+    def do_GET(self):
+        self._dispatch({})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == "/loki/api/v1/push":
+            return self._push()  # answers 204 itself
+        form = {}
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            form = parse_qs(self._body().decode())
+        self._dispatch(form)
+
+    def _dispatch(self, form):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in {**parse_qs(url.query), **form}.items()}
+        path = url.path.rstrip("/")
+        if path == "/loki/api/v1/query":
+            return self._guard(self._instant, params)
+        if path == "/loki/api/v1/query_range":
+            return self._guard(self._range, params)
+        if path == "/loki/api/v1/labels":
+            return self._guard(self._labels, params)
+        if path.startswith("/loki/api/v1/label/") and path.endswith("/values"):
+            return self._guard(self._label_values, unquote(path[len("/loki/api/v1/label/"):-len("/values")]), params)
+        if path == "/ready":
+            return self._send(200, "ready\n", "text/plain")
+        if path == "/loki/api/v1/status/buildinfo":
+            return self._send(200, {"version": "3.0.0", "revision": "loki-server", "branch": "", "goVersion": ""})
+        if path == "/metrics":
+            return self._send(200, self._metrics(), "text/plain; version=0.0.4")
+        self._send(404, "404 page not found\n", "text/plain")
+
+    def _guard(self, fn, *args):
+        try:
+            self._send(200, fn(*args))
+        except (BadRequest, QueryError, ValueError) as e:
+            self._send(400, f"{e}\n", "text/plain")
+
+    def _range_params(self, params, default_span=3_600_000_000_000):
+        end = parse_time(params.get("end"), time.time_ns())
+        start = parse_time(params.get("start"), end - default_span)
+        if end < start:
+            raise BadRequest("end timestamp must not be before start time")
+        return start, end
+
+    def _instant(self, params):
+        query = params.get("query") or ""
+        at = parse_time(params.get("time"), time.time_ns())
+        limit = int(params.get("limit") or 100)
+
+        def make_plan():
+            # A day-long grid keeps the bucket width at the query's range for typical ranges
+            plan = Plan(query, at - 86_400_000_000_000, at, None, True, limit)
+            if plan.stream is not None:
+                raise BadRequest("log queries are not supported as an instant query type, use query_range")
+            return plan
+        return self.engine.query(("query", query, at, limit), make_plan)
+
+    def _range(self, params):
+        query = params.get("query") or ""
+        start, end = self._range_params(params)
+        step = parse_step(params.get("step"), start, end)
+        if step <= 0:
+            raise BadRequest("zero or negative query resolution step widths are not accepted")
+        if (end - start) // step > 11000:
+            raise BadRequest("exceeded maximum resolution of 11,000 points per timeseries")
+        limit = int(params.get("limit") or 100)
+        return self.engine.query(("query_range", query, start, end, step, limit),
+                                 lambda: Plan(query, start, end, step, False, limit))
+
+    def _labels(self, params):
+        start, end = self._range_params(params, 6 * 3_600_000_000_000)
+        return {"status": "success", "data": self.store.label_names(start, end)}
+
+    def _label_values(self, name, params):
+        start, end = self._range_params(params, 6 * 3_600_000_000_000)
+        return {"status": "success", "data": self.store.label_values(name, start, end)}
+
+    def _push(self):
+        ctype = self.headers.get("Content-Type", "")
+        if not ctype.startswith(("application/json", "application/x-protobuf")):
+            return self._send(415, "push bodies must be application/json or application/x-protobuf\n", "text/plain")
+        try:
+            if ctype.startswith("application/json"):
+                body = json.loads(self._body())
+                streams = [(s["stream"], [(int(ts), line.encode()) for ts, line, *_ in s["values"]])
+                           for s in body.get("streams", [])]
+            else:
+                streams = loki_push.decode_push(loki_push.snappy_decompress(self._body()))
+            for labels, entries in streams:
+                self.store.append(labels, entries)
+        except (ValueError, KeyError, TypeError, IndexError, OSError) as e:
+            return self._send(400, f"invalid push body: {e}\n", "text/plain")
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _metrics(self):
+        s, e = self.store, self.engine
+        return (f"loki_server_streams {len(s.streams)}\nloki_server_lines_total {s.lines}\n"
+                f"loki_server_bytes_total {s.bytes}\nloki_server_cache_hits_total {e.hits}\n"
+                f"loki_server_cache_misses_total {e.misses}\n")
+
+# ---- CLI ----------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve the Loki query API over an in-process log store.")
+    ap.add_argument("--listen", default="127.0.0.1:3100", help="host:port (default: 127.0.0.1:3100)")
+    ap.add_argument("--load", nargs="*", default=[], metavar="FILE", help="Logpush NDJSON files (.gz ok) to load at start")
+    ap.add_argument("--job", default=JOB, help=f"job label for --load (default: {JOB})")
+    ap.add_argument("--chunk", default="1h", help="time covered by one chunk (default: 1h)")
+    ap.add_argument("--workers", type=int, default=4, help="concurrent queries (default: 4)")
+    ap.add_argument("--cache-size", type=int, default=1024, help="cached responses, 0 to disable (default: 1024)")
+    ap.add_argument("--verbose", action="store_true", help="log every request")
+    args = ap.parse_args()
+
+    store = LogStore(dashboard_json.parse_duration(args.chunk))
+    if args.load:
+        t0 = time.perf_counter()
+        store.load(LogpushFiles(args.load, args.job))
+        print(f"loaded {store.lines} lines in {len(store.streams)} streams in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    Handler.store, Handler.engine = store, QueryEngine(store, args.workers, args.cache_size)
+    host, _, port = args.listen.rpartition(":")
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), Handler)
+    server.daemon_threads = True
+    server.verbose = args.verbose
+    print(f"listening on http://{args.listen}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Estimate how many series each cloudflared dashboard panel touches and returns.
+
+Usage:
+  python3 prom_cardinality.py snapshot.prom
+  python3 prom_cardinality.py fleet/*.prom --dashboard ../dashboards/cloudflare-tunnel.json
+  python3 prom_cardinality.py snapshot.prom --replicas 300 --warn 500
+
+Input is Prometheus text exposition as served on cloudflared's /metrics
+endpoint (e.g. `curl -s localhost:2000/metrics > replica-1.prom`). Each file
+is one scrape target: its series get the `job` (--job) and `instance` (file
+name) labels Prometheus would attach. --replicas N clones every file N times
+with distinct instances, to preview a fleet from a single snapshot.
+
+Every Prometheus target of the dashboard is evaluated over label sets only:
+"touched" counts the series its selectors match, "returned" the series left
+after functions, aggregations and vector matching. "points" is returned
+series x the steps Grafana requests for the panel over --range. Panels above
+--warn returned series are flagged; these are usually un-aggregated
+per-replica or per-connection panels (quic_client_* by conn_index).
+"""
+import argparse, json, os, re, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "generators"))
+import query_ir
+from query_ir import BinOp, Call, Literal, MatrixSelector, Paren, QueryError, Selector, VectorAgg
+import dashboard_json
+
+DEFAULT_DASHBOARD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dashboards", "cloudflare-tunnel.json")
+
+# ---- Exposition -------------------------------------------------------------
+
+_SAMPLE = re.compile(r"([A-Za-z_:][\w:]*)(?:\{(.*)\})?\s+\S+(?:\s+-?\d+)?\s*$")
+_LABEL = re.compile(r'\s*([A-Za-z_]\w*)\s*=\s*"((?:[^"\\]|\\.)*)"\s*,?')
+
+def _unescape(v):
+    return v.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\")
+
+def parse_exposition(text):
+    """-> [{labels incl. __name__}] for every sample line."""
+    series = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        m = _SAMPLE.match(line)
+        if not m:
+            raise ValueError(f"bad sample line: {line[:120]!r}")
+        labels = {"__name__": m.group(1)}
+        for name, value in _LABEL.findall(m.group(2) or ""):
+            labels[name] = _unescape(value)
+        series.append(labels)
+    return series
+
+def load_targets(paths, job, replicas=1):
+    """Series of every scrape target, with job/instance attached as Prometheus does."""
+    out = []
+    for path in paths:
+        with open(path) as f:
+            series = parse_exposition(f.read())
+        stem = os.path.basename(path).split(".")[0]
+        for r in range(replicas):
+            instance = stem if replicas == 1 else f"{stem}-{r}"
+            for labels in series:
+                # Prometheus keeps the target's labels and renames clashes to exported_*
+                extra = {f"exported_{k}" if k in ("job", "instance") else k: v for k, v in labels.items()}
+                out.append({**extra, "job": job, "instance": instance})
+    return out
+
+# ---- Evaluation over label sets ---------------------------------------------
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+def _drop_name(keys):
+    return {tuple(kv for kv in k if kv[0] != "__name__") for k in keys}
+
+_KEEP_NAME = {"sort", "sort_desc", "last_over_time", "label_replace", "label_join", "clamp", "clamp_min",
+              "clamp_max", "timestamp"}
+
+class Estimator:
+    """Evaluates a PromQL tree to the set of output series (label tuples), counting selector matches."""
+
+    def __init__(self, series):
+        self.series = series
+        self.by_name = {}
+        for labels in series:
+            self.by_name.setdefault(labels["__name__"], []).append(labels)
+        self._regex = {}
+        self.touched = 0
+
+    def _match(self, m, value):
+        if m.op == "=":
+            return value == m.value
+        if m.op == "!=":
+            return value != m.value
+        rx = self._regex.get(m.value)
+        if rx is None:
+            rx = self._regex[m.value] = re.compile(m.value)
+        hit = rx.fullmatch(value) is not None
+        return hit if m.op == "=~" else not hit
+
+    def select(self, sel):
+        matchers = list(sel.matchers)
+        if sel.metric:
+            candidates = self.by_name.get(sel.metric, [])
+        else:
+            name = next((m.value for m in matchers if m.name == "__name__" and m.op == "="), None)
+            candidates = self.by_name.get(name, []) if name else self.series
+        out = {_key(s) for s in candidates if all(self._match(m, s.get(m.name, "")) for m in matchers)}
+        self.touched += len(out)
+        return out
+
+    def eval(self, node):
+        """-> None for scalars, else a set of label tuples."""
+        if isinstance(node, Literal):
+            return None
+        if isinstance(node, Paren):
+            return self.eval(node.expr)
+        if isinstance(node, Selector):
+            return self.select(node)
+        if isinstance(node, MatrixSelector):
+            return self.select(node.selector)
+        if isinstance(node, Call):
+            vectors = [self.eval(a) for a in node.args if not isinstance(a, Literal)]
+            v = next((x for x in vectors if x is not None), None)
+            if node.func in ("vector", "scalar", "time"):
+                return None if node.func != "vector" else {()}
+            if v is None:
+                return None
+            if node.func == "histogram_quantile":
+                return {tuple(kv for kv in k if kv[0] != "le") for k in _drop_name(v)}
+            if node.func == "absent" or node.func == "absent_over_time":
+                return set() if v else {()}
+            return v if node.func in _KEEP_NAME else _drop_name(v)
+        if isinstance(node, VectorAgg):
+            return self._aggregate(node, self.eval(node.expr))
+        if isinstance(node, BinOp):
+            return self._binop(node, self.eval(node.lhs), self.eval(node.rhs))
+        raise QueryError(f"unsupported expression {node.render()!r}")
+
+    def _aggregate(self, node, v):
+        if v is None:
+            raise QueryError(f"{node.op} needs a vector argument")
+        if not v:
+            return set()
+        g = node.grouping
+
+        def project(k):
+            if g is None:
+                return ()
+            if node.without:
+                return tuple(kv for kv in k if kv[0] not in g and kv[0] != "__name__")
+            return tuple(kv for kv in k if kv[0] in g)
+        if node.op in ("topk", "bottomk", "limitk"):
+            try:
+                n = int(float(node.param.render()))
+            except ValueError:
+                n = 1
+            groups = {}
+            for k in v:
+                groups.setdefault(project(k), []).append(k)
+            return {k for members in groups.values() for k in sorted(members)[:n]}
+        if node.op in ("sort", "sort_desc"):
+            return v
+        return {project(k) for k in v}
+
+    @staticmethod
+    def _signature(modifier):
+        m = re.search(r"\b(on|ignoring)\s*\(([^)]*)\)", modifier)
+        if not m:
+            return lambda k: tuple(kv for kv in k if kv[0] != "__name__")
+        labels = {l.strip() for l in m.group(2).split(",") if l.strip()}
+        if m.group(1) == "on":
+            return lambda k: tuple(kv for kv in k if kv[0] in labels)
+        return lambda k: tuple(kv for kv in k if kv[0] not in labels and kv[0] != "__name__")
+
+    def _binop(self, node, lhs, rhs):
+        op, mod = node.op, node.modifier
+        keep_name = op in ("==", "!=", ">", "<", ">=", "<=") and "bool" not in mod.split()
+        if lhs is None and rhs is None:
+            return None
+        if lhs is None or rhs is None:
+            v = lhs if lhs is not None else rhs
+            return v if keep_name else _drop_name(v)
+        if op in ("and", "or", "unless"):
+            sig = self._signature(mod)
+            right = {sig(k) for k in rhs}
+            if op == "and":
+                return {k for k in lhs if sig(k) in right}
+            if op == "unless":
+                return {k for k in lhs if sig(k) not in right}
+            left = {sig(k) for k in lhs}
+            return lhs | {k for k in rhs if sig(k) not in left}
+        sig = self._signature(mod)
+        if "group_right" in mod:
+            lhs, rhs = rhs, lhs
+        right = {sig(k) for k in rhs}
+        out = {k for k in lhs if sig(k) in right}
+        if "group_left" in mod or "group_right" in mod:
+            return out if keep_name else _drop_name(out)
+        # One-to-one matching keeps only the left side's match signature (on: those labels, else the rest)
+        return out if keep_name else {sig(k) for k in out}
+
+def estimate(expr, series):
+    """-> (series touched, series returned) for one PromQL expression."""
+    est = series if isinstance(series, Estimator) else Estimator(series)
+    est.touched = 0
+    result = est.eval(query_ir.parse(expr, "promql").expr)
+    return est.touched, 1 if result is None else len(result)
+
+# ---- CLI --------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Series touched/returned per cloudflared dashboard panel from /metrics snapshots.")
+    ap.add_argument("files", nargs="+", help="Prometheus exposition files, one per scrape target")
+    ap.add_argument("--dashboard", default=DEFAULT_DASHBOARD, help="generated dashboard JSON (default: cloudflare-tunnel.json)")
+    ap.add_argument("--job", default="cloudflared-metrics", help="job label of the targets (default: cloudflared-metrics)")
+    ap.add_argument("--replicas", type=int, default=1, help="clone each file N times as separate instances")
+    ap.add_argument("--var", action="append", default=[], metavar="NAME=VALUE", help="template variable value")
+    ap.add_argument("--range", default="6h", help="dashboard time range for the points column (default: 6h)")
+    ap.add_argument("--warn", type=int, default=500, help="flag panels returning more series (default: 500)")
+    ap.add_argument("--json", action="store_true", help="print per-target results as JSON")
+    args = ap.parse_args()
+
+    series = load_targets(args.files, args.job, args.replicas)
+    with open(args.dashboard) as f:
+        dashboard = json.load(f)
+    values = dashboard_json.variable_values(dashboard, {"job": args.job, **dict(v.split("=", 1) for v in args.var)})
+    end = dashboard_json.parse_duration(args.range)
+    est = Estimator(series)
+    rows, failed = [], 0
+    for row, panel, target in dashboard_json.iter_targets(dashboard):
+        if (target.get("datasource") or panel.get("datasource") or {}).get("type") != "prometheus":
+            continue
+        step = dashboard_json.grafana_interval(0, end, dashboard_json.panel_max_points(panel))
+        instant = dashboard_json.is_instant(target)
+        expr = dashboard_json.interpolate(target["expr"], values, 0, end, step, instant)
+        name = f"{panel.get('title', '')} [{target.get('refId', 'A')}]"
+        try:
+            touched, returned = estimate(expr, est)
+        except (QueryError, re.error) as e:
+            failed += 1
+            print(f"ERROR  {name}: {e}", file=sys.stderr)
+            continue
+        points = returned * (1 if instant else end // step + 1)
+        rows.append({"panel": name, "row": (row or {}).get("title", ""), "expr": expr,
+                     "touched": touched, "returned": returned, "points": points})
+    rows.sort(key=lambda r: (-r["returned"], -r["touched"], r["panel"]))
+    instances = len({s["instance"] for s in series})
+    if args.json:
+        json.dump({"targets": instances, "series": len(series), "panels": rows}, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"{len(series)} series from {instances} targets")
+        print(f"{'touched':>8} {'returned':>8} {'points':>9}  panel")
+        for r in rows:
+            flag = "  !" if r["returned"] > args.warn else ""
+            print(f"{r['touched']:8d} {r['returned']:8d} {r['points']:9d}  {r['panel']} ({r['row']}){flag}")
+        over = sum(1 for r in rows if r["returned"] > args.warn)
+        print(f"{len(rows)} targets, {sum(r['returned'] for r in rows)} series returned in total, "
+              f"{over} above {args.warn}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Replay the queries Grafana sends for a generated dashboard and rank panels by cost.
+
+Usage:
+  python3 replay_dashboard.py ../dashboards/cloudflare-logpush.json --loki http://localhost:3100
+  python3 replay_dashboard.py ../dashboards/cloudflare-tunnel.json --prometheus http://localhost:9090 --from now-24h
+  python3 replay_dashboard.py ../dashboards/cloudflare-logpush.json --loki http://loki:3100 --var host=www.example.com --repeat 3 --json
+
+Queries are built the way Grafana builds them: template variables from their
+current values (or --var), $__range/$__auto/$__interval/$__rate_interval from
+the time range and each panel's step, which Grafana derives from the panel
+width. Prometheus ranges are aligned to the step, as Grafana does.
+
+The replay follows a user opening the dashboard: query variables and every
+panel outside collapsed rows are sent together, then each collapsed row is
+expanded in turn (--expand). At most --concurrency requests are in flight at
+once, like a browser's per-host connection limit against Grafana.
+
+The report ranks panels by latency and shows what the backend says it did:
+lines and bytes processed for Loki (stats.summary) and samples loaded for
+Prometheus (stats=all), plus the number of series returned.
+"""
+import argparse, base64, concurrent.futures, json, re, statistics, sys, time, urllib.error, urllib.parse, urllib.request
+
+import dashboard_json
+import logql_eval
+
+_RELATIVE = re.compile(r"now(?:-(\d+)([smhdwy]))?(?:/([smhdwy]))?$")
+
+def parse_time(text, now_ns):
+    """Grafana time picker value (now, now-6h, now-1d/d), RFC 3339 or unix seconds -> ns."""
+    m = _RELATIVE.match(text)
+    if m:
+        ts = now_ns - (dashboard_json.parse_duration(m.group(1) + m.group(2)) if m.group(1) else 0)
+        if m.group(3):
+            unit = dashboard_json.parse_duration("1" + m.group(3))
+            ts -= ts % unit
+        return ts
+    try:
+        return int(float(text) * 1e9)
+    except ValueError:
+        return logql_eval.parse_timestamp(text)
+
+# ---- Requests -----------------------------------------------------------------
+
+class Query:
+    """One HTTP request Grafana would send for a target or a query variable."""
+
+    def __init__(self, phase, panel, ref, kind, url, params):
+        self.phase, self.panel, self.ref, self.kind = phase, panel, ref, kind
+        self.url, self.params = url, params
+        self.runs = []  # dict per repeat
+
+    def fire(self, headers):
+        req = urllib.request.Request(self.url + "?" + urllib.parse.urlencode(self.params), headers=headers)
+        t0 = time.perf_counter()
+        run = {"status": 0, "bytes": 0, "lines": 0, "processed_bytes": 0, "samples": 0, "series": 0, "error": ""}
+        try:
+            with urllib.request.urlopen(req, timeout=300) as resp:
+                body = resp.read()
+                run["status"] = resp.status
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            run["status"], run["error"] = e.code, body[:300].decode(errors="replace").strip()
+        except OSError as e:
+            body, run["error"] = b"", str(e)
+        run["latency"] = time.perf_counter() - t0
+        run["bytes"] = len(body)
+        if run["status"] == 200:
+            try:
+                self._stats(json.loads(body), run)
+            except ValueError:
+                run["error"] = "response is not JSON"
+        self.runs.append(run)
+        return run
+
+    @staticmethod
+    def _stats(doc, run):
+        data = doc.get("data")
+        if isinstance(data, list):  # label values
+            run["series"] = len(data)
+            return
+        data = data or {}
+        result = data.get("result") or []
+        run["series"] = len(result) if data.get("resultType") != "scalar" else 1
+        summary = (data.get("stats") or {}).get("summary") or {}
+        run["lines"] = summary.get("totalLinesProcessed", 0)
+        run["processed_bytes"] = summary.get("totalBytesProcessed", 0)
+        samples = (data.get("stats") or {}).get("samples") or {}
+        run["samples"] = samples.get("totalQueryableSamples", 0)
+
+def _target_query(phase, panel, target, ds_type, base, values, start, end, screen_width):
+    min_interval = panel.get("interval") or target.get("interval")
+    step = dashboard_json.grafana_interval(start, end, dashboard_json.panel_max_points(panel, screen_width),
+                                           dashboard_json.parse_duration(min_interval) if min_interval else 0)
+    instant = dashboard_json.is_instant(target)
+    expr = dashboard_json.interpolate(target["expr"], values, start, end, step, instant)
+    title, ref = panel.get("title", ""), target.get("refId", "A")
+    if ds_type == "loki":
+        if instant:
+            return Query(phase, title, ref, "loki", base + "/loki/api/v1/query", {"query": expr, "time": end})
+        params = {"query": expr, "start": start, "end": end, "step": f"{step / 1e9:g}s",
+                  "limit": target.get("maxLines", 1000), "direction": "backward"}
+        return Query(phase, title, ref, "loki", base + "/loki/api/v1/query_range", params)
+    if instant:
+        return Query(phase, title, ref, "prometheus", base + "/api/v1/query",
+                     {"query": expr, "time": f"{end / 1e9:.3f}", "stats": "all"})
+    s = step // 1_000_000_000 or 1
+    params = {"query": expr, "start": start // 1_000_000_000 // s * s, "end": end // 1_000_000_000 // s * s,
+              "step": s, "stats": "all"}
+    return Query(phase, title, ref, "prometheus", base + "/api/v1/query_range", params)
+
+_LABEL_VALUES = re.compile(r"label_values\(\s*(?:(.+?)\s*,\s*)?(\w+)\s*\)$")
+
+def _variable_query(var, urls, values, start, end):
+    """Prometheus label_values() variables become label values API calls."""
+    q = var.get("query")
+    q = q.get("query", "") if isinstance(q, dict) else q or ""
+    m = _LABEL_VALUES.match(q.strip())
+    ds_type = (var.get("datasource") or {}).get("type")
+    if not m or ds_type != "prometheus" or not urls.get(ds_type):
+        return None
+    params = {"start": start // 1_000_000_000, "end": end // 1_000_000_000}
+    if m.group(1):
+        params["match[]"] = dashboard_json.interpolate(m.group(1), values, start, end, 0)
+    return Query("open", f"${var['name']}", "var", ds_type, f"{urls[ds_type]}/api/v1/label/{m.group(2)}/values", params)
+
+def plan_queries(dashboard, urls, values, start, end, expand, screen_width):
+    """-> [(phase name, [Query, ...]), ...] in the order a user would trigger them."""
+    phases = {"open": []}
+    order = ["open"]
+    for var in dashboard.get("templating", {}).get("list", []):
+        if var.get("type") == "query" and var.get("refresh"):
+            q = _variable_query(var, urls, values, start, end)
+            if q is not None:
+                phases["open"].append(q)
+    skipped = set()
+    for row, panel, target in dashboard_json.iter_targets(dashboard):
+        phase = "open"
+        if row is not None and row.get("collapsed"):
+            phase = row.get("title", "")
+            if expand != ["all"] and phase not in expand:
+                continue
+        ds_type = (target.get("datasource") or panel.get("datasource") or {}).get("type")
+        if not urls.get(ds_type):
+            skipped.add(ds_type)
+            continue
+        if phase not in phases:
+            phases[phase] = []
+            order.append(phase)
+        phases[phase].append(_target_query(phase, panel, target, ds_type, urls[ds_type], values, start, end, screen_width))
+    for ds_type in sorted(skipped, key=str):
+        print(f"skipping {ds_type} targets: no --{ds_type} URL given", file=sys.stderr)
+    return [(name, phases[name]) for name in order if phases[name]]
+
+def replay(phases, concurrency, headers, repeat):
+    """Fire every phase in order, all of a phase's queries concurrently; -> {phase: [wall seconds per repeat]}."""
+    walls = {name: [] for name, _ in phases}
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(repeat):
+            for name, queries in phases:
+                t0 = time.perf_counter()
+                list(pool.map(lambda q: q.fire(headers), queries))
+                walls[name].append(time.perf_counter() - t0)
+    return walls
+
+# ---- Report -------------------------------------------------------------------
+
+def panel_rows(phases):
+    """Aggregate target runs per panel: median latency across repeats, totals per run."""
+    rows = {}
+    for name, queries in phases:
+        for q in queries:
+            rows.setdefault((name, q.panel), []).append(q)
+    out = []
+    for (phase, panel), queries in rows.items():
+        repeats = len(queries[0].runs)
+        # Targets of a panel are in flight together; the panel is done when the slowest one is
+        latency = statistics.median(max(q.runs[i]["latency"] for q in queries) for i in range(repeats))
+        last = [q.runs[-1] for q in queries]
+        out.append({
+            "phase": phase, "panel": panel, "targets": len(queries), "latency": latency,
+            "max_latency": max(r["latency"] for q in queries for r in q.runs),
+            "lines": sum(r["lines"] for r in last), "processed_bytes": sum(r["processed_bytes"] for r in last),
+            "samples": sum(r["samples"] for r in last), "series": sum(r["series"] for r in last),
+            "response_bytes": sum(r["bytes"] for r in last),
+            "errors": [f"{q.ref}: HTTP {r['status']} {r['error']}".strip() for q in queries for r in q.runs[-1:] if r["error"]],
+            "queries": [{"ref": q.ref, "url": q.url, "params": q.params, "runs": q.runs} for q in queries]})
+    out.sort(key=lambda r: -r["latency"])
+    return out
+
+def _human(n):
+    for unit in ("", "k", "M", "G", "T"):
+        if abs(n) < 1000:
+            return f"{n:.0f}{unit}" if unit == "" else f"{n:.1f}{unit}"
+        n /= 1000
+    return f"{n:.1f}P"
+
+def print_report(rows, walls, limit):
+    print(f"{'ms':>8} {'max ms':>8} {'lines':>8} {'bytes':>8} {'samples':>8} {'series':>7}  panel")
+    for r in rows[:limit] if limit else rows:
+        flag = "  !" if r["errors"] else ""
+        print(f"{r['latency'] * 1000:8.0f} {r['max_latency'] * 1000:8.0f} {_human(r['lines']):>8} "
+              f"{_human(r['processed_bytes']):>8} {_human(r['samples']):>8} {r['series']:7d}  "
+              f"{r['panel']} ({r['phase']}){flag}")
+    print()
+    for phase, times in walls.items():
+        n = sum(1 for r in rows if r["phase"] == phase)
+        print(f"{phase}: {n} panels, {statistics.median(times) * 1000:.0f} ms to load (median of {len(times)})")
+    errors = [(r["panel"], e) for r in rows for e in r["errors"]]
+    for panel, e in errors:
+        print(f"ERROR  {panel} {e}", file=sys.stderr)
+    return len(errors)
+
+# ---- CLI ----------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay a dashboard's queries against Loki/Prometheus and rank panels.")
+    ap.add_argument("dashboard", help="generated dashboard JSON")
+    ap.add_argument("--loki", metavar="URL", help="Loki base URL, e.g. http://localhost:3100")
+    ap.add_argument("--prometheus", metavar="URL", help="Prometheus base URL, e.g. http://localhost:9090")
+    ap.add_argument("--from", dest="start", help="range start: now-6h, RFC 3339 or unix seconds (default: dashboard time)")
+    ap.add_argument("--to", dest="end", help="range end (default: dashboard time)")
+    ap.add_argument("--var", action="append", default=[], metavar="NAME=VALUE", help="template variable value")
+    ap.add_argument("--expand", default="all", help="collapsed rows to expand after load: all, none or comma-separated titles")
+    ap.add_argument("--concurrency", type=int, default=6, help="requests in flight (default: 6, a browser's per-host limit)")
+    ap.add_argument("--repeat", type=int, default=1, help="replay the whole sequence N times (default: 1)")
+    ap.add_argument("--screen-width", type=int, default=1800, help="dashboard width in pixels, sets panel steps (default: 1800)")
+    ap.add_argument("--header", action="append", default=[], metavar="NAME:VALUE", help="extra request header (e.g. X-Scope-OrgID:tenant)")
+    ap.add_argument("--user", metavar="USER:PASSWORD", help="basic auth")
+    ap.add_argument("--top", type=int, default=0, help="show only the N slowest panels")
+    ap.add_argument("--json", action="store_true", help="print per-panel results with every request as JSON")
+    args = ap.parse_args()
+    if not args.loki and not args.prometheus:
+        ap.error("give --loki and/or --prometheus")
+
+    with open(args.dashboard) as f:
+        dashboard = json.load(f)
+    now = time.time_ns()
+    times = dashboard.get("time") or {}
+    start = parse_time(args.start or times.get("from", "now-6h"), now)
+    end = parse_time(args.end or times.get("to", "now"), now)
+    values = dashboard_json.variable_values(dashboard, dict(v.split("=", 1) for v in args.var))
+    urls = {"loki": (args.loki or "").rstrip("/"), "prometheus": (args.prometheus or "").rstrip("/")}
+    expand = ["all"] if args.expand == "all" else [] if args.expand == "none" else [t.strip() for t in args.expand.split(",")]
+    headers = {k.strip(): v.strip() for k, v in (h.split(":", 1) for h in args.header)}
+    if args.user:
+        headers["Authorization"] = "Basic " + base64.b64encode(args.user.encode()).decode()
+
+    phases = plan_queries(dashboard, urls, values, start, end, expand, args.screen_width)
+    walls = replay(phases, args.concurrency, headers, args.repeat)
+    rows = panel_rows(phases)
+    if args.json:
+        json.dump({"phases": {k: v for k, v in walls.items()}, "panels": rows}, sys.stdout, indent=2)
+        print()
+        failed = sum(1 for r in rows if r["errors"])
+    else:
+        failed = print_report(rows, walls, args.top)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
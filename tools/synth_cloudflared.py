@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""Generate synthetic cloudflared /metrics for a fleet of simulated replicas.
+
+Usage:
+  python3 synth_cloudflared.py --replicas 100 --out fleet/
+  python3 synth_cloudflared.py --replicas 10 --openmetrics fleet.om --start 2026-01-01T00:00:00Z --duration 24h
+  python3 synth_cloudflared.py --replicas 1000 --serve 0.0.0.0:9300 --sd-file targets.json --profile diurnal,burst,flap
+
+Every replica runs 4 HA connections and exposes every metric
+gen-cloudflared.py queries (cloudflared_tunnel_*, cloudflared_tcp/udp/icmp_*,
+quic_client_* per conn_index, proxy connect and RPC latency histograms, Go and
+process metrics) with the label sets cloudflared uses.
+
+Outputs:
+  --out DIR          one exposition file per replica at --at (default: now), for
+                     prom_cardinality.py or a file-based exporter
+  --openmetrics F    samples every --interval from --start for --duration, with
+                     job/instance/pod labels, for
+                     `promtool tsdb create-blocks-from openmetrics F data/`
+  --serve HOST:PORT  live /metrics?replica=N endpoints advancing with the wall
+                     clock; --sd-file writes a Prometheus file_sd target list
+
+Load is --rps requests/sec for the whole fleet at peak, split unevenly across
+replicas. --profile shapes it over time: diurnal (daily sine, trough at
+--trough of peak), burst (a few minutes at 3-8x, about --bursts per day) and
+flap (connections drop and re-register, about --flaps per replica per day).
+The same --seed always produces the same fleet and the same history.
+"""
+import argparse, calendar, json, math, os, random, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CONNECTIONS = 4
+COLOS = ["ams", "fra", "lhr", "cdg", "iad", "sjc", "dfw", "ord", "sin", "nrt", "syd", "gru"]
+STATUS_CODES = [("200", 0.86), ("304", 0.05), ("301", 0.02), ("404", 0.04), ("403", 0.01), ("500", 0.006),
+                ("502", 0.012), ("503", 0.002)]
+FRAME_TYPES = [("Stream", 0.7), ("Ack", 0.2), ("Ping", 0.04), ("MaxStreamData", 0.03), ("MaxData", 0.02),
+               ("ResetStream", 0.01)]
+LOSS_REASONS = [("reordering", 0.6), ("timeout", 0.4)]
+CONNECT_BUCKETS_MS = [1, 10, 50, 100, 250, 500, 1000, 5000]
+RPC_BUCKETS_S = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+GC_QUANTILES = ["0", "0.25", "0.5", "0.75", "1"]
+VERSION = "2024.8.2"
+
+# ---- Load profiles --------------------------------------------------------------
+
+def _lognormal_cdf(x, median, sigma):
+    return 0.5 * (1 + math.erf(math.log(x / median) / (sigma * math.sqrt(2)))) if x > 0 else 0.0
+
+def _bucket_shares(bounds, median, sigma):
+    """Cumulative share of observations <= each bound (+Inf last)."""
+    return [_lognormal_cdf(b, median, sigma) for b in bounds] + [1.0]
+
+class Profile:
+    """Fleet-wide load multiplier over time (1.0 = --rps at peak)."""
+
+    def __init__(self, kinds, seed, trough, bursts):
+        self.kinds, self.seed, self.trough, self.bursts = kinds, seed, trough, bursts
+        self._burst_days = {}
+
+    def _burst_windows(self, day):
+        w = self._burst_days.get(day)
+        if w is None:
+            r = random.Random(f"{self.seed}:burst:{day}")
+            n = sum(1 for _ in range(int(self.bursts * 4)) if r.random() < 0.25)
+            w = self._burst_days[day] = [(day * 86400 + r.uniform(0, 86400), r.uniform(60, 600), r.uniform(3, 8))
+                                         for _ in range(n)]
+        return w
+
+    def load(self, t):
+        m = 1.0
+        if "diurnal" in self.kinds:
+            # Peak at 15:00 UTC, trough 12h later
+            phase = math.cos(2 * math.pi * ((t % 86400) / 86400 - 15 / 24))
+            m *= self.trough + (1 - self.trough) * (1 + phase) / 2
+        if "burst" in self.kinds:
+            for start, length, mult in self._burst_windows(int(t // 86400)):
+                if start <= t < start + length:
+                    m *= mult
+        return m
+
+# ---- Replica state ----------------------------------------------------------------
+
+class Replica:
+    """Counters and gauges of one cloudflared process, advanced in small time steps."""
+
+    def __init__(self, index, share, args, profile, born):
+        self.index, self.share, self.args, self.profile = index, share, args, profile
+        self.r = random.Random(f"{args.seed}:replica:{index}")
+        r = self.r
+        self.name = f"replica-{index:04d}"
+        self.born = self.t = born
+        self.colos = [f"{r.choice(COLOS)}{r.randrange(1, 20):02d}" for _ in range(CONNECTIONS)]
+        self.base_rtt = [max(2.0, r.lognormvariate(math.log(18), 0.5)) for _ in range(CONNECTIONS)]
+        self.down_until = [0.0] * CONNECTIONS
+        self.c = {}  # (metric, label tuple) -> counter value
+        self.g = {}  # (metric, label tuple) -> gauge value
+        self.config_version = r.randrange(5, 60)
+        self.rss = r.uniform(40e6, 70e6)
+        self.connect_shares = _bucket_shares(CONNECT_BUCKETS_MS, r.uniform(8, 30), 1.1)
+        self.rpc_shares = _bucket_shares(RPC_BUCKETS_S, r.uniform(0.02, 0.06), 0.8)
+        for conn in range(CONNECTIONS):
+            self._connect(conn)
+
+    def _add(self, metric, labels, v):
+        key = (metric, labels)
+        self.c[key] = self.c.get(key, 0.0) + v
+
+    def _connect(self, conn):
+        self._add("cloudflared_tunnel_tunnel_register_success", (("rpcName", "register_connection"),), 1)
+        self._add("quic_client_total_connections", (("conn_index", str(conn)),), 1)
+        self._rpc("client", "registration", "RegisterConnection", 1)
+
+    def _rpc(self, side, handler, method, n):
+        """cloudflared calls the edge (client) to register; the edge calls it (server) for sessions and config."""
+        labels = (("handler", handler), ("method", method))
+        prefix = f"cloudflared_rpc_{side}_"
+        self._add(prefix + "operations", labels, n)
+        self._add(prefix + "latency_secs_count", labels, n)
+        self._add(prefix + "latency_secs_sum", labels, n * 0.05)
+        for bound, share in zip(RPC_BUCKETS_S + ["+Inf"], self.rpc_shares):
+            self._add(prefix + "latency_secs_bucket", labels + (("le", str(bound)),), n * share)
+
+    def up(self, t):
+        return [t >= d for d in self.down_until]
+
+    def advance(self, t, step=15.0):
+        """Integrate counters from self.t to t in steps of at most `step` seconds."""
+        a, r = self.args, self.r
+        while self.t < t:
+            dt = min(step, t - self.t)
+            now = self.t + dt / 2
+            load = self.profile.load(now)
+            up = self.up(now)
+            n_up = sum(up) or 1
+            rps = a.rps * self.share * load * (sum(up) > 0)
+            reqs = rps * dt
+            self._add("cloudflared_tunnel_total_requests", (), reqs)
+            errors = reqs * a.error_rate * (3 if load > 1.5 else 1)
+            self._add("cloudflared_tunnel_request_errors", (), errors)
+            self._add("cloudflared_proxy_connect_streams_errors", (), errors * 0.1)
+            for code, share in STATUS_CODES:
+                self._add("cloudflared_tunnel_response_by_code", (("status_code", code),), (reqs - errors) * share)
+            connects = reqs * 0.3
+            self._add("cloudflared_proxy_connect_latency_count", (), connects)
+            self._add("cloudflared_proxy_connect_latency_sum", (), connects * 20)
+            for bound, share in zip(CONNECT_BUCKETS_MS + ["+Inf"], self.connect_shares):
+                self._add("cloudflared_proxy_connect_latency_bucket", (("le", str(bound)),), connects * share)
+            tcp, udp = reqs * a.tcp_share, reqs * a.udp_share
+            self._add("cloudflared_tcp_total_sessions", (), tcp)
+            self._add("cloudflared_udp_total_sessions", (), udp)
+            self._add("cloudflared_icmp_total_requests", (), reqs * 0.001)
+            self._add("cloudflared_icmp_total_replies", (), reqs * 0.00098)
+            self._rpc("server", "session", "RegisterUdpSession", udp)
+            self._rpc("server", "session", "UnregisterUdpSession", udp * 0.98)
+            for conn in range(CONNECTIONS):
+                idx = (("conn_index", str(conn)),)
+                if not up[conn]:
+                    continue
+                per = reqs / n_up
+                self._add("quic_client_sent_bytes", idx, per * 900)
+                self._add("quic_client_receive_bytes", idx, per * 14000 + dt * 60)
+                lost = per * 12 * 0.002 * load
+                for reason, share in LOSS_REASONS:
+                    self._add("quic_client_lost_packets", idx + (("reason", reason),), lost * share)
+                frames = per * 14 + dt / 5
+                for ft, share in FRAME_TYPES:
+                    self._add("quic_client_sent_frames", idx + (("frame_type", ft),), frames * share * 0.4)
+                    self._add("quic_client_received_frames", idx + (("frame_type", ft),), frames * share)
+                self._add("quic_client_packet_too_big_dropped", idx, per * 0.0001)
+            if "flap" in self.profile.kinds:
+                for conn in range(CONNECTIONS):
+                    if up[conn] and r.random() < a.flaps / CONNECTIONS * dt / 86400:
+                        self.down_until[conn] = self.t + r.uniform(5, 240)
+                        self._add("quic_client_closed_connections", (("conn_index", str(conn)),), 1)
+                    elif not up[conn] and self.t + dt >= self.down_until[conn]:
+                        self.colos[conn] = f"{r.choice(COLOS)}{r.randrange(1, 20):02d}"
+                        self._connect(conn)
+            if r.random() < dt / 86400 * 2:
+                self.config_version += 1
+                self._rpc("server", "config", "UpdateConfiguration", 1)
+            cpu = dt * (0.02 + rps * 0.00015)
+            self._add("process_cpu_seconds_total", (), cpu)
+            self._add("process_network_receive_bytes_total", (), reqs * 15000 + dt * 200)
+            self._add("process_network_transmit_bytes_total", (), reqs * 16000 + dt * 200)
+            self._add("go_memstats_alloc_bytes_total", (), reqs * 40000 + dt * 50000)
+            self._add("go_gc_duration_seconds_count", (), max(dt / 120, reqs * 40000 / 8e6))
+            self._add("go_gc_duration_seconds_sum", (), max(dt / 120, reqs * 40000 / 8e6) * 0.0004)
+            self.t += dt
+        self._gauges(t, a.rps * self.share * self.profile.load(t) * any(self.up(t)))
+
+    def _gauges(self, t, rps):
+        r, g = self.r, self.g
+        up = self.up(t)
+        g.clear()
+        g[("build_info", (("goversion", "go1.22.5"), ("revision", VERSION), ("type", ""), ("version", VERSION)))] = 1
+        g[("cloudflared_tunnel_ha_connections", ())] = sum(up)
+        concurrent = max(0, r.gauss(rps * 0.08, math.sqrt(rps * 0.08 + 1)))
+        g[("cloudflared_tunnel_concurrent_requests_per_tunnel", ())] = round(concurrent)
+        g[("cloudflared_tunnel_timer_retries", ())] = sum(1 for u in up if not u)
+        g[("cloudflared_orchestration_config_version", ())] = self.config_version
+        g[("cloudflared_tcp_active_sessions", ())] = round(rps * self.args.tcp_share * 30)
+        g[("cloudflared_udp_active_sessions", ())] = round(rps * self.args.udp_share * self.args.dns_timeout)
+        for conn in range(CONNECTIONS):
+            if not up[conn]:
+                continue
+            idx = (("conn_index", str(conn)),)
+            g[("cloudflared_tunnel_server_locations", (("connection_id", str(conn)), ("edge_location", self.colos[conn])))] = 1
+            base = self.base_rtt[conn]
+            latest = base * r.lognormvariate(0.1, 0.3)
+            g[("quic_client_smoothed_rtt", idx)] = round(base * 1.1, 3)
+            g[("quic_client_min_rtt", idx)] = round(base, 3)
+            g[("quic_client_latest_rtt", idx)] = round(latest, 3)
+            g[("quic_client_congestion_window", idx)] = round(min(2e6, 32000 + rps / CONNECTIONS * 1500 * r.uniform(0.5, 2)))
+            g[("quic_client_congestion_state", idx)] = r.choices([1, 2, 3], [0.9, 0.08, 0.02])[0]
+            g[("quic_client_mtu", idx)] = 1252
+            g[("quic_client_max_udp_payload", idx)] = 1452
+        self.rss += (r.random() - 0.5) * 1e6
+        g[("process_resident_memory_bytes", ())] = round(self.rss + concurrent * 40000)
+        g[("process_open_fds", ())] = 20 + round(concurrent) + g[("cloudflared_tcp_active_sessions", ())]
+        g[("process_max_fds", ())] = 1048576
+        g[("process_start_time_seconds", ())] = round(self.born, 2)
+        g[("go_goroutines", ())] = 60 + round(concurrent * 2) + 12 * sum(up)
+        heap = self.rss * 0.45
+        g[("go_memstats_alloc_bytes", ())] = round(heap * r.uniform(0.7, 1.0))
+        g[("go_memstats_heap_idle_bytes", ())] = round(self.rss * 0.35)
+        g[("go_memstats_heap_objects", ())] = round(heap / 180)
+        for q in GC_QUANTILES:
+            g[("go_gc_duration_seconds", (("quantile", q),))] = round(0.00005 * (1 + 8 * float(q) ** 3), 6)
+
+    def samples(self):
+        """-> {family: [(metric name, label tuple, value)]}; values rounded as cloudflared prints them."""
+        out = {}
+        for (metric, labels), v in self.c.items():
+            value = v if metric.endswith("_sum") or metric in FLOAT_COUNTERS else round(v)
+            out.setdefault(FAMILY_OF.get(metric, metric), []).append((metric, labels, value))
+        for (metric, labels), v in self.g.items():
+            out.setdefault(FAMILY_OF.get(metric, metric), []).append((metric, labels, v))
+        return out
+
+FLOAT_COUNTERS = {"process_cpu_seconds_total"}
+
+# Metric families: (type, help); histogram/summary series map to their family name
+FAMILIES = {
+    "build_info": ("gauge", "Build and version information"),
+    "cloudflared_tunnel_total_requests": ("counter", "Amount of requests proxied through all the tunnels"),
+    "cloudflared_tunnel_request_errors": ("counter", "Amount of errors due to proxying request"),
+    "cloudflared_tunnel_concurrent_requests_per_tunnel": ("gauge", "Concurrent requests proxied through each tunnel"),
+    "cloudflared_tunnel_ha_connections": ("gauge", "Number of active ha connections"),
+    "cloudflared_tunnel_response_by_code": ("counter", "Count of responses by HTTP status code"),
+    "cloudflared_tunnel_server_locations": ("gauge", "Where each tunnel is connected to. 1 means current location, 0 means previous locations."),
+    "cloudflared_tunnel_timer_retries": ("gauge", "Unacknowledged heart beats count"),
+    "cloudflared_tunnel_tunnel_register_success": ("counter", "Count of successful tunnel registrations"),
+    "cloudflared_orchestration_config_version": ("gauge", "Configuration Version"),
+    "cloudflared_proxy_connect_latency": ("histogram", "Time it takes to establish and acknowledge connections in milliseconds"),
+    "cloudflared_proxy_connect_streams_errors": ("counter", "Total count of failure to establish and acknowledge connections"),
+    "cloudflared_rpc_client_operations": ("counter", "Number of rpc methods by handler"),
+    "cloudflared_rpc_client_latency_secs": ("histogram", "Latency of rpc methods by handler"),
+    "cloudflared_rpc_server_operations": ("counter", "Number of rpc methods by handler"),
+    "cloudflared_rpc_server_latency_secs": ("histogram", "Latency of rpc methods by handler"),
+    "cloudflared_tcp_active_sessions": ("gauge", "Concurrent count of TCP sessions that are being proxied to any origin"),
+    "cloudflared_tcp_total_sessions": ("counter", "Total count of TCP sessions that have been proxied to any origin"),
+    "cloudflared_udp_active_sessions": ("gauge", "Concurrent count of UDP sessions that are being proxied to any origin"),
+    "cloudflared_udp_total_sessions": ("counter", "Total count of UDP sessions that have been proxied to any origin"),
+    "cloudflared_icmp_total_requests": ("counter", "Total count of ICMP requests that have been proxied to any origin"),
+    "cloudflared_icmp_total_replies": ("counter", "Total count of ICMP replies that have been proxied from any origin"),
+    "quic_client_total_connections": ("counter", "Number of connections initiated"),
+    "quic_client_closed_connections": ("counter", "Number of connections that has been closed"),
+    "quic_client_sent_bytes": ("counter", "Number of bytes that have been sent through a connection"),
+    "quic_client_receive_bytes": ("counter", "Number of bytes that have been received through a connection"),
+    "quic_client_lost_packets": ("counter", "Number of packets that have been lost from a connection"),
+    "quic_client_sent_frames": ("counter", "Number of frames that have been sent through a connection"),
+    "quic_client_received_frames": ("counter", "Number of frames that have been received through a connection"),
+    "quic_client_packet_too_big_dropped": ("counter", "Count of packets received from origin that are too big to send to the edge"),
+    "quic_client_smoothed_rtt": ("gauge", "Calculated smoothed RTT measured on a connection in millisec"),
+    "quic_client_min_rtt": ("gauge", "Lowest RTT measured on a connection in millisec"),
+    "quic_client_latest_rtt": ("gauge", "Latest RTT measured on a connection"),
+    "quic_client_congestion_window": ("gauge", "Current congestion window size"),
+    "quic_client_congestion_state": ("gauge", "Current congestion control state. See https://pkg.go.dev/github.com/quic-go/quic-go@v0.45.0/logging#CongestionState for what each value maps to"),
+    "quic_client_mtu": ("gauge", "Current maximum transmission unit (MTU) of a connection"),
+    "quic_client_max_udp_payload": ("gauge", "Maximum UDP payload size in bytes for a QUIC packet"),
+    "process_cpu_seconds_total": ("counter", "Total user and system CPU time spent in seconds."),
+    "process_resident_memory_bytes": ("gauge", "Resident memory size in bytes."),
+    "process_open_fds": ("gauge", "Number of open file descriptors."),
+    "process_max_fds": ("gauge", "Maximum number of open file descriptors."),
+    "process_start_time_seconds": ("gauge", "Start time of the process since unix epoch in seconds."),
+    "process_network_receive_bytes_total": ("counter", "Number of bytes received by the process over the network."),
+    "process_network_transmit_bytes_total": ("counter", "Number of bytes sent by the process over the network."),
+    "go_goroutines": ("gauge", "Number of goroutines that currently exist."),
+    "go_gc_duration_seconds": ("summary", "A summary of the pause duration of garbage collection cycles."),
+    "go_memstats_alloc_bytes": ("gauge", "Number of bytes allocated and still in use."),
+    "go_memstats_alloc_bytes_total": ("counter", "Total number of bytes allocated, even if freed."),
+    "go_memstats_heap_idle_bytes": ("gauge", "Number of heap bytes waiting to be used."),
+    "go_memstats_heap_objects": ("gauge", "Number of allocated objects."),
+}
+FAMILY_OF = {f"{name}{suffix}": name for name, (kind, _) in FAMILIES.items() if kind in ("histogram", "summary")
+             for suffix in ("_bucket", "_sum", "_count")}
+
+# ---- Output -------------------------------------------------------------------------
+
+def _fmt(v):
+    if isinstance(v, float):
+        if v == int(v) and abs(v) < 1e15:
+            return str(int(v))
+        return repr(v)
+    return str(v)
+
+def _labels(labels, extra=()):
+    items = tuple(extra) + labels
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def exposition(replica):
+    """Prometheus text format, as cloudflared serves it."""
+    out = []
+    samples = replica.samples()
+    for family in sorted(samples):
+        kind, help_ = FAMILIES[family]
+        out.append(f"# HELP {family} {help_}\n# TYPE {family} {kind}\n")
+        for metric, labels, value in sorted(samples[family], key=lambda s: (s[0], s[1])):
+            out.append(f"{metric}{_labels(labels)} {_fmt(value)}\n")
+    return "".join(out)
+
+def build_fleet(args, born):
+    r = random.Random(f"{args.seed}:fleet")
+    weights = [r.lognormvariate(0, args.skew) for _ in range(args.replicas)]
+    total = sum(weights)
+    profile = Profile(set(p for p in args.profile.split(",") if p), args.seed, args.trough, args.bursts)
+    return [Replica(i, w / total, args, profile, born - r.uniform(0, args.uptime)) for i, w in enumerate(weights)]
+
+HISTORY_STEP = 600.0  # integration step for time before the window being output
+
+def write_snapshots(args, fleet, at):
+    os.makedirs(args.out, exist_ok=True)
+    for rep in fleet:
+        rep.advance(at, step=max(HISTORY_STEP, args.interval))
+        with open(os.path.join(args.out, f"{rep.name}.prom"), "w") as f:
+            f.write(exposition(rep))
+
+def write_openmetrics(args, fleet, start, duration):
+    """Families must be contiguous in OpenMetrics, so each one is spooled to its own temp file."""
+    spool = tempfile.TemporaryDirectory()
+    files = {}
+    steps = int(duration // args.interval) + 1
+    for rep in fleet:
+        rep.advance(start, step=HISTORY_STEP)
+        series = {}
+        for i in range(steps):
+            t = start + i * args.interval
+            rep.advance(t, step=args.interval)
+            for family, samples in rep.samples().items():
+                for metric, labels, value in samples:
+                    series.setdefault((family, metric, labels), []).append(f"{_fmt(value)} {t:.3f}")
+        extra = (("instance", rep.name), ("job", args.job), ("pod", rep.name))
+        for (family, metric, labels), points in series.items():
+            f = files.get(family)
+            if f is None:
+                f = files[family] = open(os.path.join(spool.name, family), "w")
+            prefix = f"{metric}{_labels(labels, extra)} "
+            f.write("".join(prefix + p + "\n" for p in points))
+    with open(args.openmetrics, "w") as out:
+        for family in sorted(files):
+            files[family].close()
+            kind, help_ = FAMILIES[family]
+            name = family
+            if kind == "counter":
+                # OpenMetrics counter samples must end in _total; cloudflared's own counters do not
+                if family.endswith("_total"):
+                    name = family[:-len("_total")]
+                else:
+                    kind = "unknown"
+            out.write(f"# HELP {name} {help_}\n# TYPE {name} {kind}\n")
+            with open(os.path.join(spool.name, family)) as f:
+                for chunk in iter(lambda: f.read(1 << 20), ""):
+                    out.write(chunk)
+        out.write("# EOF\n")
+    spool.cleanup()
+
+def serve(args, fleet):
+    lock = threading.Lock()
+    now = time.time()
+    for rep in fleet:
+        rep.advance(now, step=HISTORY_STEP)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *a):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path != "/metrics":
+                self.send_error(404)
+                return
+            try:
+                rep = fleet[int(parse_qs(url.query).get("replica", ["0"])[0])]
+            except (ValueError, IndexError):
+                self.send_error(404, "no such replica")
+                return
+            with lock:
+                rep.advance(time.time())
+                body = exposition(rep).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    host, _, port = args.serve.rpartition(":")
+    if args.sd_file:
+        target = f"{host if host not in ('', '0.0.0.0') else 'localhost'}:{port}"
+        with open(args.sd_file, "w") as f:
+            json.dump([{"targets": [target], "labels": {"__param_replica": str(r.index), "instance": r.name, "pod": r.name}}
+                       for r in fleet], f, indent=1)
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), Handler)
+    print(f"serving {len(fleet)} replicas on http://{args.serve}/metrics?replica=N", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+# ---- CLI ------------------------------------------------------------------------------
+
+def _parse_time(text):
+    if text is None:
+        return time.time()
+    try:
+        return float(text)
+    except ValueError:
+        return float(calendar.timegm(time.strptime(text.replace("Z", ""), "%Y-%m-%dT%H:%M:%S")))
+
+def _parse_duration(text):
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return float(text[:-1]) * units[text[-1]] if text[-1] in units else float(text)
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic cloudflared metrics for a fleet of replicas.")
+    mode = ap.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--out", metavar="DIR", help="write one exposition file per replica")
+    mode.add_argument("--openmetrics", metavar="FILE", help="write a timestamped OpenMetrics history for promtool")
+    mode.add_argument("--serve", metavar="HOST:PORT", help="serve live /metrics?replica=N")
+    ap.add_argument("--replicas", type=int, default=10, help="number of cloudflared replicas (default: 10)")
+    ap.add_argument("--rps", type=float, default=2000, help="fleet-wide requests/sec at peak (default: 2000)")
+    ap.add_argument("--profile", default="diurnal", help="comma-separated: diurnal, burst, flap (default: diurnal)")
+    ap.add_argument("--trough", type=float, default=0.25, help="diurnal trough as a share of peak (default: 0.25)")
+    ap.add_argument("--bursts", type=float, default=2, help="expected bursts per day (default: 2)")
+    ap.add_argument("--flaps", type=float, default=4, help="expected connection drops per replica per day (default: 4)")
+    ap.add_argument("--skew", type=float, default=0.5, help="log-normal sigma of per-replica load share (default: 0.5)")
+    ap.add_argument("--error-rate", type=float, default=0.002, help="share of requests that error (default: 0.002)")
+    ap.add_argument("--tcp-share", type=float, default=0.02, help="requests that open a TCP session (default: 0.02)")
+    ap.add_argument("--udp-share", type=float, default=0.05, help="requests that open a UDP session (default: 0.05)")
+    ap.add_argument("--dns-timeout", type=float, default=5, help="UDP session lifetime in seconds (default: 5)")
+    ap.add_argument("--uptime", type=float, default=86400 * 3, help="max seconds replicas have been running (default: 3 days)")
+    ap.add_argument("--at", help="--out: snapshot time, RFC 3339 or unix seconds (default: now)")
+    ap.add_argument("--start", help="--openmetrics: first sample time (default: now - duration)")
+    ap.add_argument("--duration", default="1h", help="--openmetrics: history length, e.g. 6h, 2d (default: 1h)")
+    ap.add_argument("--interval", type=float, default=15, help="scrape interval in seconds (default: 15)")
+    ap.add_argument("--job", default="cloudflared-metrics", help="--openmetrics job label (default: cloudflared-metrics)")
+    ap.add_argument("--sd-file", help="--serve: write a Prometheus file_sd target list here")
+    ap.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    args = ap.parse_args()
+    unknown = set(p for p in args.profile.split(",") if p) - {"diurnal", "burst", "flap"}
+    if unknown:
+        ap.error(f"unknown profile {', '.join(sorted(unknown))}")
+
+    t0 = time.monotonic()
+    if args.out:
+        at = _parse_time(args.at)
+        fleet = build_fleet(args, at)
+        write_snapshots(args, fleet, at)
+        print(f"wrote {len(fleet)} snapshots to {args.out} in {time.monotonic() - t0:.1f}s", file=sys.stderr)
+    elif args.openmetrics:
+        duration = _parse_duration(args.duration)
+        start = _parse_time(args.start) if args.start else time.time() - duration
+        fleet = build_fleet(args, start)
+        write_openmetrics(args, fleet, start, duration)
+        print(f"wrote {len(fleet)} replicas x {int(duration // args.interval) + 1} scrapes to {args.openmetrics} "
+              f"in {time.monotonic() - t0:.1f}s", file=sys.stderr)
+    else:
+        serve(args, build_fleet(args, time.time()))
+
+if __name__ == "__main__":
+    main()
